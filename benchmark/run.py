@@ -6,28 +6,32 @@ import json
 import time
 import cProfile
 import gc
-import coverage
 
 from collections import OrderedDict
 
 from elasticmagic import (
-    Document, Field,
     SearchQuery,
     MatchAll,
     )
 from elasticmagic.result import SearchResult
-from elasticmagic.types import (
-    Boolean, Integer, Float, String, Date,
-    List,
-    )
 from elasticmagic.agg import Terms
 
+import suite
+from suite import (
+    SimpleDocument,
+    gen_simple_document,
+    gen_terms_buckets,
+    )
+
 
 def setup():
     ap = argparse.ArgumentParser()
     sub = ap.add_subparsers(help='Valid commands')
     for command, setup, handler in [('sample', sample_setup, gen_sample),
-                                    ('run', run_setup, run)]:
+                                    ('run', run_setup, run),
+                                    ('bench', bench_setup, bench),
+                                    ('compare', compare_setup, compare),
+                                    ('memory', memory_setup, memory)]:
         sub_ap = sub.add_parser(command, help=handler.__doc__)
         sub_ap.set_defaults(action=handler)
         setup(sub_ap)
@@ -61,6 +65,63 @@ def run_setup(ap):
                     action='store_true', default=False)
 
 
+def bench_setup(ap):
+    ap.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                    help="Benchmark or group names to run, "
+                    "one of: {}".format(', '.join(
+                        sorted(set(
+                            [b.name for b in suite.BENCHMARKS.values()] +
+                            [b.group for b in suite.BENCHMARKS.values()]
+                        ))
+                    )))
+    ap.add_argument('-s', '--size', dest='size',
+                    type=lambda x: 10**int(x),
+                    default=None,
+                    help="Population size, power of 10, "
+                    "default depends on benchmark")
+    ap.add_argument('-n', '--number', dest='number',
+                    type=int, default=1,
+                    help="Number of calls per timing, default: 1")
+    ap.add_argument('-r', '--repeat', dest='repeat',
+                    type=int, default=5,
+                    help="Number of timings, default: 5")
+    ap.add_argument('-w', '--warmup', dest='warmup',
+                    type=int, default=1,
+                    help="Number of warmup calls, default: 1")
+    ap.add_argument('-o', '--output', dest='output',
+                    type=argparse.FileType('w'), default=sys.stdout,
+                    help="Output file")
+
+
+def compare_setup(ap):
+    bench_setup(ap)
+    ap.set_defaults(repeat=10, output=None)
+    ap.add_argument('-b', '--baseline', dest='baseline', required=True,
+                    type=argparse.FileType('r'),
+                    help="Baseline JSON produced by bench command")
+    ap.add_argument('-t', '--threshold', dest='threshold',
+                    type=float, default=0.1,
+                    help="Allowed slowdown of median, default: 0.1 (10%%)")
+    ap.add_argument('--hot', dest='hot_groups', action='append',
+                    default=None,
+                    help="Groups which fail comparison when regressed, "
+                    "default: {}".format(', '.join(suite.HOT_GROUPS)))
+
+
+def memory_setup(ap):
+    ap.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                    help="Memory benchmarks to run, "
+                    "one of: {}".format(', '.join(suite.MEMORY_BENCHMARKS)))
+    ap.add_argument('-s', '--size', dest='size',
+                    type=lambda x: 10**int(x),
+                    default=None,
+                    help="Population size, power of 10, "
+                    "default depends on benchmark")
+    ap.add_argument('-o', '--output', dest='output',
+                    type=argparse.FileType('w'), default=sys.stdout,
+                    help="Output file")
+
+
 def main():
     ap = setup()
     options = ap.parse_args()
@@ -125,7 +186,9 @@ def gen_sample(options):
 def run(options):
     """Run benchmark."""
     prof = cProfile.Profile()
-    cov = coverage.Coverage()
+    if options.profile:
+        import coverage
+        cov = coverage.Coverage()
 
     times = OrderedDict.fromkeys(['data_load', 'json_loads', 'searchResult'])
     start = time.monotonic() * 1000
@@ -149,7 +212,7 @@ def run(options):
     SearchResult(
         raw_results,
         query._aggregations,
-        doc_cls=query._get_doc_cls(),
+        doc_cls_map={SimpleDocument.__doc_type__: SimpleDocument},
         instance_mapper=query._instance_mapper)
     times['searchResult'] = time.monotonic() * 1000 - start
     if options.profile:
@@ -166,91 +229,66 @@ def run(options):
         cov.html_report()
 
 
-class SimpleDocument(Document):
-    __doc_type__ = 'simple'
-
-    boolean_0 = Field(Boolean)
-    integer_0 = Field(Integer)
-    float_0 = Field(Float)
-    string_0 = Field(String)
-    date_0 = Field(Date)
-
-    boolean_1 = Field(Boolean)
-    integer_1 = Field(Integer)
-    float_1 = Field(Float)
-    string_1 = Field(String)
-    date_1 = Field(Date)
-
-
-class ListsDocument(Document):
-    __doc_type__ = 'lists'
-
-    boolean_0 = Field(List(Boolean))
-    integer_0 = Field(List(Integer))
-    float_0 = Field(List(Float))
-    string_0 = Field(List(String))
-    date_0 = Field(List(Date))
-
-    boolean_1 = Field(List(Boolean))
-    integer_1 = Field(List(Integer))
-    float_1 = Field(List(Float))
-    string_1 = Field(List(String))
-    date_1 = Field(List(Date))
-
-
-_INDEX = 'test'
-
-
-def gen_simple_document(N):
-    for i in range(N):
-        yield {
-            '_index': _INDEX,
-            '_type': 'simple',
-            '_id': i,
-            '_source': {
-                'boolean_0': bool(i % 2),
-                'integer_0': i,
-                'float_0': i / (10 ** len(str(i))),
-                'string_0': str(i),
-                'date_0': None,
-                'boolean_1': bool(1 + i % 2),
-                'integer_1': -i,
-                'float_1': i / (10 ** len(str(i))),
-                'string_1': str(i),
-                'date_1': None,
-                }
-            }
-
-
-def gen_terms_buckets(N):
-    for i in range(N):
-        yield {
-            "key": i,
-            "doc_count": i,
-            }
-
+def bench(options):
+    """Run benchmark suite and output results as JSON."""
+    benchmarks = suite.select_benchmarks(options.benchmarks)
+    if not benchmarks:
+        print("No benchmarks found: {}".format(', '.join(options.benchmarks)),
+              file=sys.stderr)
+        return 1
+    results = suite.run_suite(
+        options.benchmarks,
+        size=options.size,
+        number=options.number,
+        repeat=options.repeat,
+        warmup=options.warmup,
+    )
+    suite.dump(results, options.output)
+
+
+def compare(options):
+    """Run benchmark suite and compare results with a baseline."""
+    baseline = json.load(options.baseline)
+    results = suite.run_suite(
+        options.benchmarks,
+        size=options.size,
+        number=options.number,
+        repeat=options.repeat,
+        warmup=options.warmup,
+    )
+    if options.output:
+        suite.dump(results, options.output)
 
-def gen_lists_document(N):
-    K = len(N * .1)
-    for i in range(N):
-        yield {
-            '_index': _INDEX,
-            '_type': 'lists',
-            '_id': i,
-            '_source': {
-                'boolean_0': [bool(i*a % 2) for a in range(K)],
-                'integer_0': [i] * K,
-                'float_0': [(i / (10 ** len(str(i))))] * K,
-                'string_0': [str(i)] * K,
-                'date_0': None,
-                'boolean_1': [bool(1 + i % 2)] * K,
-                'integer_1': [-i] * K,
-                'float_1': [(i / (10 ** len(str(i))))] * K,
-                'string_1': [str(i)] * K,
-                'date_1': None,
-                }
-            }
+    comparisons = suite.compare(
+        baseline, results,
+        threshold=options.threshold,
+        hot_groups=options.hot_groups or suite.HOT_GROUPS,
+    )
+    if not comparisons:
+        print("Nothing to compare with baseline", file=sys.stderr)
+        return 1
+    print(suite.format_comparisons(comparisons))
+
+    failures = [c for c in comparisons if c.is_failure]
+    if failures:
+        print("Regressions found: {}".format(
+            ', '.join(c.name for c in failures)
+        ), file=sys.stderr)
+        return 1
+
+
+def memory(options):
+    """Measure memory usage of result objects with tracemalloc."""
+    benchmarks = suite.select_benchmarks(
+        options.benchmarks, registry=suite.MEMORY_BENCHMARKS
+    )
+    if not benchmarks:
+        print("No benchmarks found: {}".format(', '.join(options.benchmarks)),
+              file=sys.stderr)
+        return 1
+    results = suite.run_memory_suite(options.benchmarks, size=options.size)
+    suite.dump(results, options.output)
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,1045 @@
+# Benchmark suite for the hot paths of the library.
+#
+# Every benchmark is a setup function that prepares data for the given
+# population size and returns a callable which is timed.
+import datetime
+import gc
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from collections import OrderedDict
+
+from elasticsearch import Connection, Elasticsearch
+
+from elasticmagic import (
+    actions, agg,
+    Cluster, Document, Field, Index, MultiMatch,
+    __version__,
+    )
+from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.ext.queryfilter import (
+    FacetFilter, FacetQueryFilter, FacetQueryValue,
+    OrderingFilter, OrderingValue, PageFilter,
+    QueryFilter, RangeFilter,
+    )
+from elasticmagic.ext.queryfilter.codec import SimpleCodec
+from elasticmagic.function import FieldValueFactor, Gauss, Weight
+from elasticmagic.result import SearchResult
+from elasticmagic.types import (
+    Boolean, Date, Float, Integer, List, Nested, Object, String,
+    )
+
+
+BENCHMARKS = OrderedDict()
+MEMORY_BENCHMARKS = OrderedDict()
+
+# Groups that are checked for regressions by default
+HOT_GROUPS = ('compile', 'hydration', 'aggregations')
+
+_INDEX = 'test'
+
+
+class Benchmark(object):
+    def __init__(self, name, group, setup, default_size):
+        self.name = name
+        self.group = group
+        self.setup = setup
+        self.default_size = default_size
+
+
+def benchmark(group, default_size=1000):
+    def decorator(setup):
+        name = '{}.{}'.format(group, setup.__name__)
+        BENCHMARKS[name] = Benchmark(name, group, setup, default_size)
+        return setup
+    return decorator
+
+
+class MemoryBenchmark(object):
+    def __init__(self, name, setup, unit, default_size):
+        self.name = name
+        self.group = 'memory'
+        self.setup = setup
+        self.unit = unit
+        self.default_size = default_size
+
+
+def memory_benchmark(unit, default_size=1000):
+    """Registers a memory benchmark.
+
+    Setup function must return a tuple of a callable that builds result
+    objects and a number of units (hits or buckets) in the result.
+    """
+    def decorator(setup):
+        name = 'memory.{}'.format(setup.__name__)
+        MEMORY_BENCHMARKS[name] = MemoryBenchmark(
+            name, setup, unit, default_size
+        )
+        return setup
+    return decorator
+
+
+def select_benchmarks(names=None, registry=BENCHMARKS):
+    if not names:
+        return list(registry.values())
+    selected = []
+    for bench in registry.values():
+        if any(bench.name == n or bench.group == n for n in names):
+            selected.append(bench)
+    return selected
+
+
+def time_benchmark(bench, size=None, number=1, repeat=5, warmup=0):
+    """Returns a list of per call durations in seconds."""
+    func = bench.setup(size or bench.default_size)
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    k = (len(values) - 1) * p / 100.0
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def median_ci(timings, confidence=0.95, resamples=2000, seed=0):
+    """Calculates bootstrap confidence interval of the median.
+
+    Resampling uses a fixed seed so the same timings always give the same
+    interval.
+    """
+    if len(timings) == 1:
+        return [timings[0], timings[0]]
+    rnd = random.Random(seed)
+    medians = sorted(
+        statistics.median(rnd.choices(timings, k=len(timings)))
+        for _ in range(resamples)
+    )
+    alpha = (1.0 - confidence) / 2 * 100
+    return [percentile(medians, alpha), percentile(medians, 100 - alpha)]
+
+
+def summarize(timings, confidence=0.95):
+    """Calculates statistics for timings.
+
+    Confidence interval is calculated for the median with bootstrap, so
+    it describes the same statistic which is used to compare runs.
+    """
+    return OrderedDict((
+        ('min', min(timings)),
+        ('max', max(timings)),
+        ('mean', statistics.mean(timings)),
+        ('median', statistics.median(timings)),
+        ('p95', percentile(timings, 95)),
+        ('stdev', statistics.stdev(timings) if len(timings) > 1 else 0.0),
+        ('median_ci', median_ci(timings, confidence=confidence)),
+        ))
+
+
+def run_suite(names=None, size=None, number=1, repeat=5, warmup=0):
+    results = OrderedDict()
+    for bench in select_benchmarks(names):
+        timings = time_benchmark(
+            bench, size=size, number=number, repeat=repeat, warmup=warmup
+        )
+        results[bench.name] = OrderedDict((
+            ('group', bench.group),
+            ('size', size or bench.default_size),
+            ('number', number),
+            ('times', timings),
+            ))
+        results[bench.name].update(summarize(timings))
+    return OrderedDict((
+        ('meta', environment_info()),
+        ('benchmarks', results),
+        ))
+
+
+def measure_memory(bench, size=None):
+    """Measures peak and retained memory while building result objects.
+
+    Raw data is prepared before tracing so only the memory allocated by
+    the library is counted.
+    """
+    size = size or bench.default_size
+    build, units = bench.setup(size)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        # tracing has just started so the peak is already fresh
+        # on Python versions without reset_peak
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        result = build()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    peak -= start
+    retained = current - start
+    return OrderedDict((
+        ('group', bench.group),
+        ('size', size),
+        ('unit', bench.unit),
+        ('units', units),
+        ('peak_bytes', peak),
+        ('retained_bytes', retained),
+        ('peak_bytes_per_unit', peak / units if units else None),
+        ('retained_bytes_per_unit', retained / units if units else None),
+        ))
+
+
+def run_memory_suite(names=None, size=None):
+    results = OrderedDict()
+    for bench in select_benchmarks(names, registry=MEMORY_BENCHMARKS):
+        results[bench.name] = measure_memory(bench, size=size)
+    return OrderedDict((
+        ('meta', environment_info()),
+        ('benchmarks', results),
+        ))
+
+
+def environment_info():
+    return OrderedDict((
+        ('elasticmagic', __version__),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('timestamp', datetime.datetime.utcnow().isoformat()),
+        ))
+
+
+# Documents
+
+
+class SimpleDocument(Document):
+    __doc_type__ = 'simple'
+
+    boolean_0 = Field(Boolean)
+    integer_0 = Field(Integer)
+    float_0 = Field(Float)
+    string_0 = Field(String)
+    date_0 = Field(Date)
+
+    boolean_1 = Field(Boolean)
+    integer_1 = Field(Integer)
+    float_1 = Field(Float)
+    string_1 = Field(String)
+    date_1 = Field(Date)
+
+
+class ListsDocument(Document):
+    __doc_type__ = 'lists'
+
+    boolean_0 = Field(List(Boolean))
+    integer_0 = Field(List(Integer))
+    float_0 = Field(List(Float))
+    string_0 = Field(List(String))
+    date_0 = Field(List(Date))
+
+    boolean_1 = Field(List(Boolean))
+    integer_1 = Field(List(Integer))
+    float_1 = Field(List(Float))
+    string_1 = Field(List(String))
+    date_1 = Field(List(Date))
+
+
+class SellerDocument(Document):
+    name = Field(String)
+    rating = Field(Float)
+    registered_at = Field(Date)
+
+
+class OfferDocument(Document):
+    price = Field(Float)
+    available = Field(Boolean)
+    updated_at = Field(Date)
+    tags = Field(List(String))
+
+
+class ProductDocument(Document):
+    __doc_type__ = 'product'
+
+    name = Field(String)
+    status = Field(Integer)
+    rank = Field(Float)
+    category = Field(Integer)
+    vendor = Field(String)
+    price = Field(Float)
+    created_at = Field(Date)
+    seller = Field(Object(SellerDocument))
+    offers = Field(List(Nested(OfferDocument)))
+
+
+# Data generators
+
+
+def gen_simple_document(N):
+    for i in range(N):
+        yield {
+            '_index': _INDEX,
+            '_type': 'simple',
+            '_id': i,
+            '_source': {
+                'boolean_0': bool(i % 2),
+                'integer_0': i,
+                'float_0': i / (10 ** len(str(i))),
+                'string_0': str(i),
+                'date_0': None,
+                'boolean_1': bool(1 + i % 2),
+                'integer_1': -i,
+                'float_1': i / (10 ** len(str(i))),
+                'string_1': str(i),
+                'date_1': None,
+                }
+            }
+
+
+def gen_lists_document(N):
+    K = len(str(N))
+    for i in range(N):
+        yield {
+            '_index': _INDEX,
+            '_type': 'lists',
+            '_id': i,
+            '_source': {
+                'boolean_0': [bool(i*a % 2) for a in range(K)],
+                'integer_0': [i] * K,
+                'float_0': [(i / (10 ** len(str(i))))] * K,
+                'string_0': [str(i)] * K,
+                'date_0': None,
+                'boolean_1': [bool(1 + i % 2)] * K,
+                'integer_1': [-i] * K,
+                'float_1': [(i / (10 ** len(str(i))))] * K,
+                'string_1': [str(i)] * K,
+                'date_1': None,
+                }
+            }
+
+
+def gen_product_document(N, offers=5):
+    for i in range(N):
+        yield {
+            '_index': _INDEX,
+            '_type': 'product',
+            '_id': str(i),
+            '_score': 1.0 / (i + 1),
+            '_source': {
+                'name': 'Product #{}'.format(i),
+                'status': i % 3,
+                'rank': i / 10.0,
+                'category': i % 50,
+                'vendor': 'vendor-{}'.format(i % 20),
+                'price': 100.0 + i,
+                'created_at': '2019-{:02}-{:02}T10:20:30'.format(
+                    i % 12 + 1, i % 28 + 1
+                ),
+                'seller': {
+                    'name': 'Seller #{}'.format(i % 100),
+                    'rating': i % 5 + 0.5,
+                    'registered_at': '2015-01-{:02}'.format(i % 28 + 1),
+                },
+                'offers': [
+                    {
+                        'price': 90.0 + i + j,
+                        'available': bool(j % 2),
+                        'updated_at': '2020-02-{:02}T00:00:00'.format(
+                            j % 28 + 1
+                        ),
+                        'tags': ['tag-{}'.format(j), 'tag-{}'.format(i)],
+                    }
+                    for j in range(offers)
+                ],
+                }
+            }
+
+
+def gen_docvalue_fields_document(N):
+    for i in range(N):
+        yield {
+            '_index': _INDEX,
+            '_type': 'product',
+            '_id': str(i),
+            '_score': None,
+            'fields': {
+                'status': [i % 3],
+                'category': [i % 50],
+                'price': [100.0 + i],
+                'seller.rating': [i % 5 + 0.5],
+                'created_at': ['2019-{:02}-{:02}T10:20:30.000Z'.format(
+                    i % 12 + 1, i % 28 + 1
+                )],
+            },
+        }
+
+
+def gen_terms_buckets(N):
+    for i in range(N):
+        yield {
+            "key": i,
+            "doc_count": i,
+            }
+
+
+def gen_deep_buckets(N, width=10, hits=3):
+    for i in range(N):
+        yield {
+            'key': i,
+            'doc_count': width * hits,
+            'avg_price': {'value': i * 1.5},
+            'vendors': {
+                'buckets': [
+                    {
+                        'key': 'vendor-{}'.format(j),
+                        'doc_count': hits,
+                        'max_price': {'value': i + j * 0.5},
+                        'top': {
+                            'hits': {
+                                'total': hits,
+                                'max_score': 1.0,
+                                'hits': list(
+                                    gen_product_document(hits, offers=1)
+                                ),
+                            }
+                        },
+                    }
+                    for j in range(width)
+                ]
+            },
+        }
+
+
+def search_response(hits=(), total=None, aggregations=None):
+    hits = list(hits)
+    raw = {
+        'took': 1,
+        'timed_out': False,
+        '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+        'hits': {
+            'total': {
+                'value': len(hits) if total is None else total,
+                'relation': 'eq',
+            },
+            'max_score': 1.0,
+            'hits': hits,
+        },
+    }
+    if aggregations is not None:
+        raw['aggregations'] = aggregations
+    return raw
+
+
+# Fake transport
+
+
+class FakeConnection(Connection):
+    """Connection that answers every request with a canned response.
+
+    The whole client stack is exercised (serialization, transport,
+    deserialization) without network round trips.
+    """
+    responses = {}
+
+    def perform_request(
+            self, method, url, params=None, body=None, timeout=None,
+            ignore=(), headers=None
+    ):
+        if url == '/':
+            raw = {
+                'version': {'number': '7.10.0'},
+                'tagline': 'You Know, for Search',
+            }
+        else:
+            endpoint = url.rstrip('/').rsplit('/', 1)[-1]
+            raw = self.responses[endpoint]
+        return (
+            200,
+            {'x-elastic-product': 'Elasticsearch'},
+            json.dumps(raw),
+        )
+
+
+def fake_cluster(responses):
+    connection_cls = type(
+        'FakeConnection', (FakeConnection,), {'responses': responses}
+    )
+    client = Elasticsearch(connection_class=connection_cls)
+    return Cluster(client, compiler=Compiler_7_0)
+
+
+# Compilation
+
+
+def large_search_query(size):
+    index = Index(Cluster(None, compiler=Compiler_7_0), _INDEX)
+    doc = ProductDocument
+    sq = (
+        index.search_query(
+            MultiMatch(
+                'lorem ipsum', [doc.name.boost(2), doc.vendor],
+                type='cross_fields'
+            ),
+            doc_cls=doc,
+        )
+        .filter(doc.status.in_(list(range(size))))
+        .filter(doc.category.in_(list(range(0, size, 2))))
+        .filter(doc.price.range(gte=10, lte=10000))
+        .post_filter(doc.vendor.in_(
+            ['vendor-{}'.format(i) for i in range(size)]
+        ))
+        .function_score([
+            Weight(i + 1, filter=doc.category == i)
+            for i in range(min(size, 100))
+        ])
+        .function_score(FieldValueFactor(doc.rank, missing=1))
+        .function_score(Gauss(doc.created_at, origin='now', scale='30d'))
+        .order_by(doc.rank.desc(), doc.price, doc._score)
+        .highlight(fields=[doc.name])
+        .limit(24)
+    )
+    for i in range(min(size, 100)):
+        sq = sq.aggs({
+            'category_{}'.format(i): agg.Terms(
+                doc.category, size=100,
+                aggs={
+                    'price': agg.Stats(doc.price),
+                    'vendors': agg.Terms(doc.vendor, size=10),
+                }
+            ),
+        })
+    return sq
+
+
+@benchmark('compile', default_size=100)
+def search_query(size):
+    sq = large_search_query(size)
+    return lambda: sq.to_dict(compiler=Compiler_7_0)
+
+
+@benchmark('compile', default_size=100)
+def queryfilter_apply(size):
+    doc = ProductDocument
+
+    class ProductQueryFilter(QueryFilter):
+        status = FacetFilter(doc.status, type=Integer)
+        category = FacetFilter(doc.category, type=Integer)
+        vendor = FacetFilter(
+            doc.vendor, aggs={'min_price': agg.Min(doc.price)}
+        )
+        price = RangeFilter(doc.price, type=Float)
+        rank = RangeFilter(doc.rank, type=Float, compute_min_max=False)
+        is_new = FacetQueryFilter(
+            FacetQueryValue('true', doc.status == 0),
+            alias='new',
+        )
+        price_ranges = FacetQueryFilter(
+            FacetQueryValue('*-100', doc.price <= 100),
+            FacetQueryValue('100-1000', doc.price.range(gt=100, lte=1000)),
+            FacetQueryValue('1000-*', doc.price > 1000),
+        )
+        sort = OrderingFilter(
+            OrderingValue('rank', [doc.rank.desc()]),
+            OrderingValue('price', [doc.price]),
+            OrderingValue('-price', [doc.price.desc()]),
+            default='rank',
+        )
+        page = PageFilter(per_page_values=[24, 48])
+
+    qf = ProductQueryFilter()
+    index = Index(Cluster(None, compiler=Compiler_7_0), _INDEX)
+    params = {
+        'status': ['0', '1'],
+        'category': [str(i) for i in range(size)],
+        'vendor': ['vendor-{}'.format(i) for i in range(size)],
+        'price__gte': ['100'],
+        'price__lte': ['1000'],
+        'new': ['true'],
+        'price_ranges': ['100-1000'],
+        'sort': ['-price'],
+        'page': ['2'],
+    }
+
+    def run():
+        sq = qf.apply(index.search_query(doc_cls=doc), params)
+        return sq.to_dict(compiler=Compiler_7_0)
+
+    return run
+
+
+@benchmark('compile', default_size=100000)
+def terms_many_ids(size):
+    doc = ProductDocument
+    index = Index(Cluster(None, compiler=Compiler_7_0), _INDEX)
+    sq = index.search_query(doc.name.match('phone'), doc_cls=doc)
+    ids = list(range(size))
+
+    def run():
+        return sq.filter(doc.category.in_(ids)).to_dict()
+
+    return run
+
+
+@benchmark('compile', default_size=60)
+def queryfilter_many_facets(size):
+    doc = ProductDocument
+    attrs = {
+        'attr_{}'.format(i): FacetFilter(
+            Field('attr_{}'.format(i), Integer)
+        )
+        for i in range(size)
+    }
+    attrs['price'] = RangeFilter(doc.price, type=Float)
+    attrs['page'] = PageFilter(per_page_values=[24, 48])
+    qf = type('ManyFacetsQueryFilter', (QueryFilter,), attrs)()
+    index = Index(Cluster(None, compiler=Compiler_7_0), _INDEX)
+    # every third facet has selected values
+    params = {
+        'attr_{}'.format(i): ['1', '2'] for i in range(0, size, 3)
+    }
+    params['price__gte'] = ['100']
+
+    def run():
+        return qf.apply(index.search_query(doc_cls=doc), params)
+
+    return run
+
+
+@benchmark('compile', default_size=500)
+def queryfilter_decode_params(size):
+    codec = SimpleCodec()
+    types = {'attr_{}'.format(i): Integer() for i in range(20)}
+    types['price'] = Float()
+    params = {
+        'attr_{}'.format(i): [str(v) for v in range(size // 20)]
+        for i in range(20)
+    }
+    params['price__gte'] = ['100']
+
+    def run():
+        return codec.decode(params, types)
+
+    return run
+
+
+# Hydration
+
+
+def _hydration(raw, doc_cls_map):
+    def run():
+        return SearchResult(raw, doc_cls_map=doc_cls_map).hits
+    return run
+
+
+@benchmark('hydration')
+def simple(size):
+    return _hydration(
+        search_response(gen_simple_document(size)),
+        {'simple': SimpleDocument},
+    )
+
+
+@benchmark('hydration')
+def lists(size):
+    return _hydration(
+        search_response(gen_lists_document(size)),
+        {'lists': ListsDocument},
+    )
+
+
+@benchmark('hydration')
+def nested(size):
+    return _hydration(
+        search_response(gen_product_document(size)),
+        {'product': ProductDocument},
+    )
+
+
+@benchmark('hydration')
+def dynamic(size):
+    return _hydration(search_response(gen_product_document(size)), {})
+
+
+@benchmark('hydration')
+def docvalue_fields(size):
+    doc_cls = ProductDocument.get_projection(
+        ProductDocument.status, ProductDocument.category,
+        ProductDocument.price, ProductDocument.created_at,
+        docvalues=True,
+    )
+    return _hydration(
+        search_response(gen_docvalue_fields_document(size)),
+        {'product': doc_cls},
+    )
+
+
+# Aggregations
+
+
+@benchmark('aggregations', default_size=10000)
+def terms(size):
+    raw = search_response(aggregations={
+        'terms': {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': 0,
+            'buckets': list(gen_terms_buckets(size)),
+        }
+    })
+    aggs = {'terms': agg.Terms(SimpleDocument.integer_0, size=size)}
+    return lambda: SearchResult(raw, aggregations=aggs).aggregations
+
+
+@benchmark('aggregations', default_size=10000)
+def date_histogram(size):
+    start = 1546300800000
+    raw = search_response(aggregations={
+        'dates': {
+            'buckets': [
+                {
+                    'key': start + i * 3600000,
+                    'key_as_string': datetime.datetime.utcfromtimestamp(
+                        (start + i * 3600000) / 1000
+                    ).isoformat(),
+                    'doc_count': i,
+                }
+                for i in range(size)
+            ],
+        }
+    })
+    aggs = {
+        'dates': agg.DateHistogram(
+            ProductDocument.created_at, interval='1h'
+        )
+    }
+    return lambda: SearchResult(raw, aggregations=aggs).aggregations
+
+
+@benchmark('aggregations', default_size=10000)
+def typed_date_histogram(size):
+    start = 1546300800000
+    raw = search_response(aggregations={
+        'dates': {
+            'buckets': [
+                {'key': start + i * 3600000, 'doc_count': i}
+                for i in range(size)
+            ],
+        }
+    })
+    aggs = {
+        'dates': agg.DateHistogram(
+            ProductDocument.created_at, interval='1h', type=Date
+        )
+    }
+    return lambda: SearchResult(raw, aggregations=aggs).aggregations
+
+
+@benchmark('aggregations', default_size=10000)
+def columnar_date_histogram(size):
+    start = 1546300800000
+    raw = search_response(aggregations={
+        'dates': {
+            'buckets': [
+                {
+                    'key': start + i * 3600000,
+                    'doc_count': i,
+                    'avg_price': {'value': i * 1.5},
+                }
+                for i in range(size)
+            ],
+        }
+    })
+    aggs = {
+        'dates': agg.DateHistogram(
+            ProductDocument.created_at, interval='1h', columnar=True,
+            aggs={'avg_price': agg.Avg(ProductDocument.price)},
+        )
+    }
+    return lambda: SearchResult(
+        raw, aggregations=aggs
+    ).get_aggregation('dates').to_arrays()
+
+
+@benchmark('aggregations', default_size=100)
+def deep(size):
+    doc = ProductDocument
+    raw = search_response(aggregations={
+        'categories': {'buckets': list(gen_deep_buckets(size))},
+    })
+    aggs = {
+        'categories': agg.Terms(
+            doc.category, size=size,
+            aggs={
+                'avg_price': agg.Avg(doc.price),
+                'vendors': agg.Terms(
+                    doc.vendor, size=10,
+                    aggs={
+                        'max_price': agg.Max(doc.price),
+                        'top': agg.TopHits(size=3),
+                    }
+                ),
+            }
+        ),
+    }
+    doc_cls_map = {'product': doc}
+    return lambda: SearchResult(
+        raw, aggregations=aggs, doc_cls_map=doc_cls_map
+    ).aggregations
+
+
+# Bulk
+
+
+@benchmark('bulk')
+def serialize(size):
+    docs = [
+        ProductDocument(_id=hit['_id'], **hit['_source'])
+        for hit in gen_product_document(size)
+    ]
+    bulk_actions = []
+    for i, doc in enumerate(docs):
+        if i % 3 == 0:
+            bulk_actions.append(actions.Index(doc, index=_INDEX))
+        elif i % 3 == 1:
+            bulk_actions.append(
+                actions.Update(doc, index=_INDEX, retry_on_conflict=3)
+            )
+        else:
+            bulk_actions.append(actions.Delete(doc, index=_INDEX))
+    compiled_bulk = Compiler_7_0.compiled_bulk
+    return lambda: compiled_bulk(bulk_actions).body
+
+
+# Memory
+
+
+@memory_benchmark('hit')
+def search_result(size):
+    raw = search_response(gen_product_document(size))
+    doc_cls_map = {'product': ProductDocument}
+
+    return lambda: SearchResult(raw, doc_cls_map=doc_cls_map), size
+
+
+@memory_benchmark('hit')
+def dynamic_document(size):
+    raw = search_response(gen_product_document(size))
+    return lambda: SearchResult(raw), size
+
+
+@memory_benchmark('bucket', default_size=10000)
+def multi_bucket_agg_result(size):
+    raw = search_response(aggregations={
+        'terms': {'buckets': list(gen_terms_buckets(size))},
+    })
+    aggs = {'terms': agg.Terms(SimpleDocument.integer_0, size=size)}
+    return lambda: SearchResult(raw, aggregations=aggs), size
+
+
+@memory_benchmark('bucket', default_size=100)
+def deep_buckets(size, width=10):
+    doc = ProductDocument
+    raw = search_response(aggregations={
+        'categories': {
+            'buckets': list(gen_deep_buckets(size, width=width, hits=1)),
+        },
+    })
+    aggs = {
+        'categories': agg.Terms(
+            doc.category, size=size,
+            aggs={
+                'avg_price': agg.Avg(doc.price),
+                'vendors': agg.Terms(
+                    doc.vendor, size=width,
+                    aggs={'max_price': agg.Max(doc.price)}
+                ),
+            }
+        ),
+    }
+    return lambda: SearchResult(raw, aggregations=aggs), size * (width + 1)
+
+
+@memory_benchmark('hit', default_size=100)
+def top_hits_result(size):
+    raw = search_response(aggregations={
+        'top': {
+            'hits': {
+                'total': size,
+                'max_score': 1.0,
+                'hits': list(gen_product_document(size)),
+            },
+        },
+    })
+    aggs = {'top': agg.TopHits(size=size)}
+    doc_cls_map = {'product': ProductDocument}
+
+    return (
+        lambda: SearchResult(raw, aggregations=aggs, doc_cls_map=doc_cls_map),
+        size
+    )
+
+
+# End to end
+
+
+@benchmark('transport', default_size=100)
+def search(size):
+    raw = search_response(
+        gen_product_document(size),
+        aggregations={
+            'categories': {'buckets': list(gen_terms_buckets(size))},
+        },
+    )
+    cluster = fake_cluster({'_search': raw})
+    sq = (
+        cluster[_INDEX].search_query(
+            ProductDocument.name.match('product'), doc_cls=ProductDocument
+        )
+        .aggs(categories=agg.Terms(ProductDocument.category, size=size))
+        .limit(size)
+    )
+    return lambda: cluster.search(sq)
+
+
+@benchmark('transport')
+def bulk(size):
+    raw = {
+        'took': 1,
+        'errors': False,
+        'items': [
+            {
+                'index': {
+                    '_index': _INDEX, '_id': str(i), '_version': 1,
+                    'status': 201,
+                }
+            }
+            for i in range(size)
+        ],
+    }
+    cluster = fake_cluster({'_bulk': raw})
+    docs = [
+        ProductDocument(_id=hit['_id'], **hit['_source'])
+        for hit in gen_product_document(size)
+    ]
+    bulk_actions = [actions.Index(doc, index=_INDEX) for doc in docs]
+    return lambda: cluster.bulk(bulk_actions)
+
+
+class Comparison(object):
+    def __init__(self, name, group, baseline, current, threshold, hot):
+        self.name = name
+        self.group = group
+        self.baseline = baseline
+        self.current = current
+        self.threshold = threshold
+        self.hot = hot
+        self.ratio = (
+            current['median'] / baseline['median']
+            if baseline['median'] else float('inf')
+        )
+
+    @property
+    def overlaps(self):
+        """Whether confidence intervals of medians of the baseline and
+        the current run overlap, so the difference may be just noise.
+        """
+        baseline_ci = self.baseline.get('median_ci')
+        current_ci = self.current.get('median_ci')
+        if not baseline_ci or not current_ci:
+            return False
+        return current_ci[0] <= baseline_ci[1]
+
+    @property
+    def is_regression(self):
+        return (
+            self.ratio > 1.0 + self.threshold and
+            not self.overlaps
+        )
+
+    @property
+    def is_failure(self):
+        return self.hot and self.is_regression
+
+    def to_dict(self):
+        return OrderedDict((
+            ('group', self.group),
+            ('baseline_median', self.baseline['median']),
+            ('median', self.current['median']),
+            ('p95', self.current['p95']),
+            ('ratio', self.ratio),
+            ('regression', self.is_regression),
+            ('failure', self.is_failure),
+            ))
+
+
+def compare(baseline, current, threshold=0.1, hot_groups=HOT_GROUPS):
+    """Compares benchmark results with a baseline.
+
+    Both arguments are results returned by :func:`run_suite`. Benchmarks
+    missing in the baseline or having a different size are skipped.
+    """
+    comparisons = []
+    baseline_benchmarks = baseline.get('benchmarks', {})
+    for name, current_res in current['benchmarks'].items():
+        baseline_res = baseline_benchmarks.get(name)
+        if not baseline_res or baseline_res.get('size') != current_res['size']:
+            continue
+        if 'median_ci' not in baseline_res and 'times' in baseline_res:
+            baseline_res = dict(
+                baseline_res, **summarize(baseline_res['times'])
+            )
+        comparisons.append(
+            Comparison(
+                name, current_res['group'], baseline_res, current_res,
+                threshold, current_res['group'] in hot_groups,
+            )
+        )
+    return comparisons
+
+
+def format_comparisons(comparisons):
+    lines = [
+        '{:<32} {:>12} {:>12} {:>12} {:>8}'.format(
+            'benchmark', 'baseline, ms', 'median, ms', 'p95, ms', 'ratio'
+        )
+    ]
+    for c in comparisons:
+        mark = ''
+        if c.is_failure:
+            mark = ' REGRESSION'
+        elif c.is_regression:
+            mark = ' slower'
+        lines.append(
+            '{:<32} {:>12.3f} {:>12.3f} {:>12.3f} {:>8.3f}{}'.format(
+                c.name,
+                c.baseline['median'] * 1000,
+                c.current['median'] * 1000,
+                c.current['p95'] * 1000,
+                c.ratio,
+                mark,
+            )
+        )
+    return '\n'.join(lines)
+
+
+def dump(results, output=sys.stdout, indent=2):
+    json.dump(results, output, indent=indent)
+    output.write('\n')
@@ -2,7 +2,7 @@ from .cluster import Cluster
 from .compiler import MultiSearchError
 from .document import Document, DynamicDocument
 from .expression import (
-    Params, Term, Terms, Exists, Missing, Range,
+    Params, Term, Terms, TermsLookup, Exists, Missing, Range,
     Match, MatchPhrase, MatchPhrasePrefix, MultiMatch, MatchAll,
     Bool, Query, DisMax, Ids, Prefix, Limit,
     Sort, Boosting, Common, ConstantScore, FunctionScore,
@@ -24,7 +24,7 @@ __all__ = [
 
     'Document', 'DynamicDocument',
 
-    'Params', 'Term', 'Terms', 'Exists', 'Missing',
+    'Params', 'Term', 'Terms', 'TermsLookup', 'Exists', 'Missing',
     'Match', 'MatchPhrase', 'MatchPhrasePrefix', 'MultiMatch', 'MatchAll',
     'Range', 'Bool', 'Query', 'DisMax', 'Ids',
     'Prefix', 'Limit', 'Sort', 'Boosting', 'Common',
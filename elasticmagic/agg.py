@@ -25,20 +25,88 @@
            compiler=Compiler_7_0)
        return cluster.search_query()
 """
-from itertools import chain
+import asyncio
+import datetime
+import inspect
+import operator
+from array import array
+from collections import OrderedDict
 
 from .document import DynamicDocument
 from .document import get_doc_type_for_hit
-from .expression import ParamsExpression, Params
-from .types import instantiate, Type
+from .expression import ParamsExpression, Params, Sort
+from .types import instantiate, Date, List, Type
 from .util import _with_clone, cached_property, maybe_float, merge_params
 
 
+# key in a mapper registry for containers with unbuilt sub-aggregations
+# which have instance mappers
+LAZY_AGGS = object()
+
+
+def _identity(value):
+    return value
+
+
+def _iter_order_items(order):
+    if isinstance(order, (list, tuple)):
+        for o in order:
+            for path, direction in _iter_order_items(o):
+                yield path, direction
+    elif isinstance(order, dict):
+        for path, direction in order.items():
+            yield path, direction
+    elif isinstance(order, Sort) and isinstance(order.expr, str):
+        yield order.expr, order.order
+    else:
+        raise ValueError('Unsupported buckets order: {!r}'.format(order))
+
+
+def make_key_converter(key_type):
+    """Returns a function that converts a single bucket key into a python
+    value. It is built once per aggregation so converting a bucket key
+    does not need to walk the type hierarchy.
+    """
+    if isinstance(key_type, List):
+        # bucket keys are always single values
+        key_type = key_type.sub_type
+    if isinstance(key_type, Date):
+        # elasticsearch returns dates as milliseconds since the epoch
+        from_timestamp = datetime.datetime.fromtimestamp
+        utc = datetime.timezone.utc
+
+        def to_date(value):
+            if isinstance(value, (int, float)):
+                return from_timestamp(value / 1000, utc)
+            return key_type.to_python(value)
+        return to_date
+    type_cls = type(key_type)
+    if type_cls.to_python_single is not Type.to_python_single:
+        return key_type.to_python_single
+    if type_cls.to_python is not Type.to_python:
+        return key_type.to_python
+    python_type = key_type.python_type
+    if python_type is None:
+        return _identity
+
+    def to_python_type(value):
+        if value is None:
+            return None
+        return python_type(value)
+    return to_python_type
+
+
 class AggExpression(ParamsExpression):
     __visit_name__ = 'agg'
 
     result_cls = None
 
+    _mergeable = False
+
+    @cached_property
+    def _has_instance_mapper(self):
+        return bool(getattr(self, '_instance_mapper', None))
+
     def clone(self):
         return self.__class__(**self.params)
 
@@ -47,6 +115,24 @@ class AggExpression(ParamsExpression):
     ):
         raise NotImplementedError()
 
+    def check_mergeable(self):
+        """Raises :exc:`ValueError` if results of the aggregation cannot be
+        merged by :meth:`merge_raw_results`.
+        """
+        if not self._mergeable:
+            raise ValueError(
+                'Results of {} aggregation cannot be merged'.format(
+                    self.__class__.__name__
+                )
+            )
+
+    def merge_raw_results(self, raw_results):
+        """Merges raw results of the aggregation calculated by the same
+        search query on different indices or clusters.
+        """
+        self.check_mergeable()
+        raise NotImplementedError()
+
 
 class AggResult(object):
     def __init__(self, agg_expr):
@@ -81,6 +167,36 @@ class BucketAgg(AggExpression):
 
     aggs = aggregations
 
+    @cached_property
+    def _has_nested_instance_mappers(self):
+        return any(
+            agg_expr._has_instance_mapper
+            for agg_expr in self._aggregations.values()
+        )
+
+    @cached_property
+    def _has_instance_mapper(self):
+        return (
+            super(BucketAgg, self)._has_instance_mapper or
+            self._has_nested_instance_mappers
+        )
+
+    def check_mergeable(self):
+        super(BucketAgg, self).check_mergeable()
+        for agg_expr in self._aggregations.values():
+            agg_expr.check_mergeable()
+
+    def _merge_raw_bucket(self, raw_buckets):
+        merged = dict(raw_buckets[0])
+        merged['doc_count'] = sum(
+            raw_bucket.get('doc_count', 0) for raw_bucket in raw_buckets
+        )
+        for agg_name, agg_expr in self._aggregations.items():
+            merged[agg_name] = agg_expr.merge_raw_results([
+                raw_bucket.get(agg_name, {}) for raw_bucket in raw_buckets
+            ])
+        return merged
+
     def build_agg_result(
             self, raw_data, doc_cls_map=None, mapper_registry=None,
     ):
@@ -91,6 +207,170 @@ class BucketAgg(AggExpression):
         )
 
 
+def _merge_raw_values(raw_results, merge_func):
+    values = [
+        raw_data['value'] for raw_data in raw_results
+        if raw_data.get('value') is not None
+    ]
+    return {'value': merge_func(values) if values else None}
+
+
+def build_lazy_aggs(mapper_registry):
+    """Builds all sub-aggregations that can contain instance mappers,
+    so instances can be populated with a single call of every mapper.
+    """
+    if not mapper_registry:
+        return
+    pending = mapper_registry.pop(LAZY_AGGS, None)
+    while pending:
+        for container in pending:
+            container._build_lazy_aggs()
+        pending = mapper_registry.pop(LAZY_AGGS, None)
+
+
+def populate_instances(mapper_registry):
+    """Populates instances for all results registered in the mapper registry.
+
+    Every instance mapper is called once with unique ids collected from
+    all the results. Objects that already have an instance are skipped.
+    """
+    build_lazy_aggs(mapper_registry)
+
+    for instance_mapper, targets in collect_instance_targets(
+            mapper_registry
+    ).items():
+        instances = instance_mapper(_unique_keys(targets))
+        if inspect.isawaitable(instances):
+            if hasattr(instances, 'close'):
+                instances.close()
+            raise TypeError(
+                'Instance mapper {!r} is asynchronous, '
+                'use "await result.load_instances()" before accessing '
+                'instances'.format(instance_mapper)
+            )
+        assign_instances(targets, instances)
+
+
+async def populate_instances_async(mapper_registry):
+    """The same as :func:`populate_instances` but supports asynchronous
+    instance mappers. Different mappers are called concurrently.
+    """
+    build_lazy_aggs(mapper_registry)
+
+    async def populate(instance_mapper, targets):
+        instances = instance_mapper(_unique_keys(targets))
+        if inspect.isawaitable(instances):
+            instances = await instances
+        assign_instances(targets, instances)
+
+    await asyncio.gather(*(
+        populate(instance_mapper, targets)
+        for instance_mapper, targets in collect_instance_targets(
+            mapper_registry
+        ).items()
+    ))
+
+
+def get_doc_instance_mapper(instance_mappers, doc_cls):
+    """Returns an instance mapper for the document class or its nearest
+    base class, so projections of document classes share instance mappers
+    with their original classes.
+    """
+    for cls in doc_cls.__mro__:
+        if cls in instance_mappers:
+            return instance_mappers[cls]
+    return None
+
+
+def _unique_keys(targets):
+    return list(OrderedDict.fromkeys(key for _, key in targets))
+
+
+def collect_instance_targets(mapper_registry):
+    """Returns a mapping from an instance mapper to a list of
+    ``(obj, key)`` pairs that are not populated yet.
+    """
+    mapper_targets = OrderedDict()
+    for instance_mapper, results in mapper_registry.items():
+        if not instance_mapper or instance_mapper is LAZY_AGGS:
+            continue
+        targets = []
+        for result in results:
+            for obj, key in result._iter_instance_targets(instance_mapper):
+                if 'instance' not in obj.__dict__:
+                    targets.append((obj, key))
+        if targets:
+            mapper_targets[instance_mapper] = targets
+    return mapper_targets
+
+
+def assign_instances(targets, instances):
+    instances = instances or {}
+    for obj, key in targets:
+        obj.__dict__['instance'] = instances.get(key)
+
+
+class LazyAggregations(object):
+    """Base class for results that contain sub-aggregations.
+
+    Sub-aggregation results are built from the raw data the first time
+    they are accessed.
+    """
+    _strict_raw_aggs = True
+
+    def _init_aggregations(
+            self, raw_data, agg_expr, doc_cls_map, mapper_registry
+    ):
+        self._raw_data = raw_data
+        self._aggs_expr = agg_expr
+        self._doc_cls_map = doc_cls_map
+        self._aggs_mapper_registry = mapper_registry
+        self._agg_results = None
+        if (
+                mapper_registry is not None and
+                agg_expr._has_nested_instance_mappers
+        ):
+            mapper_registry.setdefault(LAZY_AGGS, []).append(self)
+
+    def _build_lazy_aggs(self):
+        self.aggregations
+
+    def _build_aggregation(self, agg_name, agg_expr):
+        if self._strict_raw_aggs:
+            raw_agg_data = self._raw_data[agg_name]
+        else:
+            raw_agg_data = self._raw_data.get(agg_name, {})
+        return agg_expr.build_agg_result(
+            raw_agg_data,
+            doc_cls_map=self._doc_cls_map,
+            mapper_registry=self._aggs_mapper_registry,
+        )
+
+    @cached_property
+    def aggregations(self):
+        aggregations = {}
+        for agg_name, agg_expr in self._aggs_expr._aggregations.items():
+            # There is no result for some pipeline aggregations
+            if agg_expr.result_cls is None:
+                continue
+            aggregations[agg_name] = self.get_aggregation(agg_name)
+        return aggregations
+
+    def get_aggregation(self, name):
+        if self._agg_results is None:
+            self._agg_results = {}
+        elif name in self._agg_results:
+            return self._agg_results[name]
+
+        agg_expr = self._aggs_expr._aggregations.get(name)
+        if agg_expr is None or agg_expr.result_cls is None:
+            return None
+        agg_result = self._agg_results[name] = self._build_aggregation(
+            name, agg_expr
+        )
+        return agg_result
+
+
 class SingleValueMetricsAggResult(AggResult):
     def __init__(self, agg_expr, raw_data):
         super(SingleValueMetricsAggResult, self).__init__(agg_expr)
@@ -155,6 +435,11 @@ class Min(SingleValueMetricsAgg):
     """  # noqa:E501
     __agg_name__ = 'min'
 
+    _mergeable = True
+
+    def merge_raw_results(self, raw_results):
+        return _merge_raw_values(raw_results, min)
+
 
 class Max(SingleValueMetricsAgg):
     """A single-value metric aggregation that returns the maximum value among
@@ -163,6 +448,11 @@ class Max(SingleValueMetricsAgg):
     """  # noqa:E501
     __agg_name__ = 'max'
 
+    _mergeable = True
+
+    def merge_raw_results(self, raw_results):
+        return _merge_raw_values(raw_results, max)
+
 
 class Sum(SingleValueMetricsAgg):
     """A single-value metric aggregation that sums up all extracted numeric
@@ -192,6 +482,11 @@ class Sum(SingleValueMetricsAgg):
     """  # noqa:E501
     __agg_name__ = 'sum'
 
+    _mergeable = True
+
+    def merge_raw_results(self, raw_results):
+        return _merge_raw_values(raw_results, sum)
+
 
 class Avg(SingleValueMetricsAgg):
     """A single-value metric aggregation that computes average of all extracted
@@ -235,6 +530,11 @@ class ValueCount(SingleValueMetricsAgg):
     """  # noqa:E501
     __agg_name__ = 'value_count'
 
+    _mergeable = True
+
+    def merge_raw_results(self, raw_results):
+        return _merge_raw_values(raw_results, sum)
+
 
 class TopHitsResult(AggResult):
     def __init__(
@@ -264,28 +564,25 @@ class TopHitsResult(AggResult):
         else:
             self._mapper_registry = mapper_registry
 
-        if self._instance_mappers:
-            for instance_mapper in self._instance_mappers.values():
+        for instance_mapper in OrderedDict.fromkeys(
+                self._instance_mappers.values()
+        ):
+            if instance_mapper:
                 self._mapper_registry \
                     .setdefault(instance_mapper, []) \
                     .append(self)
 
+    def _iter_instance_targets(self, instance_mapper):
+        for hit in self.hits:
+            if get_doc_instance_mapper(
+                    self._instance_mappers, hit.__class__
+            ) is instance_mapper:
+                yield hit, hit._id
+
     def _populate_instances(self, doc_cls):
-        instance_mapper = self._instance_mappers.get(doc_cls)
-        hits = list(chain(
-            *(
-                map(
-                    lambda r: filter(
-                        lambda hit: isinstance(hit, doc_cls), r.hits
-                    ),
-                    self._mapper_registry.get(instance_mapper, [self])
-                )
-            )
-        ))
-        ids = [hit._id for hit in hits]
-        instances = instance_mapper(ids) if instance_mapper else {}
-        for hit in hits:
-            hit.__dict__['instance'] = instances.get(hit._id)
+        populate_instances(self._mapper_registry)
+        for hit in self.hits:
+            hit.__dict__.setdefault('instance', None)
 
 
 class TopHits(MetricsAgg):
@@ -430,9 +727,24 @@ class Stats(MultiValueMetricsAgg):
 
     result_cls = StatsResult
 
+    _mergeable = True
+
     def __init__(self, field=None, script=None, **kwargs):
         super(Stats, self).__init__(field=field, script=script, **kwargs)
 
+    def merge_raw_results(self, raw_results):
+        count = sum(raw_data.get('count') or 0 for raw_data in raw_results)
+        total = sum(raw_data.get('sum') or 0 for raw_data in raw_results)
+        mins = [r['min'] for r in raw_results if r.get('min') is not None]
+        maxs = [r['max'] for r in raw_results if r.get('max') is not None]
+        return {
+            'count': count,
+            'min': min(mins) if mins else None,
+            'max': max(maxs) if maxs else None,
+            'avg': total / count if count else None,
+            'sum': total,
+        }
+
 
 class ExtendedStatsResult(StatsResult):
     def __init__(self, agg_expr, values):
@@ -455,11 +767,22 @@ class ExtendedStats(Stats):
 
     result_cls = ExtendedStatsResult
 
+    _mergeable = False
+
     def __init__(self, field=None, script=None, **kwargs):
         super(ExtendedStats, self).__init__(
             field=field, script=script, **kwargs
         )
 
+    def merge_raw_results(self, raw_results):
+        # std_deviation_bounds are calculated by elasticsearch around
+        # the average of every index and cannot be restored from them
+        raise ValueError(
+            'Results of {} aggregation cannot be merged'.format(
+                self.__class__.__name__
+            )
+        )
+
 
 class BasePercentilesAggResult(MultiValueMetricsAggResult):
     def __init__(self, *args, **kwargs):
@@ -624,7 +947,7 @@ class Cardinality(SingleValueMetricsAgg):
         )
 
 
-class Bucket(object):
+class Bucket(LazyAggregations):
     _typed_key = True
 
     def __init__(
@@ -633,23 +956,14 @@ class Bucket(object):
     ):
         self.key = raw_data.get('key')
         if self._typed_key:
-            self.key = agg_expr._type.to_python_single(self.key)
+            if agg_expr._key_as_string:
+                self.key = raw_data.get('key_as_string', self.key)
+            self.key = agg_expr._key_to_python(self.key)
         self.doc_count = raw_data['doc_count']
         self.parent = parent
-        self.aggregations = {}
-        for agg_name, agg_expr in agg_expr._aggregations.items():
-            # There is no result for some pipeline aggregations
-            if agg_expr.result_cls is None:
-                continue
-            result_agg = agg_expr.build_agg_result(
-                raw_data[agg_name],
-                doc_cls_map=doc_cls_map,
-                mapper_registry=mapper_registry,
-            )
-            self.aggregations[agg_name] = result_agg
-
-    def get_aggregation(self, name):
-        return self.aggregations.get(name)
+        self._init_aggregations(
+            raw_data, agg_expr, doc_cls_map, mapper_registry
+        )
 
     @cached_property
     def instance(self):
@@ -670,9 +984,29 @@ class MultiBucketAggResult(AggResult):
     def __init__(
             self, agg_expr, raw_data, doc_cls_map,
             mapper_registry, instance_mapper,
+    ):
+        self._init_result(
+            agg_expr, doc_cls_map, mapper_registry, instance_mapper
+        )
+
+        self._buckets = []
+        self._buckets_map = {}
+        for raw_bucket in self._get_raw_buckets(raw_data):
+            bucket = self.bucket_cls(
+                raw_bucket, agg_expr, self, doc_cls_map=doc_cls_map,
+                mapper_registry=mapper_registry,
+            )
+            self.add_bucket(bucket)
+
+    def _init_result(
+            self, agg_expr, doc_cls_map, mapper_registry, instance_mapper,
     ):
         super(MultiBucketAggResult, self).__init__(agg_expr)
+        self._doc_cls_map = doc_cls_map
+        self._register_instance_mapper(instance_mapper, mapper_registry)
 
+    @staticmethod
+    def _get_raw_buckets(raw_data):
         raw_buckets = raw_data.get('buckets', [])
         if isinstance(raw_buckets, dict):
             raw_buckets_map = raw_buckets
@@ -683,16 +1017,9 @@ class MultiBucketAggResult(AggResult):
                 raw_bucket = raw_bucket.copy()
                 raw_bucket.setdefault('key', key)
                 raw_buckets.append(raw_bucket)
+        return raw_buckets
 
-        self._buckets = []
-        self._buckets_map = {}
-        for raw_bucket in raw_buckets:
-            bucket = self.bucket_cls(
-                raw_bucket, agg_expr, self, doc_cls_map=doc_cls_map,
-                mapper_registry=mapper_registry,
-            )
-            self.add_bucket(bucket)
-
+    def _register_instance_mapper(self, instance_mapper, mapper_registry):
         self._instance_mapper = instance_mapper
         if mapper_registry is None:
             self._mapper_registry = {}
@@ -719,41 +1046,218 @@ class MultiBucketAggResult(AggResult):
     def __iter__(self):
         return iter(self._buckets)
 
+    def _iter_instance_targets(self, instance_mapper):
+        for bucket in self._buckets:
+            yield bucket, bucket.key
+
     def _populate_instances(self):
-        buckets = list(chain(
-            *(
-                a._buckets for a in
-                self._mapper_registry.get(self._instance_mapper, [self])
-            )
-        ))
-        keys = [bucket.key for bucket in buckets]
-        instances = (
-            self._instance_mapper(keys) if self._instance_mapper else {}
+        populate_instances(self._mapper_registry)
+        for bucket in self._buckets:
+            bucket.__dict__.setdefault('instance', None)
+
+
+class ColumnarMultiBucketAggResult(MultiBucketAggResult):
+    """Result of a multi bucket aggregation in the columnar mode.
+
+    Raw keys, doc counts and values of single value metrics
+    sub-aggregations are stored as arrays, bucket objects are created
+    only when they are accessed.
+    """
+
+    def __init__(
+            self, agg_expr, raw_data, doc_cls_map,
+            mapper_registry, instance_mapper,
+    ):
+        self.bucket_cls = agg_expr.result_cls.bucket_cls
+        self._init_result(
+            agg_expr, doc_cls_map, mapper_registry, instance_mapper
+        )
+        self._raw_buckets = self._get_raw_buckets(raw_data)
+        self._built_buckets = {}
+        self._added_buckets = {}
+
+        self.raw_keys = [b.get('key') for b in self._raw_buckets]
+        self.doc_counts = array(
+            'q', [b['doc_count'] for b in self._raw_buckets]
         )
-        for bucket in buckets:
-            bucket.__dict__['instance'] = instances.get(bucket.key)
+        self.metrics = {}
+        for agg_name, sub_agg in agg_expr._aggregations.items():
+            if not isinstance(sub_agg, SingleValueMetricsAgg):
+                continue
+            self.metrics[agg_name] = array('d', [
+                self._metric_value(b.get(agg_name))
+                for b in self._raw_buckets
+            ])
+
+        # buckets of nested aggregations with instance mappers must be
+        # built before instances are populated
+        if (
+                mapper_registry is not None and
+                agg_expr._has_nested_instance_mappers
+        ):
+            mapper_registry.setdefault(LAZY_AGGS, []).append(self)
+
+    @staticmethod
+    def _metric_value(raw_metric):
+        if not raw_metric or raw_metric.get('value') is None:
+            return float('nan')
+        return raw_metric['value']
+
+    def _build_lazy_aggs(self):
+        self._buckets
+
+    def _get_bucket_at(self, ix):
+        bucket = self._built_buckets.get(ix)
+        if bucket is None:
+            bucket = self._built_buckets[ix] = self.bucket_cls(
+                self._raw_buckets[ix], self.expr, self,
+                doc_cls_map=self._doc_cls_map,
+                mapper_registry=self._mapper_registry,
+            )
+        return bucket
+
+    @cached_property
+    def _buckets(self):
+        return [self._get_bucket_at(ix) for ix in range(len(self))]
+
+    @cached_property
+    def _key_positions(self):
+        return {
+            key: ix for ix, key in enumerate(self.keys) if key is not None
+        }
+
+    def add_bucket(self, bucket):
+        self._buckets.append(bucket)
+        if bucket.key is not None:
+            self._added_buckets[bucket.key] = bucket
+
+    def get_bucket(self, key):
+        if key in self._added_buckets:
+            return self._added_buckets[key]
+        ix = self._key_positions.get(key)
+        if ix is None:
+            return None
+        return self._get_bucket_at(ix)
+
+    @cached_property
+    def keys(self):
+        if not self.bucket_cls._typed_key:
+            return list(self.raw_keys)
+        to_python = self.expr._key_to_python
+        if self.expr._key_as_string:
+            return [
+                to_python(b.get('key_as_string', b.get('key')))
+                for b in self._raw_buckets
+            ]
+        return [to_python(key) for key in self.raw_keys]
+
+    def __len__(self):
+        return len(self._raw_buckets)
+
+    def _keys_array(self):
+        if all(
+                isinstance(k, int) and not isinstance(k, bool)
+                for k in self.raw_keys
+        ):
+            return array('q', self.raw_keys)
+        if all(
+                isinstance(k, (int, float)) and not isinstance(k, bool)
+                for k in self.raw_keys
+        ):
+            return array('d', self.raw_keys)
+        return list(self.raw_keys)
+
+    def to_arrays(self):
+        """Returns a dictionary with ``key``, ``doc_count`` and values of
+        single value metrics sub-aggregations.
+
+        Numeric keys are returned as is (for example date histogram keys are
+        epoch milliseconds), other keys are returned as a list.
+        Missing metric values are ``nan``.
+        """
+        arrays = {
+            'key': self._keys_array(),
+            'doc_count': self.doc_counts,
+        }
+        arrays.update(self.metrics)
+        return arrays
+
+    def to_numpy(self):
+        """The same as :meth:`to_arrays` but returns numpy arrays.
+        Requires `numpy` to be installed.
+        """
+        import numpy
+
+        return {
+            name: numpy.asarray(values)
+            for name, values in self.to_arrays().items()
+        }
 
 
 class MultiBucketAgg(BucketAgg):
+    """Base class for multi bucket aggregations.
+
+    Pass ``columnar=True`` to build
+    :class:`ColumnarMultiBucketAggResult` that is much cheaper for
+    aggregations with lots of buckets.
+    """
     result_cls = MultiBucketAggResult
+    columnar_result_cls = ColumnarMultiBucketAggResult
+
+    _mergeable = True
 
-    def __init__(self, type=None, instance_mapper=None, **kwargs):
+    def __init__(
+            self, type=None, instance_mapper=None, columnar=False, **kwargs
+    ):
         super(MultiBucketAgg, self).__init__(**kwargs)
         self._type = instantiate(type or Type)
         self._instance_mapper = instance_mapper
+        self._columnar = columnar
+
+    @cached_property
+    def _key_to_python(self):
+        return make_key_converter(self._type)
+
+    @cached_property
+    def _key_as_string(self):
+        # epoch milliseconds do not respect format and time zone
+        key_type = self._type
+        if isinstance(key_type, List):
+            key_type = key_type.sub_type
+        return isinstance(key_type, Date) and (
+            'format' in self.params or 'time_zone' in self.params
+        )
+
+    def merge_raw_results(self, raw_results):
+        raw_buckets_by_key = OrderedDict()
+        for raw_data in raw_results:
+            for raw_bucket in self.result_cls._get_raw_buckets(raw_data):
+                raw_buckets_by_key \
+                    .setdefault(raw_bucket.get('key'), []) \
+                    .append(raw_bucket)
+        return {
+            'buckets': [
+                self._merge_raw_bucket(raw_buckets)
+                for raw_buckets in raw_buckets_by_key.values()
+            ]
+        }
 
     def clone(self):
         return self.__class__(
             aggs=self._aggregations,
             type=self._type,
             instance_mapper=self._instance_mapper,
+            columnar=self._columnar,
             **self.params
         )
 
     def build_agg_result(
             self, raw_data, doc_cls_map=None, mapper_registry=None
     ):
-        return self.result_cls(
+        result_cls = (
+            self.columnar_result_cls if self._columnar else self.result_cls
+        )
+        return result_cls(
             self, raw_data, doc_cls_map, mapper_registry, self._instance_mapper
         )
 
@@ -784,9 +1288,99 @@ class Terms(MultiBucketAgg):
             type=self._type,
             aggs=self._aggregations,
             instance_mapper=self._instance_mapper,
+            columnar=self._columnar,
             **self.params
         )
 
+    def merge_raw_results(self, raw_results):
+        merged = super(Terms, self).merge_raw_results(raw_results)
+        merged['doc_count_error_upper_bound'] = sum(
+            raw_data.get('doc_count_error_upper_bound', 0)
+            for raw_data in raw_results
+        )
+        merged['sum_other_doc_count'] = sum(
+            raw_data.get('sum_other_doc_count', 0)
+            for raw_data in raw_results
+        )
+        self.sort_raw_buckets(merged['buckets'])
+        size = self.params.get('size', 10)
+        if size is not None and len(merged['buckets']) > size:
+            merged['sum_other_doc_count'] += sum(
+                b['doc_count'] for b in merged['buckets'][size:]
+            )
+            del merged['buckets'][size:]
+        return merged
+
+    def check_mergeable(self):
+        super(Terms, self).check_mergeable()
+        # raises when the order cannot be evaluated on raw buckets
+        self.sort_raw_buckets([])
+
+    @cached_property
+    def _raw_bucket_sort_keys(self):
+        order = self.params.get('order')
+        sort_keys = []
+        for path, direction in _iter_order_items(
+                order if order is not None else {'_count': 'desc'}
+        ):
+            sort_keys.append(
+                (self._get_raw_bucket_value_getter(path), direction == 'desc')
+            )
+            if path in ('_key', '_term'):
+                break
+        else:
+            # elasticsearch breaks ties by the bucket key
+            sort_keys.append((operator.itemgetter('key'), False))
+        return sort_keys
+
+    def _get_raw_bucket_value_getter(self, path):
+        if path == '_count':
+            return operator.itemgetter('doc_count')
+        if path in ('_key', '_term'):
+            return operator.itemgetter('key')
+        agg_name, _, metric = path.partition('.')
+        agg_expr = self._aggregations.get(agg_name)
+        if isinstance(agg_expr, SingleValueMetricsAgg) and not metric:
+            return lambda raw_bucket: raw_bucket[agg_name].get('value')
+        if isinstance(agg_expr, Stats) and metric:
+            return lambda raw_bucket: raw_bucket[agg_name].get(metric)
+        raise ValueError(
+            'Cannot sort buckets of {} aggregation by {!r}'.format(
+                self.__class__.__name__, path
+            )
+        )
+
+    def sort_raw_buckets(self, raw_buckets):
+        """Sorts raw buckets in place according to the ``order`` of
+        the aggregation. Buckets with missing sub-aggregation values are
+        placed last. Raises :exc:`ValueError` when the order refers to
+        a sub-aggregation path that cannot be evaluated on raw buckets.
+        """
+        for get_value, reverse in reversed(self._raw_bucket_sort_keys):
+            if reverse:
+                raw_buckets.sort(
+                    key=lambda b: (get_value(b) is not None, get_value(b)),
+                    reverse=True,
+                )
+            else:
+                raw_buckets.sort(
+                    key=lambda b: (get_value(b) is None, get_value(b))
+                )
+
+    @_with_clone
+    def partition(self, partition, num_partitions):
+        """Returns a copy of the aggregation that collects only terms from
+        the ``partition`` out of ``num_partitions``.
+        """
+        if self.params.get('include') is not None:
+            raise ValueError(
+                'Cannot partition terms aggregation with include parameter'
+            )
+        self.params = Params(
+            self.params,
+            include={'partition': partition, 'num_partitions': num_partitions}
+        )
+
 
 class SignificantTermsBucket(Bucket):
     def __init__(
@@ -810,6 +1404,12 @@ class SignificantTerms(Terms):
 
     result_cls = SignificantTermsAggResult
 
+    _mergeable = False
+
+    def merge_raw_results(self, raw_results):
+        # scores depend on background frequencies of every index
+        return AggExpression.merge_raw_results(self, raw_results)
+
 
 class Histogram(MultiBucketAgg):
     __agg_name__ = 'histogram'
@@ -821,6 +1421,11 @@ class Histogram(MultiBucketAgg):
             field=field, interval=interval, min_doc_count=min_doc_count,
             aggs=aggs, **kwargs)
 
+    def merge_raw_results(self, raw_results):
+        merged = super(Histogram, self).merge_raw_results(raw_results)
+        merged['buckets'].sort(key=lambda b: b['key'])
+        return merged
+
 
 class DateHistogram(Histogram):
     __agg_name__ = 'date_histogram'
@@ -837,8 +1442,13 @@ class RangeBucket(Bucket):
             raw_data, agg_expr, parent,
             doc_cls_map=doc_cls_map, mapper_registry=mapper_registry,
         )
-        self.from_ = agg_expr._type.to_python_single(raw_data.get('from'))
-        self.to = agg_expr._type.to_python_single(raw_data.get('to'))
+        raw_from = raw_data.get('from')
+        raw_to = raw_data.get('to')
+        if agg_expr._key_as_string:
+            raw_from = raw_data.get('from_as_string', raw_from)
+            raw_to = raw_data.get('to_as_string', raw_to)
+        self.from_ = agg_expr._key_to_python(raw_from)
+        self.to = agg_expr._key_to_python(raw_to)
         if self.key is None:
             self.key = (self.from_, self.to)
 
@@ -870,27 +1480,136 @@ class Filters(MultiBucketAgg):
         super(Filters, self).__init__(filters=filters, aggs=aggs, **kwargs)
 
 
-class SingleBucketAggResult(AggResult):
+class CompositeBucket(Bucket):
+    _typed_key = False
+
+    def __init__(
+            self, raw_data, agg_expr, parent,
+            doc_cls_map=None, mapper_registry=None,
+    ):
+        super(CompositeBucket, self).__init__(
+            raw_data, agg_expr, parent,
+            doc_cls_map=doc_cls_map, mapper_registry=mapper_registry,
+        )
+        raw_key = self.key or {}
+        self.key = {
+            source_name: to_python(raw_key.get(source_name))
+            for source_name, to_python in agg_expr._source_key_converters
+        }
+
+    @property
+    def key_tuple(self):
+        return tuple(
+            self.key.get(source_name)
+            for source_name, _ in self.parent.expr._sources
+        )
+
+
+class CompositeAggResult(MultiBucketAggResult):
+    bucket_cls = CompositeBucket
+
+    def __init__(
+            self, agg_expr, raw_data, doc_cls_map,
+            mapper_registry, instance_mapper,
+    ):
+        self.after_key = raw_data.get('after_key')
+        super(CompositeAggResult, self).__init__(
+            agg_expr, raw_data, doc_cls_map, mapper_registry, instance_mapper,
+        )
+
+    def add_bucket(self, bucket):
+        self._buckets.append(bucket)
+        self._buckets_map[bucket.key_tuple] = bucket
+
+    def get_bucket(self, key):
+        """Returns a bucket by a dictionary or a tuple of source values."""
+        if isinstance(key, dict):
+            key = tuple(
+                key.get(source_name)
+                for source_name, _ in self.expr._sources
+            )
+        return self._buckets_map.get(key)
+
+
+class Composite(MultiBucketAgg):
+    """A multi-bucket aggregation that creates composite buckets from
+    different sources. Buckets can be paginated with ``after`` parameter.
+    See `composite agg <https://www.elastic.co/guide/en/elasticsearch/reference/current/search-aggregations-bucket-composite-aggregation.html>`_.
+
+    Sources can be passed as a list of single-item dictionaries or as
+    a dictionary, use :class:`collections.OrderedDict` to keep the order.
+    Source can be an aggregation expression or a raw dictionary, keys of
+    raw sources are returned as is.
+
+    Use :meth:`elasticmagic.search.SearchQuery.iter_composite` to iterate
+    over all the buckets.
+    """  # noqa:E501
+    __agg_name__ = 'composite'
+
+    result_cls = CompositeAggResult
+
+    _mergeable = False
+
+    def __init__(self, sources, size=None, after=None, aggs=None, **kwargs):
+        sources = self._normalize_sources(sources)
+        super(Composite, self).__init__(
+            sources=[{name: source} for name, source in sources],
+            size=size, after=after, aggs=aggs, **kwargs
+        )
+        self._sources = sources
+
+    @staticmethod
+    def _normalize_sources(sources):
+        if isinstance(sources, dict):
+            return list(sources.items())
+        normalized = []
+        for source in sources:
+            if isinstance(source, dict):
+                normalized.extend(source.items())
+            else:
+                normalized.append(tuple(source))
+        return normalized
+
+    @cached_property
+    def _source_key_converters(self):
+        return [
+            (
+                source_name,
+                source._key_to_python if isinstance(source, MultiBucketAgg)
+                else _identity
+            )
+            for source_name, source in self._sources
+        ]
+
+    @_with_clone
+    def after(self, after_key):
+        self.params = Params(self.params, after=after_key)
+
+    def merge_raw_results(self, raw_results):
+        # pages of different indices cannot be aligned by after key
+        return AggExpression.merge_raw_results(self, raw_results)
+
+
+class SingleBucketAggResult(LazyAggregations, AggResult):
+    _strict_raw_aggs = False
+
     def __init__(self, agg_expr, raw_data, doc_cls_map, mapper_registry):
         super(SingleBucketAggResult, self).__init__(agg_expr)
 
         self.doc_count = raw_data.get('doc_count')
-        self.aggregations = {}
-        for agg_name, agg_expr in agg_expr._aggregations.items():
-            agg_result = agg_expr.build_agg_result(
-                raw_data.get(agg_name, {}),
-                doc_cls_map=doc_cls_map,
-                mapper_registry=mapper_registry,
-            )
-            self.aggregations[agg_name] = agg_result
-
-    def get_aggregation(self, name):
-        return self.aggregations.get(name)
+        self._init_aggregations(
+            raw_data, agg_expr, doc_cls_map, mapper_registry
+        )
 
 
 class SingleBucketAgg(BucketAgg):
     result_cls = SingleBucketAggResult
 
+    _mergeable = True
+
+    def merge_raw_results(self, raw_results):
+        return self._merge_raw_bucket(list(raw_results) or [{}])
+
 
 class Global(SingleBucketAgg):
     __agg_name__ = 'global'
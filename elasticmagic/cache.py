@@ -0,0 +1,325 @@
+import copy
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ['LRUCache', 'CachedInstanceMapper', 'DocumentCache']
+
+
+_NOT_FOUND = object()
+_MISSING_INSTANCE = object()
+
+
+class CacheStats(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return '<CacheStats hits={} misses={} evictions={}>'.format(
+            self.hits, self.misses, self.evictions
+        )
+
+
+class LRUCache(object):
+    """Thread safe bounded cache with least recently used eviction.
+
+    :param max_size: maximum number of cached keys
+    :param ttl: time to live of cached values in seconds, ``None`` means
+       values never expire
+    """
+
+    def __init__(self, max_size=1000, ttl=None, timer=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            value = self._get(key, self._timer(), count=False)
+        return value is not _NOT_FOUND
+
+    def _get(self, key, now, count=True):
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > now:
+                self._data.move_to_end(key)
+                if count:
+                    self.stats.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.stats.misses += 1
+        return _NOT_FOUND
+
+    def _set(self, key, value, now):
+        expires_at = now + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get(key, self._timer())
+        return default if value is _NOT_FOUND else value
+
+    def get_many(self, keys, accept=None):
+        """Returns a dictionary with found keys only.
+
+        :param accept: callable that takes a key and a value, values it
+           rejects are not returned and are counted as misses
+        """
+        found = {}
+        with self._lock:
+            now = self._timer()
+            for key in keys:
+                value = self._get(key, now, count=False)
+                if value is not _NOT_FOUND and (
+                        accept is None or accept(key, value)
+                ):
+                    self.stats.hits += 1
+                    found[key] = value
+                else:
+                    self.stats.misses += 1
+        return found
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value, self._timer())
+
+    def set_many(self, mapping):
+        with self._lock:
+            now = self._timer()
+            for key, value in mapping.items():
+                self._set(key, value, now)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CachedInstanceMapper(object):
+    """Wraps an instance mapper and caches instances by id.
+
+    Only ids that are missing in the cache are passed to the wrapped
+    mapper. The wrapper can be shared between requests and passed
+    everywhere an instance mapper is accepted:
+
+    .. code-block:: python
+
+       category_mapper = CachedInstanceMapper(
+           get_categories_by_ids, max_size=10000, ttl=600
+       )
+
+       search_query = search_query.aggs(
+           categories=agg.Terms(
+               Product.category, instance_mapper=category_mapper
+           )
+       )
+
+    Coroutine functions are also supported, in that case the wrapper
+    returns a coroutine too.
+
+    :param instance_mapper: callable that accepts a list of ids and returns
+       a dictionary from id to instance
+    :param cache: :class:`LRUCache` instance, created from ``max_size`` and
+       ``ttl`` when not passed
+    :param cache_missing: also cache ids the wrapped mapper did not return
+    """
+
+    def __init__(
+            self, instance_mapper, cache=None, max_size=1000, ttl=None,
+            cache_missing=False,
+    ):
+        self.instance_mapper = instance_mapper
+        self.cache = cache if cache is not None else LRUCache(
+            max_size=max_size, ttl=ttl
+        )
+        self.cache_missing = cache_missing
+        self._is_async = inspect.iscoroutinefunction(instance_mapper)
+
+    def __repr__(self):
+        return '<CachedInstanceMapper {!r}>'.format(self.instance_mapper)
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def __call__(self, ids):
+        instances, missing_ids = self._get_cached(ids)
+        if self._is_async:
+            return self._call_async(instances, missing_ids)
+        if missing_ids:
+            self._store(
+                instances, missing_ids, self.instance_mapper(missing_ids)
+            )
+        return instances
+
+    async def _call_async(self, instances, missing_ids):
+        if missing_ids:
+            self._store(
+                instances, missing_ids,
+                await self.instance_mapper(missing_ids)
+            )
+        return instances
+
+    def _get_cached(self, ids):
+        ids = list(OrderedDict.fromkeys(ids))
+        cached = self.cache.get_many(ids)
+        instances = {}
+        missing_ids = []
+        for id in ids:
+            if id in cached:
+                if cached[id] is not _MISSING_INSTANCE:
+                    instances[id] = cached[id]
+            else:
+                missing_ids.append(id)
+        return instances, missing_ids
+
+    def _store(self, instances, missing_ids, loaded):
+        loaded = loaded or {}
+        to_cache = dict(loaded)
+        if self.cache_missing:
+            for id in missing_ids:
+                to_cache.setdefault(id, _MISSING_INSTANCE)
+        self.cache.set_many(to_cache)
+        instances.update(loaded)
+
+    def invalidate(self, *ids):
+        """Removes ids from the cache, clears the whole cache when no ids
+        are passed.
+        """
+        if ids:
+            self.cache.delete_many(ids)
+        else:
+            self.cache.clear()
+
+
+class DocumentCache(object):
+    """Caches raw documents returned by ``get`` and ``multi_get`` requests.
+
+    Documents are keyed by ``(index, doc_type, id)`` exactly as they were
+    requested, so reads and writes should address documents by the same
+    index name or alias. A cached document is returned only for the same
+    routing it was fetched with. Pass the cache to a cluster:
+
+    .. code-block:: python
+
+       cluster = Cluster(
+           client, document_cache=DocumentCache(max_size=100000, ttl=60)
+       )
+
+    Only plain requests are served from the cache, requests with
+    source filtering, ``realtime``, ``refresh``, ``preference`` and other
+    parameters that change the response always go to Elasticsearch.
+    Writes made through ``bulk``, ``add`` and ``delete`` of the same
+    cluster invalidate affected documents. Documents fetched by a request
+    that started before any invalidation are not stored, so a concurrent
+    read cannot put back a document that has just been overwritten.
+    Writes made by other processes are not tracked, use ``ttl`` to bound
+    staleness.
+
+    :param cache: :class:`LRUCache` instance, created from ``max_size`` and
+       ``ttl`` when not passed
+    """
+
+    def __init__(self, cache=None, max_size=10000, ttl=None):
+        self.cache = cache if cache is not None else LRUCache(
+            max_size=max_size, ttl=ttl
+        )
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<DocumentCache {!r}>'.format(self.cache)
+
+    @property
+    def generation(self):
+        """Number of invalidations, take it before requesting documents
+        and pass to :meth:`store`.
+        """
+        return self._generation
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    @staticmethod
+    def make_key(index, doc_type, id):
+        return (index, doc_type, str(id))
+
+    def get_many(self, keys, versions=None, routings=None):
+        """Returns a dictionary with found keys only. Documents which
+        ``_version`` differs from the version in ``versions`` or which
+        ``_routing`` differs from the routing in ``routings`` are skipped
+        and counted as misses. Returned documents are copies, so they can
+        be modified freely.
+        """
+        def accept(key, raw_doc):
+            version = versions.get(key) if versions else None
+            if version is not None and raw_doc.get('_version') != version:
+                return False
+            routing = routings.get(key) if routings else None
+            return raw_doc.get('_routing') == (
+                str(routing) if routing is not None else None
+            )
+
+        return {
+            key: copy.deepcopy(raw_doc)
+            for key, raw_doc in self.cache.get_many(keys, accept).items()
+        }
+
+    def store(self, raw_docs, generation=None):
+        """Stores found documents from a mapping of keys to raw documents.
+        Nothing is stored when the cache was invalidated after
+        the ``generation`` was taken.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self.cache.set_many({
+                key: copy.deepcopy(raw_doc)
+                for key, raw_doc in raw_docs.items()
+                if raw_doc.get('found')
+            })
+
+    def invalidate(self, *keys):
+        """Removes keys from the cache, clears the whole cache when no keys
+        are passed.
+        """
+        with self._lock:
+            self._generation += 1
+            if keys:
+                self.cache.delete_many(keys)
+            else:
+                self.cache.clear()
@@ -1,4 +1,12 @@
+import copy
+import json
+import logging
+import random
+import time
 from abc import ABCMeta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from .compiler import (
     ESVersion,
@@ -11,10 +19,111 @@ from .result import (
     RefreshResult,
 )
 from .search import SearchQuery
-from .util import clean_params
+from .util import clean_params, iter_chunks
 
 MAX_RESULT_WINDOW = 10000
 
+_CACHED_GET_PARAMS = frozenset(
+    ['index', 'doc_type', 'id', 'routing', 'version']
+)
+_CACHED_MULTI_GET_PARAMS = frozenset(['index', 'doc_type', 'routing'])
+_CACHED_MULTI_GET_DOC_KEYS = frozenset(
+    ['_id', '_index', '_type', '_version', 'routing']
+)
+
+log = logging.getLogger(__name__)
+
+
+class SlowQueryLog(object):
+    """Logs requests that take longer than ``threshold`` milliseconds.
+
+    Both client side wall time and server side ``took`` are checked.
+    Compiled body is serialized to json and truncated to
+    ``max_body_length`` characters. Only ``sample_rate`` part of slow
+    requests is logged. Failed requests are logged too, the exception is
+    stored in the ``error`` key of the ``slow_query`` record.
+    """
+
+    def __init__(
+            self, threshold=1000, took_threshold=None, sample_rate=1.0,
+            max_body_length=10000, logger=None, level=logging.WARNING,
+    ):
+        self.threshold = threshold
+        self.took_threshold = (
+            took_threshold if took_threshold is not None else threshold
+        )
+        self.sample_rate = sample_rate
+        self.max_body_length = max_body_length
+        self.logger = logger or log
+        self.level = level
+
+    def is_slow(self, wall_time, took):
+        if self.threshold is not None and wall_time >= self.threshold:
+            return True
+        if (
+                self.took_threshold is not None and
+                took is not None and
+                took >= self.took_threshold
+        ):
+            return True
+        return False
+
+    def format_body(self, body):
+        if body is None:
+            return None
+        if isinstance(body, (list, tuple)):
+            body = '\n'.join(json.dumps(b, default=str) for b in body)
+        else:
+            body = json.dumps(body, default=str)
+        if (
+                self.max_body_length is not None and
+                len(body) > self.max_body_length
+        ):
+            body = body[:self.max_body_length] + '...'
+        return body
+
+    def __call__(
+            self, api_method, compiled_query, wall_time, raw_result,
+            error=None,
+    ):
+        took = None
+        if isinstance(raw_result, dict):
+            took = raw_result.get('took')
+        if not self.is_slow(wall_time, took):
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if not self.logger.isEnabledFor(self.level):
+            return
+
+        params = dict(compiled_query.params)
+        params.pop('body', None)
+        slow_query = {
+            'method': getattr(api_method, '__name__', None),
+            'index': params.pop('index', None),
+            'params': params,
+            'body': self.format_body(compiled_query.body),
+            'wall_time': wall_time,
+            'took': took,
+            'error': error,
+        }
+        if error is not None:
+            self.logger.log(
+                self.level,
+                'Slow query: %s on %s failed with %r: wall time %.1fms: %s',
+                slow_query['method'], slow_query['index'], error,
+                wall_time, slow_query['body'],
+                extra={'slow_query': slow_query},
+            )
+            return
+        self.logger.log(
+            self.level,
+            'Slow query: %s on %s: wall time %.1fms, took %sms: %s',
+            slow_query['method'], slow_query['index'],
+            wall_time, took, slow_query['body'],
+            extra={'slow_query': slow_query},
+        )
+
 
 class BaseCluster(metaclass=ABCMeta):
     _index_cls = None
@@ -24,6 +133,7 @@ class BaseCluster(metaclass=ABCMeta):
             self, client, index_cls=None,
             multi_search_raise_on_error=True,
             autodetect_es_version=True, compiler=None,
+            slow_query_log=None, document_cache=None,
     ):
         self._client = client
         self._index_cls = index_cls or self._index_cls
@@ -36,6 +146,12 @@ class BaseCluster(metaclass=ABCMeta):
         self._compiler = compiler
         self._index_cache = {}
         self._es_version = None
+        if isinstance(slow_query_log, bool):
+            slow_query_log = SlowQueryLog() if slow_query_log else None
+        elif isinstance(slow_query_log, (int, float)):
+            slow_query_log = SlowQueryLog(threshold=slow_query_log)
+        self._slow_query_log = slow_query_log
+        self._document_cache = document_cache
 
     def __getitem__(self, index_name):
         return self.get_index(index_name)
@@ -77,6 +193,152 @@ class BaseCluster(metaclass=ABCMeta):
             params.pop(key)
         return clean_params(params, **kwargs)
 
+    def _log_slow_query(
+            self, api_method, compiled_query, started_at, raw_result,
+            error=None,
+    ):
+        if self._slow_query_log is None:
+            return
+        wall_time = (time.monotonic() - started_at) * 1000
+        self._slow_query_log(
+            api_method, compiled_query, wall_time, raw_result, error=error
+        )
+
+    def _get_cached_doc(self, compiled_get):
+        """Returns a cache key with the cache generation and a cached raw
+        document.
+        """
+        cache = self._document_cache
+        if cache is None or not _CACHED_GET_PARAMS.issuperset(
+                compiled_get.params
+        ):
+            return None, None
+        params = compiled_get.params
+        generation = cache.generation
+        key = cache.make_key(
+            params.get('index'), params.get('doc_type'), params['id']
+        )
+        raw_doc = cache.get_many(
+            [key],
+            versions={key: params.get('version')},
+            routings={key: params.get('routing')},
+        ).get(key)
+        return (key, generation), raw_doc
+
+    def _store_doc(self, cache_read, raw_doc):
+        if cache_read is not None:
+            key, generation = cache_read
+            self._document_cache.store({key: raw_doc}, generation)
+
+    def _multi_get_cache_keys(self, compiled_multi_get):
+        cache = self._document_cache
+        params = compiled_multi_get.params
+        if cache is None or not _CACHED_MULTI_GET_PARAMS.issuperset(params):
+            return None
+        docs = compiled_multi_get.body['docs']
+        if not all(_CACHED_MULTI_GET_DOC_KEYS.issuperset(d) for d in docs):
+            return None
+        return [
+            cache.make_key(
+                doc.get('_index', params.get('index')),
+                doc.get('_type', params.get('doc_type')),
+                doc['_id'],
+            )
+            for doc in docs
+        ]
+
+    def _get_cached_docs(self, compiled_multi_get):
+        """Returns cache keys with the cache generation, cached raw
+        documents by their positions and a compiled query for missing
+        documents, the query is ``None`` when all the documents are cached.
+        """
+        generation = (
+            self._document_cache.generation
+            if self._document_cache is not None else None
+        )
+        keys = self._multi_get_cache_keys(compiled_multi_get)
+        if keys is None:
+            return None, None, compiled_multi_get
+        docs = compiled_multi_get.body['docs']
+        routing = compiled_multi_get.params.get('routing')
+        found = self._document_cache.get_many(
+            keys,
+            versions={
+                key: doc['_version'] for key, doc in zip(keys, docs)
+                if '_version' in doc
+            },
+            routings={
+                key: doc.get('routing', routing)
+                for key, doc in zip(keys, docs)
+            },
+        )
+        cached_docs = {}
+        missing_docs = []
+        for ix, (key, doc) in enumerate(zip(keys, docs)):
+            if key in found:
+                cached_docs[ix] = found[key]
+            else:
+                missing_docs.append(doc)
+        if not missing_docs:
+            return (keys, generation), cached_docs, None
+        missing_query = copy.copy(compiled_multi_get)
+        missing_query.body = {'docs': missing_docs}
+        return (keys, generation), cached_docs, missing_query
+
+    def _merge_cached_docs(self, cache_read, cached_docs, raw_result):
+        if cache_read is None:
+            return raw_result
+        keys, generation = cache_read
+        raw_docs = []
+        new_docs = {}
+        fetched_docs = iter(raw_result['docs'] if raw_result else [])
+        for ix, key in enumerate(keys):
+            raw_doc = cached_docs.get(ix)
+            if raw_doc is None:
+                raw_doc = next(fetched_docs)
+                new_docs[key] = raw_doc
+            raw_docs.append(raw_doc)
+        self._document_cache.store(new_docs, generation)
+        return {'docs': raw_docs}
+
+    def _invalidate_doc(self, compiled_delete):
+        cache = self._document_cache
+        if cache is None:
+            return
+        params = compiled_delete.params
+        cache.invalidate(
+            cache.make_key(
+                params.get('index'), params.get('doc_type'), params['id']
+            )
+        )
+
+    def _invalidate_bulk_docs(self, compiled_bulk):
+        cache = self._document_cache
+        if cache is None:
+            return
+        params = compiled_bulk.params
+        keys = []
+        body = iter(compiled_bulk.body)
+        for meta in body:
+            (action_name, action_meta), = meta.items()
+            if action_name != 'delete':
+                next(body, None)
+            if action_meta.get('_id') is None:
+                continue
+            keys.append(
+                cache.make_key(
+                    action_meta.get('_index', params.get('index')),
+                    action_meta.get('_type', params.get('doc_type')),
+                    action_meta['_id'],
+                )
+            )
+        if keys:
+            cache.invalidate(*keys)
+
+    def _invalidate_all_docs(self):
+        if self._document_cache is not None:
+            self._document_cache.invalidate()
+
     def _get_params(self, params):
         return self._preprocess_params(params, 'doc_or_id', 'doc_cls')
 
@@ -137,14 +399,29 @@ class Cluster(BaseCluster):
 
     def _do_request(self, compiler, *args, **kwargs):
         compiled_query = compiler(*args, **kwargs)
+        return compiled_query.process_result(
+            self._do_raw_request(compiled_query)
+        )
+
+    def _do_raw_request(self, compiled_query):
         api_method = compiled_query.api_method(self._client)
-        if compiled_query.body is None:
-            raw_res = api_method(**compiled_query.params)
-        else:
-            raw_res = api_method(
-                body=compiled_query.body, **compiled_query.params
+        started_at = time.monotonic()
+        raw_res = error = None
+        try:
+            if compiled_query.body is None:
+                raw_res = api_method(**compiled_query.params)
+            else:
+                raw_res = api_method(
+                    body=compiled_query.body, **compiled_query.params
+                )
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._log_slow_query(
+                api_method, compiled_query, started_at, raw_res, error=error
             )
-        return compiled_query.process_result(raw_res)
+        return raw_res
 
     def get_compiler(self):
         if self._compiler:
@@ -165,23 +442,71 @@ class Cluster(BaseCluster):
             preference=None, refresh=None, version=None, version_type=None,
             **kwargs
     ):
-        return self._do_request(
-            self.get_compiler().compiled_get,
+        compiled_get = self.get_compiler().compiled_get(
             doc_or_id, self._get_params(locals()), doc_cls=doc_cls
         )
+        cache_read, raw_doc = self._get_cached_doc(compiled_get)
+        if raw_doc is None:
+            raw_doc = self._do_raw_request(compiled_get)
+            self._store_doc(cache_read, raw_doc)
+        return compiled_get.process_result(raw_doc)
 
     def multi_get(
             self, docs_or_ids, index=None, doc_cls=None, doc_type=None,
             source=None, parent=None, routing=None, preference=None,
             realtime=None, refresh=None, **kwargs
     ):
-        return self._do_request(
-            self.get_compiler().compiled_multi_get,
+        compiled_multi_get = self.get_compiler().compiled_multi_get(
             docs_or_ids, self._multi_get_params(locals()), doc_cls=doc_cls
         )
+        cache_read, cached_docs, missing_query = self._get_cached_docs(
+            compiled_multi_get
+        )
+        raw_res = None
+        if missing_query is not None:
+            raw_res = self._do_raw_request(missing_query)
+        return compiled_multi_get.process_result(
+            self._merge_cached_docs(cache_read, cached_docs, raw_res)
+        )
 
     mget = multi_get
 
+    def iter_multi_get(
+            self, docs_or_ids, chunk_size=1000, concurrency=4, **kwargs
+    ):
+        """Gets documents by chunks of ``chunk_size`` and yields them in
+        the order of ``docs_or_ids``, ``None`` for missing documents.
+
+        ``docs_or_ids`` can be an iterable of any size. Up to
+        ``concurrency`` chunks are requested concurrently, so at most
+        ``chunk_size * concurrency`` documents are kept in memory.
+        Other arguments are passed to :meth:`multi_get`:
+
+        .. code-block:: python
+
+           for doc in cluster.iter_multi_get(
+                   product_ids, index='products', doc_cls=Product,
+                   chunk_size=500,
+           ):
+               process(doc)
+        """
+        # detect elasticsearch version before running requests in threads
+        self.get_compiler()
+        chunks = iter_chunks(docs_or_ids, chunk_size)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = deque(
+                executor.submit(self.multi_get, chunk, **kwargs)
+                for chunk in islice(chunks, concurrency)
+            )
+            while futures:
+                docs = futures.popleft().result()
+                for chunk in islice(chunks, 1):
+                    futures.append(
+                        executor.submit(self.multi_get, chunk, **kwargs)
+                    )
+                for doc in docs:
+                    yield doc
+
     def search(
             self, q, index=None, doc_type=None, routing=None, preference=None,
             timeout=None, search_type=None, query_cache=None,
@@ -272,10 +597,15 @@ class Cluster(BaseCluster):
             version_type=None,
             **kwargs
     ):
-        return self._do_request(
-            self.get_compiler().compiled_delete,
+        compiled_delete = self.get_compiler().compiled_delete(
             doc_or_id, self._delete_params(locals()), doc_cls=doc_cls
         )
+        try:
+            return compiled_delete.process_result(
+                self._do_raw_request(compiled_delete)
+            )
+        finally:
+            self._invalidate_doc(compiled_delete)
 
     def delete_by_query(
             self, q, index=None, doc_type=None, routing=None,
@@ -284,19 +614,27 @@ class Cluster(BaseCluster):
             wait_for_completion=None, requests_per_second=None,
             **kwargs
     ):
-        return self._do_request(
-            self.get_compiler().compiled_delete_by_query,
-            q, self._search_params(locals())
-        )
+        try:
+            return self._do_request(
+                self.get_compiler().compiled_delete_by_query,
+                q, self._search_params(locals())
+            )
+        finally:
+            self._invalidate_all_docs()
 
     def bulk(
             self, actions, index=None, doc_type=None, refresh=None,
             timeout=None, consistency=None, replication=None, **kwargs
     ):
-        return self._do_request(
-            self.get_compiler().compiled_bulk,
+        compiled_bulk = self.get_compiler().compiled_bulk(
             actions, self._bulk_params(locals())
         )
+        try:
+            return compiled_bulk.process_result(
+                self._do_raw_request(compiled_bulk)
+            )
+        finally:
+            self._invalidate_bulk_docs(compiled_bulk)
 
     def refresh(self, index=None, **kwargs):
         params = self._preprocess_params(locals())
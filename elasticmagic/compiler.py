@@ -57,6 +57,9 @@ class CompilationError(Exception):
     pass
 
 
+_PLAIN_VALUE_TYPES = frozenset([str, int, float, bool, type(None)])
+
+
 class MultiSearchError(ElasticsearchException):
     pass
 
@@ -295,7 +298,27 @@ class CompiledExpression(Compiled):
                     ))
             ):
                 return self.visit(Ids(expr.terms, self.doc_classes))
-        params = {self.visit(expr.field): self.visit(expr.terms)}
+        params = {self.visit(expr.field): self._visit_terms_list(expr.terms)}
+        params.update(self.visit(expr.params))
+        return {
+            'terms': params
+        }
+
+    def _visit_terms_list(self, terms):
+        # huge lists of plain values do not need to be visited one by one
+        if set(map(type, terms)).issubset(_PLAIN_VALUE_TYPES):
+            return terms
+        return self.visit(terms)
+
+    def visit_terms_lookup(self, expr):
+        index = expr.index
+        if hasattr(index, 'get_name'):
+            index = index.get_name()
+        lookup = Params(
+            index=index, id=expr.id, path=self.visit(expr.path),
+            routing=expr.routing,
+        )
+        params = {self.visit(expr.field): self.visit(lookup)}
         params.update(self.visit(expr.params))
         return {
             'terms': params
@@ -727,6 +750,9 @@ class CompiledSearchQuery(CompiledExpression, CompiledEndpoint):
         if query_ctx.search_after:
             params['search_after'] = query_ctx.search_after
 
+        if query_ctx.profile:
+            params['profile'] = True
+
         self._patch_docvalue_fields(params, self.doc_classes)
         return params
 
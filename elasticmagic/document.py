@@ -1,4 +1,6 @@
-from .types import Type, String, Integer, Float, Date
+import fnmatch
+
+from .types import Type, String, Integer, Float, Date, List
 from .attribute import AttributedField, DynamicAttributedField
 from .attribute import _attributed_field_factory
 from .expression import Field, MappingField
@@ -54,6 +56,19 @@ class DocumentMeta(type):
                 process_fields.append((attr_name, field))
         process_fields = sorted(process_fields, key=lambda v: v[1]._count)
 
+        projected_fields = dct.get('__projected_fields__')
+        if projected_fields is not None:
+            process_fields = [
+                (attr_name, field) for attr_name, field in process_fields
+                if (
+                        attr_name in projected_fields or
+                        isinstance(field, MappingField)
+                )
+            ]
+
+        cls._projections = {}
+        cls._field_converters = {}
+
         for attr_name, field in process_fields:
             if attr_name in cls.__dict__:
                 delattr(cls, attr_name)
@@ -99,6 +114,7 @@ class DocumentMeta(type):
                 cls._user_fields[name] = attr_field
             cls._fields[name] = attr_field
             cls._field_name_map[field._name] = attr_field
+            cls._field_converters = {}
 
             value = attr_field
 
@@ -151,6 +167,8 @@ class Document(metaclass=DocumentMeta):
 
     __mapping_options__ = {}
 
+    __docvalues__ = False
+
     def __init__(self, _hit=None, _result=None, **kwargs):
         self.__hit_fields = None
         self.__highlight = None
@@ -216,7 +234,9 @@ class Document(metaclass=DocumentMeta):
                 # in next example we cannot decide
                 # which tag has name and which has not:
                 # {"tags.id": [1, 2], "tags.name": ["Test"]}
-                self.__hit_fields = self._process_fields(fields)
+                self.__hit_fields = self._process_fields(
+                    fields, populate=self.__docvalues__
+                )
 
             if _hit.get('highlight'):
                 self.__highlight = _hit['highlight']
@@ -241,31 +261,133 @@ class Document(metaclass=DocumentMeta):
             )
         return key, value
 
-    def _process_fields(self, hit_fields):
+    def _process_fields(self, hit_fields, populate=False):
         processed_fields = {}
+        get_converter = self._get_field_converter
         for field_name, field_values in hit_fields.items():
-            field_path = field_name.split('.')
-            doc_cls = self.__class__
-            field_type = None
-            for fname in field_path:
-                attr_field = doc_cls._field_name_map.get(fname)
-                if not attr_field:
-                    break
-                field_type = attr_field.get_field().get_type()
-                doc_cls = field_type.doc_cls
-            if field_type:
-                processed_values = list(
-                    map(field_type.to_python, field_values)
-                )
+            to_python, attr_name, is_list = get_converter(field_name)
+            if to_python:
+                processed_values = list(map(to_python, field_values))
             else:
                 processed_values = field_values
             processed_fields[field_name] = processed_values
+            if populate and attr_name:
+                if is_list:
+                    value = to_python(field_values)
+                else:
+                    value = processed_values[0] if processed_values else None
+                setattr(self, attr_name, value)
         return processed_fields
 
+    @classmethod
+    def _get_field_converter(cls, field_name):
+        """Returns ``(to_python, attr_name, is_list)`` for a hit field path.
+        Paths are resolved once per document class.
+        """
+        converter = cls._field_converters.get(field_name)
+        if converter is not None:
+            return converter
+
+        doc_cls = cls
+        field_type = None
+        for fname in field_name.split('.'):
+            if doc_cls is None:
+                break
+            attr_field = doc_cls._field_name_map.get(fname)
+            if not attr_field:
+                break
+            field_type = attr_field.get_field().get_type()
+            doc_cls = field_type.doc_cls
+
+        attr_name = None
+        attr_field = cls._field_name_map.get(field_name)
+        if attr_field is not None and attr_field._attr_name in cls.user_fields:
+            attr_name = attr_field._attr_name
+
+        converter = (
+            field_type.to_python if field_type else None,
+            attr_name,
+            isinstance(field_type, List),
+        )
+        cls._field_converters[field_name] = converter
+        return converter
+
     @classmethod
     def get_doc_type(cls):
         return getattr(cls, '__doc_type__', None)
 
+    @classmethod
+    def get_projection(cls, *fields, docvalues=False):
+        """Returns a lightweight subclass of the document that maps only
+        specified fields. A field of a sub-document projects the whole
+        top-level field. Projections are cached, so the same fields always
+        give the same class:
+
+        .. code-block:: python
+
+           ProductName = Product.get_projection(Product.name, Product.status)
+           assert issubclass(ProductName, Product)
+           assert list(ProductName.user_fields.keys()) == ['name', 'status']
+
+        With ``docvalues`` the projection populates its attributes from
+        hit fields instead of ``_source``, see :meth:`SearchQuery.only`.
+        Sub-documents cannot be populated from hit fields so their fields
+        raise :exc:`ValueError`.
+        """
+        origin = cls.__dict__.get('__projection_of__', cls)
+        attr_names = set()
+        for field in fields:
+            if isinstance(field, AttributedField):
+                field = field.get_field_name()
+            name = field.split('.')[0]
+            attr_field = origin._field_name_map.get(name)
+            if attr_field is None and any(
+                    fnmatch.fnmatch(name, template)
+                    for template in origin._dynamic_defaults
+            ):
+                # dynamic fields are not mapped by document classes
+                continue
+            if attr_field is None or attr_field._attr_name not in \
+                    origin.user_fields:
+                raise ValueError(
+                    '{} has no field {!r}'.format(origin.__name__, field)
+                )
+            if docvalues and attr_field.get_type().doc_cls:
+                raise ValueError(
+                    'Field {!r} of {} is a sub-document and cannot be '
+                    'populated from docvalue fields'.format(
+                        field, origin.__name__
+                    )
+                )
+            attr_names.add(attr_field._attr_name)
+        if not docvalues and attr_names == set(origin.user_fields.keys()):
+            return origin
+
+        projection_key = (frozenset(attr_names), docvalues)
+        projection = origin._projections.get(projection_key)
+        if projection is None:
+            projection = type(origin)(
+                '{}{}Projection_{}'.format(
+                    origin.__name__,
+                    'DocValues' if docvalues else '',
+                    '_'.join(
+                        name for name in origin.user_fields.keys()
+                        if name in attr_names
+                    ),
+                ),
+                (origin,),
+                {
+                    '__module__': origin.__module__,
+                    '__projection_of__': origin,
+                    '__projected_fields__': projection_key[0],
+                    '__docvalues__': docvalues,
+                }
+            )
+            projection = origin._projections.setdefault(
+                projection_key, projection
+            )
+        return projection
+
     @classmethod
     def has_parent_doc_cls(cls):
         return hasattr(cls, '__parent__')
@@ -4,7 +4,7 @@ import operator
 from collections.abc import Mapping
 from itertools import count
 
-from .util import clean_params, collect_doc_classes
+from .util import collect_doc_classes
 from .types import instantiate, Type
 
 
@@ -32,12 +32,20 @@ class Params(Expression, Mapping):
     __visit_name__ = 'params'
 
     def __init__(self, *args, **kwargs):
+        if args and isinstance(args[0], Params):
+            # parameters are already cleaned, only new ones are processed
+            self._params = dict(args[0]._params)
+            args = args[1:]
+        else:
+            self._params = {}
         params = {}
         for d in args:
             params.update(d)
         params.update(kwargs)
-        self._params = {}
-        for k, v in clean_params(params).items():
+        for k, v in params.items():
+            if v is None:
+                self._params.pop(k, None)
+                continue
             if k.endswith('_') and not k.startswith('_'):
                 k = k.rstrip('_')
             self._params[k] = v
@@ -126,6 +134,21 @@ class Terms(FieldExpression):
         self.terms = list(terms)
 
 
+class TermsLookup(FieldExpression):
+    """Terms query that fetches terms from a field of a stored document.
+    Useful when there are too many terms to put them into a request.
+    """
+    __visit_name__ = 'terms_lookup'
+
+    def __init__(self, field, index, id, path, routing=None, boost=None,
+                 **kwargs):
+        super(TermsLookup, self).__init__(field, boost=boost, **kwargs)
+        self.index = index
+        self.id = id
+        self.path = path
+        self.routing = routing
+
+
 class Match(FieldQueryExpression):
     __visit_name__ = 'match'
     __query_name__ = 'match'
@@ -472,6 +495,9 @@ class FieldOperators(object):
     def not_in_(self, terms, **kwargs):
         return Bool.must_not(Terms(self, terms, **kwargs))
 
+    def in_lookup(self, index, id, path, **kwargs):
+        return TermsLookup(self, index, id, path, **kwargs)
+
     def match(self, query, **kwargs):
         return Match(self, query, **kwargs)
 
@@ -1,6 +1,12 @@
+import asyncio
+import time
+from collections import deque
+from itertools import islice
+
 from elasticmagic.compiler import get_compiler_by_es_version
 
 from ...cluster import BaseCluster
+from ...util import iter_chunks
 from .index import AsyncIndex
 from .search import AsyncSearchQuery
 
@@ -11,11 +17,26 @@ class AsyncCluster(BaseCluster):
 
     async def _do_request(self, compiler, *args, **kwargs):
         compiled_query = compiler(*args, **kwargs)
-        api_method = compiled_query.api_method(self._client)
-        raw_res = await self._do_api_call(
-            api_method, compiled_query.params, compiled_query.body
+        return compiled_query.process_result(
+            await self._do_raw_request(compiled_query)
         )
-        return compiled_query.process_result(raw_res)
+
+    async def _do_raw_request(self, compiled_query):
+        api_method = compiled_query.api_method(self._client)
+        started_at = time.monotonic()
+        raw_res = error = None
+        try:
+            raw_res = await self._do_api_call(
+                api_method, compiled_query.params, compiled_query.body
+            )
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._log_slow_query(
+                api_method, compiled_query, started_at, raw_res, error=error
+            )
+        return raw_res
 
     async def _do_api_call(self, api_method, api_kwargs, body):
         if body is not None:
@@ -41,23 +62,60 @@ class AsyncCluster(BaseCluster):
             preference=None, refresh=None, version=None, version_type=None,
             **kwargs
     ):
-        return await self._do_request(
-            (await self.get_compiler()).compiled_get,
+        compiled_get = (await self.get_compiler()).compiled_get(
             doc_or_id, self._get_params(locals()), doc_cls=doc_cls
         )
+        cache_read, raw_doc = self._get_cached_doc(compiled_get)
+        if raw_doc is None:
+            raw_doc = await self._do_raw_request(compiled_get)
+            self._store_doc(cache_read, raw_doc)
+        return compiled_get.process_result(raw_doc)
 
     async def multi_get(
             self, docs_or_ids, index=None, doc_cls=None, doc_type=None,
             source=None, parent=None, routing=None, preference=None,
             realtime=None, refresh=None, **kwargs
     ):
-        return await self._do_request(
-            (await self.get_compiler()).compiled_multi_get,
+        compiled_multi_get = (await self.get_compiler()).compiled_multi_get(
             docs_or_ids, self._multi_get_params(locals()), doc_cls=doc_cls
         )
+        cache_read, cached_docs, missing_query = self._get_cached_docs(
+            compiled_multi_get
+        )
+        raw_res = None
+        if missing_query is not None:
+            raw_res = await self._do_raw_request(missing_query)
+        return compiled_multi_get.process_result(
+            self._merge_cached_docs(cache_read, cached_docs, raw_res)
+        )
 
     mget = multi_get
 
+    async def iter_multi_get(
+            self, docs_or_ids, chunk_size=1000, concurrency=4, **kwargs
+    ):
+        """Asynchronous version of
+        :meth:`elasticmagic.cluster.Cluster.iter_multi_get`.
+        At most ``concurrency`` chunks are requested at a time.
+        """
+        chunks = iter_chunks(docs_or_ids, chunk_size)
+        tasks = deque(
+            asyncio.ensure_future(self.multi_get(chunk, **kwargs))
+            for chunk in islice(chunks, concurrency)
+        )
+        try:
+            while tasks:
+                docs = await tasks.popleft()
+                for chunk in islice(chunks, 1):
+                    tasks.append(
+                        asyncio.ensure_future(self.multi_get(chunk, **kwargs))
+                    )
+                for doc in docs:
+                    yield doc
+        finally:
+            for task in tasks:
+                task.cancel()
+
     async def search(
             self, q, index=None, doc_type=None, routing=None, preference=None,
             timeout=None, search_type=None, query_cache=None,
@@ -157,29 +215,42 @@ class AsyncCluster(BaseCluster):
             version_type=None,
             **kwargs
     ):
-        return await self._do_request(
-            (await self.get_compiler()).compiled_delete,
+        compiled_delete = (await self.get_compiler()).compiled_delete(
             doc_or_id, self._delete_params(locals()), doc_cls=doc_cls
         )
+        try:
+            return compiled_delete.process_result(
+                await self._do_raw_request(compiled_delete)
+            )
+        finally:
+            self._invalidate_doc(compiled_delete)
 
     async def delete_by_query(
             self, q, index=None, doc_type=None,
             timeout=None, consistency=None, replication=None, routing=None,
             **kwargs
     ):
-        return await self._do_request(
-            (await self.get_compiler()).compiled_delete_by_query,
-            q, self._search_params(locals())
-        )
+        try:
+            return await self._do_request(
+                (await self.get_compiler()).compiled_delete_by_query,
+                q, self._search_params(locals())
+            )
+        finally:
+            self._invalidate_all_docs()
 
     async def bulk(
             self, actions, index=None, doc_type=None, refresh=None,
             timeout=None, consistency=None, replication=None, **kwargs
     ):
-        return await self._do_request(
-            (await self.get_compiler()).compiled_bulk,
+        compiled_bulk = (await self.get_compiler()).compiled_bulk(
             actions, self._bulk_params(locals())
         )
+        try:
+            return compiled_bulk.process_result(
+                await self._do_raw_request(compiled_bulk)
+            )
+        finally:
+            self._invalidate_bulk_docs(compiled_bulk)
 
     async def refresh(self, index=None, **kwargs):
         params = self._preprocess_params(locals())
@@ -32,6 +32,15 @@ class AsyncIndex(BaseIndex):
 
     mget = multi_get
 
+    async def iter_multi_get(
+            self, docs, chunk_size=1000, concurrency=4, **kwargs
+    ):
+        async for doc in self._cluster.iter_multi_get(
+                docs, index=self._name, chunk_size=chunk_size,
+                concurrency=concurrency, **kwargs
+        ):
+            yield doc
+
     async def search(
             self, q, doc_type=None, routing=None, preference=None,
             timeout=None, search_type=None, query_cache=None,
@@ -1,8 +1,14 @@
+import asyncio
+
 from ...search import BaseSearchQuery
 
 
 class AsyncSearchQuery(BaseSearchQuery):
     """Asynchronous version of the :class:`.SearchQuery`
+
+    Instance mappers can be coroutine functions. Use
+    ``await result.load_instances()`` before accessing instances
+    or iterate over the query with :meth:`.instances` enabled.
     """
 
     async def to_dict(self, compiler=None):
@@ -22,6 +28,67 @@ class AsyncSearchQuery(BaseSearchQuery):
         self._cached_result = await self._index_or_cluster.search(self)
         return self._cached_result
 
+    async def iter_composite(self, name):
+        """Asynchronous version of
+        :meth:`elasticmagic.search.SearchQuery.iter_composite`.
+        """
+        after = None
+        while True:
+            agg_result = (
+                await self._composite_page_query(name, after).get_result()
+            ).get_aggregation(name)
+            for bucket in agg_result:
+                yield bucket
+            after = agg_result.after_key
+            if not after or not agg_result.buckets:
+                break
+
+    async def get_partitioned_aggregation(
+            self, name, num_partitions, concurrency=4
+    ):
+        """Asynchronous version of
+        :meth:`elasticmagic.search.SearchQuery.get_partitioned_aggregation`.
+        Every partition is sent as a separate search request instead of
+        multi search, at most ``concurrency`` requests at a time.
+        """
+        results = await self._get_results(
+            self._partition_queries(name, num_partitions), concurrency
+        )
+        return self._merge_partitions(name, results)
+
+    async def get_result_by_terms(
+            self, field, terms, chunk_size=10000, concurrency=4
+    ):
+        """Asynchronous version of
+        :meth:`elasticmagic.search.SearchQuery.get_result_by_terms`.
+        Every chunk is sent as a separate search request instead of
+        multi search, at most ``concurrency`` requests at a time.
+        """
+        results = await self._get_results(
+            self._terms_chunk_queries(field, terms, chunk_size), concurrency
+        )
+        return self._merge_fan_out_results(await self.get_compiler(), results)
+
+    @staticmethod
+    async def _get_results(queries, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get_result(sq):
+            async with semaphore:
+                return await sq.get_result()
+
+        return await asyncio.gather(*[get_result(sq) for sq in queries])
+
+    async def fan_out(self, targets):
+        """Asynchronous version of
+        :meth:`elasticmagic.search.SearchQuery.fan_out`.
+        Targets are requested concurrently.
+        """
+        queries = self._fan_out_queries(targets)
+        results = await asyncio.gather(*[sq.get_result() for sq in queries])
+        compiler = await (queries[0] if queries else self).get_compiler()
+        return self._merge_fan_out_results(compiler, results)
+
     async def count(self):
         return (
             await self._index_or_cluster.count(self)
@@ -54,7 +121,10 @@ class AsyncSearchQuery(BaseSearchQuery):
         )
 
     async def _iter_result_async(self):
-        return self._iter_result(await self.get_result())
+        res = await self.get_result()
+        if self._iter_instances:
+            await res.load_instances()
+        return self._iter_result(res)
 
     def __await__(self):
         return self._iter_result_async().__await__()
@@ -1,4 +1,5 @@
 import datetime
+import functools
 import math
 from collections import defaultdict
 
@@ -6,6 +7,7 @@ import dateutil.parser
 
 from elasticmagic.types import instantiate
 from elasticmagic.types import Type
+from elasticmagic.util import cached_property
 
 
 TIME_ATTRS = {'hour', 'minute', 'second', 'microsecond', 'tzinfo'}
@@ -125,6 +127,16 @@ class SimpleCodec(BaseCodec):
         datetime.datetime: DateCodec,
     }
 
+    _compiled_types = ((), {})
+
+    @cached_property
+    def _value_codecs(self):
+        return {}
+
+    @cached_property
+    def _value_decoders(self):
+        return {}
+
     @staticmethod
     def _normalize_params(params):
         if hasattr(params, 'getall'):
@@ -163,33 +175,86 @@ class SimpleCodec(BaseCodec):
             es_type = es_type.sub_type
         return es_type, es_type.python_type
 
-    def decode_value(self, value, es_type=None):
-        if value is None or value == self.NULL_VAL:
-            return None
+    def _get_value_codec(self, python_type):
+        value_codec = self._value_codecs.get(python_type)
+        if value_codec is None:
+            value_codec = self.CODECS.get(python_type, StringCodec)()
+            self._value_codecs[python_type] = value_codec
+        return value_codec
+
+    def _get_value_decoder(self, es_type):
+        decoder = self._value_decoders.get(es_type)
+        if decoder is not None:
+            return decoder
+
+        null_val = self.NULL_VAL
+        type_obj, python_type = self._get_es_and_python_types(es_type)
+        decode = self._get_value_codec(python_type).decode
+
+        def decoder(value):
+            if value is None or value == null_val:
+                return None
+            return decode(value, es_type=type_obj)
+
+        # decoders for type instances are kept by _compile_types
+        if es_type is None or isinstance(es_type, type):
+            self._value_decoders[es_type] = decoder
+        return decoder
+
+    def _compile_types(self, types):
+        """Returns decoders by parameter names. Decoders of the last
+        passed types are kept as query filter passes the same types
+        on every call. Types are compared by their contents, so changing
+        the dictionary in place does not return stale decoders.
+        """
+        type_items = tuple(types.items())
+        compiled_type_items, decoders = self._compiled_types
+        if compiled_type_items != type_items:
+            decoders = {
+                name: self._get_value_decoder(es_type)
+                for name, es_type in type_items
+            }
+            self._compiled_types = (type_items, decoders)
+        return decoders
 
-        es_type, python_type = self._get_es_and_python_types(es_type)
-        value_codec = self.CODECS.get(python_type, StringCodec)()
-        return value_codec.decode(value, es_type=es_type)
+    def decode_value(self, value, es_type=None):
+        return self._get_value_decoder(es_type)(value)
 
     def decode(self, params, types=None):
         params = self._normalize_params(params)
         types = types or {}
+        if type(self).decode_value is SimpleCodec.decode_value:
+            decoders = self._compile_types(types)
+            default_decoder = self._get_value_decoder(None)
+        else:
+            decoders = {
+                name: functools.partial(self.decode_value, es_type=es_type)
+                for name, es_type in types.items()
+            }
+            default_decoder = self.decode_value
+
+        op_sep = self.OP_SEP
+        default_op = self.DEFAULT_OP
         decoded_params = {}
         for name, v in params.items():
-            name, _, op = name.partition(self.OP_SEP)
-            if not op:
-                op = self.DEFAULT_OP
-            es_type = types.get(name)
+            if op_sep in name:
+                name, _, op = name.partition(op_sep)
+                op = op or default_op
+            else:
+                op = default_op
+            decoder = decoders.get(name, default_decoder)
+            decoded_values = None
             for w in wrap_list(v):
                 try:
-                    decoded_value = self.decode_value(w, es_type=es_type)
-                    decoded_params \
-                        .setdefault(name, {}) \
-                        .setdefault(op, []) \
-                        .append(decoded_value)
+                    decoded_value = decoder(w)
                 except ValueError:
                     # just ignore values we cannot decode
-                    pass
+                    continue
+                if decoded_values is None:
+                    decoded_values = decoded_params \
+                        .setdefault(name, {}) \
+                        .setdefault(op, [])
+                decoded_values.append(decoded_value)
 
         return decoded_params
 
@@ -198,7 +263,7 @@ class SimpleCodec(BaseCodec):
             return self.NULL_VAL
 
         es_type, python_type = self._get_es_and_python_types(es_type)
-        value_codec = self.CODECS.get(python_type, StringCodec)()
+        value_codec = self._get_value_codec(python_type)
         return value_codec.encode(value, es_type=es_type)
 
     def encode(self, values, types=None):
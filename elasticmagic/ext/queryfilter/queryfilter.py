@@ -1,13 +1,17 @@
 import functools
+import json
 import logging
 import operator
 from math import ceil
-from itertools import chain
+from itertools import chain, compress
 
 from elasticmagic import agg
-from elasticmagic.cluster import MAX_RESULT_WINDOW
+from elasticmagic.cluster import MAX_RESULT_WINDOW, Cluster
+from elasticmagic.compiler import Compiler_7_0, get_compiler_by_es_version
 from elasticmagic.expression import Bool, MatchAll, Nested
+from elasticmagic.result import SearchResult
 from elasticmagic.types import Integer, instantiate
+from elasticmagic.util import cached_property
 
 from .codec import SimpleCodec
 
@@ -31,6 +35,149 @@ class UnboundFilter(object):
         return self.filter_cls(name, *self.args, **self.kwargs)
 
 
+def _get_known_compiler(cluster):
+    if cluster is None:
+        return None
+    if cluster._compiler:
+        return cluster._compiler
+    if cluster._es_version:
+        return get_compiler_by_es_version(cluster._es_version)
+    if isinstance(cluster, Cluster):
+        return cluster.get_compiler()
+    # an asynchronous cluster must be awaited to detect its version,
+    # facets are not cached until the version is known
+    return None
+
+
+def _get_cluster_hosts(cluster):
+    transport = getattr(cluster._client, 'transport', None)
+    return getattr(transport, 'hosts', None)
+
+
+class _QueryFilterPlan(object):
+    def __init__(self, filters):
+        self.filters = list(filters)
+        # filters that modify the search query themselves
+        self.query_mask = [
+            type(f)._apply_filter is not BaseFilter._apply_filter
+            for f in self.filters
+        ]
+        self.agg_mask = [
+            type(f)._apply_agg is not BaseFilter._apply_agg or
+            type(f)._get_aggs is not BaseFilter._get_aggs
+            for f in self.filters
+        ]
+        self.agg_filters = list(compress(self.filters, self.agg_mask))
+        self.agg_query_mask = [
+            type(f)._apply_agg is not BaseFilter._apply_agg
+            for f in self.agg_filters
+        ]
+        self.types = {}
+        for f in self.filters:
+            self.types.update(f._types)
+        # parameters that do not change facet counts
+        self.non_facet_params = set()
+        for f in self.filters:
+            if not f._affects_facets:
+                self.non_facet_params.add(f.alias)
+                self.non_facet_params.update(f._types)
+
+    def bind(self, filters):
+        """Returns the same plan for copies of the filters."""
+        plan = object.__new__(self.__class__)
+        plan.filters = filters
+        plan.query_mask = self.query_mask
+        plan.agg_mask = self.agg_mask
+        plan.agg_filters = list(compress(filters, self.agg_mask))
+        plan.agg_query_mask = self.agg_query_mask
+        plan.types = self.types
+        plan.non_facet_params = self.non_facet_params
+        return plan
+
+
+class _ResultProxy(object):
+    """Serves facet aggregations from separate results and everything else
+    from the original search result. Aggregations merged into shared ones
+    are found by their aliases.
+    """
+
+    def __init__(self, result, facet_results, agg_aliases=None):
+        self._result = result
+        self._facet_results = facet_results
+        self._agg_aliases = agg_aliases or {}
+
+    def get_aggregation(self, name):
+        name = self._agg_aliases.get(name, name)
+        for facet_result in self._facet_results:
+            if name in facet_result.aggregations:
+                return facet_result.aggregations[name]
+        return self._result.get_aggregation(name)
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+def _filter_agg_key(filter_agg, compile_expr):
+    expr = filter_agg.filter
+    if type(expr) is Bool and list(expr.params) == ['must']:
+        return tuple(map(compile_expr, expr.params['must']))
+    return (compile_expr(expr),)
+
+
+def _group_filter_aggs(aggs):
+    """Merges filter aggregations with equal filters into a single one.
+    Returns new aggregations and a mapping from names of the merged
+    aggregations to names of the shared ones.
+    """
+    # filters are compared by their compiled bodies, facets usually share
+    # the same filter objects so every object is compiled once
+    compiled_filters = {}
+
+    def compile_expr(expr):
+        compiled = compiled_filters.get(id(expr))
+        if compiled is None:
+            compiled = compiled_filters[id(expr)] = json.dumps(
+                expr.to_dict(compiler=Compiler_7_0),
+                sort_keys=True, default=repr,
+            )
+        return compiled
+
+    groups = {}
+    for agg_name, agg_expr in aggs.items():
+        if type(agg_expr) is agg.Filter and not agg_expr.params:
+            groups.setdefault(
+                _filter_agg_key(agg_expr, compile_expr), []
+            ).append(agg_name)
+
+    shared_aggs = {}
+    aliases = {}
+    for agg_names in groups.values():
+        if len(agg_names) < 2:
+            continue
+        shared_name = agg_names[0]
+        sub_aggs = dict(aggs[shared_name]._aggregations)
+        for agg_name in agg_names[1:]:
+            merged_sub_aggs = aggs[agg_name]._aggregations
+            if any(sub_name in sub_aggs for sub_name in merged_sub_aggs):
+                continue
+            sub_aggs.update(merged_sub_aggs)
+            aliases[agg_name] = shared_name
+        shared_aggs[shared_name] = agg.Filter(
+            aggs[shared_name].filter, aggs=sub_aggs
+        )
+
+    if not aliases:
+        return aggs, aliases
+    return (
+        {
+            agg_name: shared_aggs.get(agg_name, agg_expr)
+            for agg_name, agg_expr in aggs.items()
+            if agg_name not in aliases
+        },
+        aliases
+    )
+
+
 class QueryFilterMeta(type):
     def __init__(cls, name, bases, attrs):
         type.__init__(cls, name, bases, attrs)
@@ -51,14 +198,49 @@ class QueryFilterMeta(type):
 
 
 class QueryFilter(metaclass=QueryFilterMeta):
+    """Applies filters and facets from request parameters to a search query.
+
+    Query filter and its filters keep state of the request being processed,
+    so an instance must not be shared across requests. Create it once and
+    use :meth:`prepare` to get a copy for every request.
+
+    :param name: prefix of the aggregation names
+    :param codec: codec to decode request parameters
+    :param facet_cache: :class:`elasticmagic.cache.LRUCache` instance
+       to cache raw facet aggregations by the search query and the
+       parameters that affect facets. When the facets are found in the
+       cache the aggregations are not added to the search query at all:
+
+       .. code-block:: python
+
+          product_qf = ProductQueryFilter(
+              facet_cache=LRUCache(max_size=1000, ttl=300)
+          )
+
+       Facets of an asynchronous cluster are cached only when its compiler
+       is passed explicitly or the version of the cluster is already known.
+    :param facet_cache_namespace: identifies the cluster in facet cache keys,
+       by default hosts of the cluster client are used. When the hosts
+       cannot be found facets are not cached without the namespace
+    :param group_filter_aggs: put facets that are filtered the same way
+       into a single filter aggregation, so Elasticsearch calculates every
+       distinct filter only once
+    """
+
     NAME = 'qf'
 
     CONJ_OR = 'CONJ_OR'
     CONJ_AND = 'CONJ_AND'
 
-    def __init__(self, name=None, codec=None):
+    def __init__(
+            self, name=None, codec=None, facet_cache=None,
+            facet_cache_namespace=None, group_filter_aggs=False,
+    ):
         self._name = name or self.NAME
         self._codec = codec or SimpleCodec()
+        self._group_filter_aggs = group_filter_aggs
+        self._facet_cache = facet_cache
+        self._facet_cache_namespace = facet_cache_namespace
         self._filters = []
 
         self._params = {}
@@ -76,10 +258,11 @@ class QueryFilter(metaclass=QueryFilterMeta):
         return self._name
 
     def get_types(self):
-        types = {}
-        for filt in self._filters:
-            types.update(filt._types)
-        return types
+        return dict(self._plan.types)
+
+    @cached_property
+    def _plan(self):
+        return _QueryFilterPlan(self._filters)
 
     def _set_selected(self, name, value):
         self._state.setdefault(name, {})[value] = True
@@ -93,10 +276,50 @@ class QueryFilter(metaclass=QueryFilterMeta):
     def _value_data(self, name, value):
         return self._data.get(name, {}).get(value, {})
 
+    def prepare(self):
+        """Returns a copy of the query filter to process a single request.
+
+        Query filter keeps state of a request: applied parameters,
+        selected and found values. So a single instance cannot be used
+        concurrently. Instead create the query filter once and prepare
+        a copy for every request, it is much cheaper than creating
+        a new query filter:
+
+        .. code-block:: python
+
+           product_qf = ProductQueryFilter()
+
+           def search(params):
+               qf = product_qf.prepare()
+               sq = qf.apply(Product.search_query(), params)
+               qf.process_result(sq.get_result())
+               return qf
+
+        Filters of the copy share their definitions with the original.
+        """
+        qf = object.__new__(self.__class__)
+        qf.__dict__.update(self.__dict__)
+        qf._params = {}
+        qf._state = {}
+        qf._data = {}
+        qf._facet_aggs = {}
+        qf._facet_agg_aliases = {}
+        qf._facet_cache_key = None
+        qf._cached_facets = None
+        qf._filters = [f._copy(qf) for f in self._filters]
+        for f in qf._filters:
+            qf.__dict__[f.name] = f
+        qf._plan = self._plan.bind(qf._filters)
+        return qf
+
     def reset(self):
         self._params = {}
         self._state = {}
         self._data = {}
+        self._facet_aggs = {}
+        self._facet_agg_aliases = {}
+        self._facet_cache_key = None
+        self._cached_facets = None
         for filt in self._filters:
             filt._reset()
 
@@ -109,6 +332,7 @@ class QueryFilter(metaclass=QueryFilterMeta):
         filter.qf = self
         self._filters.append(filter)
         setattr(self, filter.name, filter)
+        self.__dict__.pop('_plan', None)
 
     def remove_filter(self, filter_name):
         if isinstance(getattr(self, filter_name, None), BaseFilter):
@@ -117,21 +341,216 @@ class QueryFilter(metaclass=QueryFilterMeta):
                 if f.name == filter_name:
                     break
             self._filters = self._filters[:ix] + self._filters[ix + 1:]
+            self.__dict__.pop('_plan', None)
+
+    def _get_facet_cache_key(self, search_query, params, plan):
+        index = search_query._index
+        cluster = search_query._cluster
+        if cluster is None and index is not None:
+            cluster = index.get_cluster()
+        compiler = _get_known_compiler(cluster)
+        if compiler is None:
+            return None
+        namespace = self._facet_cache_namespace
+        if namespace is None:
+            namespace = _get_cluster_hosts(cluster)
+            if namespace is None:
+                return None
+        facet_params = {
+            name: value for name, value in params.items()
+            if name not in plan.non_facet_params
+        }
+        return json.dumps(
+            [
+                '{}.{}'.format(type(self).__module__, type(self).__qualname__),
+                self._name,
+                namespace,
+                index.get_name() if index is not None else None,
+                compiler.compiled_query(search_query).body,
+                facet_params,
+            ],
+            sort_keys=True, default=repr,
+        )
 
     def apply(self, search_query, params):
-        self._params = self._codec.decode(params, self.get_types())
+        """Returns the search query with filters and facet aggregations
+        for the request ``params``.
+
+        Parameters and selected values are stored in the query filter and
+        its filters, so call it on a copy returned by :meth:`prepare`
+        when the query filter is shared across requests.
+        """
+        plan = self._plan
+        self._params = self._codec.decode(params, plan.types)
+        self._facet_aggs = {}
+        self._facet_agg_aliases = {}
+        self._facet_cache_key = None
+        self._cached_facets = None
+        if self._facet_cache is not None:
+            self._facet_cache_key = self._get_facet_cache_key(
+                search_query, self._params, plan
+            )
+            self._cached_facets = self._facet_cache.get(
+                self._facet_cache_key
+            )
 
-        # First filter query with all filters
-        for f in self._filters:
+        # First filter query with all filters, collected filters are added
+        # at once before a filter that modifies the query itself
+        filters = []
+        post_filters = []
+        for f, modifies_query in zip(plan.filters, plan.query_mask):
+            if not modifies_query:
+                f._add_filters(self._params, filters, post_filters)
+                continue
+            if filters or post_filters:
+                search_query = search_query._add_filters(
+                    filters, post_filters
+                )
+                filters = []
+                post_filters = []
             search_query = f._apply_filter(search_query, self._params)
+        if filters or post_filters:
+            search_query = search_query._add_filters(filters, post_filters)
+
+        # then collect aggregations of all filters and add them at once
+        post_filters = None
+        for f, modifies_query in zip(plan.agg_filters, plan.agg_query_mask):
+            if modifies_query:
+                search_query = self._apply_query_agg(f, search_query)
+                post_filters = None
+                continue
+            if post_filters is None:
+                post_filters = list(
+                    search_query.get_context().iter_post_filters_with_meta()
+                )
+            self._facet_aggs.update(f._get_aggs(post_filters))
+        if self._group_filter_aggs:
+            self._facet_aggs, self._facet_agg_aliases = _group_filter_aggs(
+                self._facet_aggs
+            )
+        if self._cached_facets is not None or not self._facet_aggs:
+            # cached facets only need aggregations to process results
+            return search_query
+        return search_query.aggregations(self._facet_aggs)
+
+    def _apply_query_agg(self, f, search_query):
+        # the filter gets the query with the facet aggregations added
+        # before it, aggregations it adds or replaces become facets
+        if self._facet_aggs:
+            search_query = search_query.aggregations(self._facet_aggs)
+        query_aggs = search_query._aggregations
+        search_query = f._apply_agg(search_query)
+        for agg_name, agg_expr in search_query._aggregations.items():
+            if query_aggs.get(agg_name) is not agg_expr:
+                self._facet_aggs[agg_name] = agg_expr
+        return search_query.aggs(None).aggs({
+            agg_name: agg_expr
+            for agg_name, agg_expr in search_query._aggregations.items()
+            if agg_name not in self._facet_aggs
+        })
 
-        # then add aggregations
-        for f in self._filters:
-            search_query = f._apply_agg(search_query)
-
-        return search_query
+    def split_queries(self, search_query, aggs_per_query=1):
+        """Splits the search query returned by :meth:`apply` into a query
+        for hits and queries with facet aggregations only.
+
+        Facets are calculated in parallel and a slow facet does not delay
+        the others. The queries can be sent with a single multi search
+        request and their results passed to :meth:`process_result`:
+
+        .. code-block:: python
+
+           sq = qf.apply(search_query, params)
+           queries = qf.split_queries(sq, aggs_per_query=2)
+           qf.process_result(
+               sq.get_cluster().multi_search(queries, raise_on_error=False)
+           )
+
+        With asyncio the queries can be executed concurrently:
+
+        .. code-block:: python
+
+           qf.process_result(
+               await asyncio.gather(*(q.get_result() for q in queries))
+           )
+
+        Facets of failed aggregation queries are just missing
+        in the processed result.
+
+        :param aggs_per_query: number of facet aggregations in a query
+        """
+        query_aggs = search_query._aggregations
+        facet_aggs = [
+            (agg_name, agg_expr)
+            for agg_name, agg_expr in self._facet_aggs.items()
+            if query_aggs.get(agg_name) is agg_expr
+        ]
+        hits_query = search_query.aggs(None)
+        other_aggs = {
+            agg_name: agg_expr
+            for agg_name, agg_expr in query_aggs.items()
+            if agg_name not in self._facet_aggs
+        }
+        if other_aggs:
+            hits_query = hits_query.aggs(other_aggs)
+
+        aggs_query = (
+            search_query
+            .aggs(None)
+            .limit(0)
+            .offset(None)
+            .order_by(None)
+        )
+        queries = [hits_query]
+        for i in range(0, len(facet_aggs), aggs_per_query):
+            queries.append(
+                aggs_query.aggs(dict(facet_aggs[i:i + aggs_per_query]))
+            )
+        return queries
+
+    def _get_facet_results(self, result, facet_results):
+        if self._cached_facets is not None:
+            return [
+                SearchResult(
+                    {'aggregations': self._cached_facets},
+                    aggregations=self._facet_aggs,
+                    doc_cls_map=result._doc_cls_map,
+                )
+            ]
+
+        succeeded_results = [r for r in facet_results if not r.error]
+        if (
+                self._facet_cache_key is not None and
+                self._facet_aggs and
+                not result.error and
+                len(succeeded_results) == len(facet_results)
+        ):
+            raw_aggs = {}
+            for r in [result] + facet_results:
+                raw_aggs.update(r.raw.get('aggregations') or {})
+            self._facet_cache.set(
+                self._facet_cache_key,
+                {
+                    agg_name: raw_aggs[agg_name]
+                    for agg_name in self._facet_aggs
+                    if agg_name in raw_aggs
+                }
+            )
+        return succeeded_results
 
     def process_result(self, result):
+        """Processes a search result of the query returned by :meth:`apply`
+        or a list of results of the queries from :meth:`split_queries`.
+        """
+        if isinstance(result, (list, tuple)):
+            result, facet_results = result[0], list(result[1:])
+        else:
+            facet_results = []
+        facet_results = self._get_facet_results(result, facet_results)
+        if facet_results or self._facet_agg_aliases:
+            result = _ResultProxy(
+                result, facet_results, self._facet_agg_aliases
+            )
+
         filter_results = {}
         for f in self._filters:
             filter_results[f.name] = f._process_result(
@@ -166,6 +585,10 @@ class BaseFilterResult(object):
 
 
 class BaseFilter(object):
+    # whether parameters of the filter change facet counts,
+    # see facet cache of the QueryFilter
+    _affects_facets = True
+
     def __new__(cls, *args, **kwargs):
         if not args or not isinstance(args[0], str):
             return UnboundFilter(cls, args, kwargs)
@@ -179,6 +602,13 @@ class BaseFilter(object):
     def _reset(self):
         pass
 
+    def _copy(self, qf):
+        filt = object.__new__(self.__class__)
+        filt.__dict__.update(self.__dict__)
+        filt.qf = qf
+        filt._reset()
+        return filt
+
     @property
     def _types(self):
         return {}
@@ -191,11 +621,44 @@ class BaseFilter(object):
                 active_filters.append(filt)
         return active_filters
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
+        """Appends ``(expression, meta)`` pairs to ``filters`` and
+        ``post_filters`` lists. Query filter collects filters of all the
+        filters and adds them to the search query at once.
+        """
         raise NotImplementedError()
 
+    def _apply_filter(self, search_query, params):
+        """Returns the search query filtered by the filter.
+        Override it when the filter modifies the search query in another way
+        than adding filters, it is called in turn with the other filters.
+        """
+        filters = []
+        post_filters = []
+        self._add_filters(params, filters, post_filters)
+        if not filters and not post_filters:
+            return search_query
+        return search_query._add_filters(filters, post_filters)
+
+    def _get_aggs(self, post_filters):
+        """Returns a dictionary with facet aggregations of the filter.
+
+        :param post_filters: list of ``(expression, meta)`` pairs of post
+           filters of the search query, it is built once for all the filters
+        """
+        return {}
+
     def _apply_agg(self, search_query):
-        return search_query
+        """Returns the search query with facet aggregations of the filter.
+        Override it when the filter needs the search query itself, then
+        it gets the query with facet aggregations of the previous filters.
+        """
+        aggs = self._get_aggs(
+            list(search_query.get_context().iter_post_filters_with_meta())
+        )
+        if not aggs:
+            return search_query
+        return search_query.aggregations(aggs)
 
     def _process_result(self, result, params):
         return BaseFilterResult(self.name, self.alias)
@@ -257,11 +720,10 @@ class SimpleFilter(FieldFilter):
         else:
             return Bool.should(*(self.field == v for v in values))
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         expr = self._get_expression(params)
-        if expr is None:
-            return search_query
-        return search_query.filter(expr, meta={'tags': {self.name}})
+        if expr is not None:
+            filters.append((expr, {'tags': {self.name}}))
 
 
 class FacetFilter(SimpleFilter):
@@ -298,18 +760,17 @@ class FacetFilter(SimpleFilter):
     def _filter_agg_name(self):
         return '{}.{}.filter'.format(self.qf._name, self.name)
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         expr = self._get_expression(params)
-        if expr is None:
-            return search_query
-        return search_query.post_filter(expr, meta={'tags': {self.name}})
+        if expr is not None:
+            post_filters.append((expr, {'tags': {self.name}}))
 
-    def _apply_agg(self, search_query):
+    def _get_aggs(self, post_filters):
         exclude_tags = {self.qf._name}
         if self._conj_operator == QueryFilter.CONJ_OR:
             exclude_tags.add(self.name)
         filters = self._get_agg_filters(
-            search_query.get_context().iter_post_filters_with_meta(),
+            post_filters,
             exclude_tags
         )
         additional_filters = self._filters or []
@@ -327,7 +788,7 @@ class FacetFilter(SimpleFilter):
             }
         else:
             aggs = {self._agg_name: terms_agg}
-        return search_query.aggregations(**aggs)
+        return aggs
 
     def _process_result(self, result, params):
         values = self._get_values_from_params(params.get(self.alias, {}))
@@ -477,25 +938,23 @@ class BinaryFilter(BaseFilter):
         self.selected = False
         self.count = 0
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         self.selected = self._parameters_condition(params)
-        if not self.selected:
-            return search_query
-        return search_query.filter(self._condition)
+        if self.selected:
+            filters.append((self._condition, None))
 
     @property
     def _agg_name(self):
         return '{}.{}'.format(self.qf._name, self.name)
 
-    def _apply_agg(self, search_query):
+    def _get_aggs(self, post_filters):
         if self.selected:
-            return search_query
-        agg_filters = search_query.get_context().post_filters
-        return search_query.aggregations(
-            **{
-                self._agg_name: agg.Filter(
-                    Bool.must(*chain(agg_filters, [self._condition])))
-            })
+            return {}
+        agg_filters = [filt for filt, _ in post_filters]
+        return {
+            self._agg_name: agg.Filter(
+                Bool.must(*chain(agg_filters, [self._condition])))
+        }
 
     def _process_result(self, result, params):
         if not self.selected:
@@ -510,8 +969,8 @@ class Facet(FacetFilter):
     Non-filtering version of facet filter
     """
 
-    def _apply_filter(self, search_query, params):
-        return search_query
+    def _add_filters(self, params, filters, post_filters):
+        pass
 
 
 class FacetValue(BaseFilterValue):
@@ -616,21 +1075,21 @@ class RangeFilter(FieldFilter):
         if to_values:
             return to_values[-1]
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         params = params.get(self.alias) or {}
         self.from_value = self._get_from_value(params)
         self.to_value = self._get_to_value(params)
         if self.from_value is None and self.to_value is None:
-            return search_query
+            return
 
-        return search_query.post_filter(
+        post_filters.append((
             self.field.range(gte=self.from_value, lte=self.to_value),
-            meta={'tags': {self.name}}
-        )
+            {'tags': {self.name}}
+        ))
 
-    def _apply_agg(self, search_query):
+    def _get_aggs(self, post_filters):
         filters = self._get_agg_filters(
-            search_query.get_context().iter_post_filters_with_meta(),
+            post_filters,
             {self.qf._name, self.name}
         )
 
@@ -654,7 +1113,7 @@ class RangeFilter(FieldFilter):
             else:
                 aggs.update(stat_aggs)
 
-        return search_query.aggregations(**aggs)
+        return aggs
 
     def _process_result(self, result, params):
         if result.get_aggregation(self._filter_agg_name):
@@ -717,6 +1176,12 @@ class SimpleQueryFilter(BaseFilter):
         self._conj_operator = kwargs.pop('conj_operator', QueryFilter.CONJ_OR)
         self.default = kwargs.pop('default', None)
 
+    def _copy(self, qf):
+        filt = super(SimpleQueryFilter, self)._copy(qf)
+        filt._values = [fv.bind(filt) for fv in self._values]
+        filt._values_map = {fv.value: fv for fv in filt._values}
+        return filt
+
     @property
     def all_values(self):
         return self._values
@@ -750,11 +1215,10 @@ class SimpleQueryFilter(BaseFilter):
         else:
             return Bool.should(*expressions)
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         expr = self._get_expression(params)
-        if expr is None:
-            return search_query
-        return search_query.filter(expr, meta={'tags': {self.name}})
+        if expr is not None:
+            filters.append((expr, {'tags': {self.name}}))
 
 
 class FacetQueryValue(BaseFilterValue):
@@ -835,18 +1299,17 @@ class FacetQueryFilter(SimpleQueryFilter):
     def _make_agg_name(self, value):
         return '{}.{}:{}'.format(self.qf._name, self.name, value)
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         expr = self._get_expression(params)
-        if expr is None:
-            return search_query
-        return search_query.post_filter(expr, meta={'tags': {self.name}})
+        if expr is not None:
+            post_filters.append((expr, {'tags': {self.name}}))
 
-    def _apply_agg(self, search_query):
+    def _get_aggs(self, post_filters):
         exclude_tags = {self.qf._name}
         if self._conj_operator == QueryFilter.CONJ_OR:
             exclude_tags.add(self.name)
         filters = self._get_agg_filters(
-            search_query.get_context().iter_post_filters_with_meta(),
+            post_filters,
             exclude_tags
         )
 
@@ -865,7 +1328,7 @@ class FacetQueryFilter(SimpleQueryFilter):
         else:
             aggs = filter_aggs
 
-        return search_query.aggregations(**aggs)
+        return aggs
 
     def _process_result(self, result, params):
         values = params.get(self.alias, {}).get('exact', [])
@@ -983,6 +1446,8 @@ class OrderingValue(BaseFilterValue):
 
 
 class OrderingFilter(BaseFilter):
+    _affects_facets = False
+
     def __init__(self, name, *values, **kwargs):
         super(OrderingFilter, self).__init__(
             name, alias=kwargs.pop('alias', None)
@@ -994,6 +1459,13 @@ class OrderingFilter(BaseFilter):
         self._values_map = {fv.value: fv for fv in self.values}
         self.selected_value = None
 
+    def _copy(self, qf):
+        filt = super(OrderingFilter, self)._copy(qf)
+        filt.values = [fv.bind(filt) for fv in self.values]
+        filt._values_map = {fv.value: fv for fv in filt.values}
+        filt.default_value = filt._values_map[self.default_value.value]
+        return filt
+
     def get_value(self, value):
         for ordering_value in self.values:
             if ordering_value.value == value:
@@ -1068,6 +1540,8 @@ class OrderingValueResult(object):
 
 
 class PageFilter(BaseFilter):
+    _affects_facets = False
+
     DEFAULT_PER_PAGE_PARAM = 'per_page'
     DEFAULT_PER_PAGE = 10
     DEFAULT_MAX_ITEMS = MAX_RESULT_WINDOW
@@ -1233,11 +1707,10 @@ class NestedFacetFilter(BaseFilter):
             query=Bool.must(*expressions)
         )
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         expr = self._get_expression(params)
-        if expr is None:
-            return search_query
-        return search_query.post_filter(expr, meta={'tags': {self.name}})
+        if expr is not None:
+            post_filters.append((expr, {'tags': {self.name}}))
 
     @property
     def _agg_name(self):
@@ -1255,13 +1728,13 @@ class NestedFacetFilter(BaseFilter):
     def _filter_value_agg_name(self):
         return '{}.{}.value'.format(self.qf._name, self.name)
 
-    def _apply_agg(self, search_query):
+    def _get_aggs(self, post_filters):
         exclude_tags = {self.qf._name}
         if self._conj_operator == QueryFilter.CONJ_OR:
             exclude_tags.add(self.name)
 
         filters = self._get_agg_filters(
-            search_query.get_context().iter_post_filters_with_meta(),
+            post_filters,
             exclude_tags
         )
 
@@ -1287,7 +1760,7 @@ class NestedFacetFilter(BaseFilter):
         else:
             aggs = {self._agg_name: terms_agg}
 
-        return search_query.aggregations(**aggs)
+        return aggs
 
     def _process_result(self, result, params):
         values = self._get_values_from_params(params.get(self.alias, {}))
@@ -1421,12 +1894,12 @@ class NestedRangeFilter(BaseFilter):
         to_values = params.get('lte')
         return to_values[0] if to_values else None
 
-    def _apply_filter(self, search_query, params):
+    def _add_filters(self, params, filters, post_filters):
         params = params.get(self.alias) or {}
         self.from_value = self._get_from_value(params)
         self.to_value = self._get_to_value(params)
         if self.from_value is None and self.to_value is None:
-            return search_query
+            return
 
         expr = Nested(
             path=self.path,
@@ -1435,11 +1908,11 @@ class NestedRangeFilter(BaseFilter):
                 self.value_field.range(gte=self.from_value, lte=self.to_value),
             )
         )
-        return search_query.post_filter(expr, meta={'tags': {self.name}})
+        post_filters.append((expr, {'tags': {self.name}}))
 
-    def _apply_agg(self, search_query):
+    def _get_aggs(self, post_filters):
         filters = self._get_agg_filters(
-            search_query.get_context().iter_post_filters_with_meta(),
+            post_filters,
             {self.qf._name, self.name}
         )
 
@@ -1484,7 +1957,7 @@ class NestedRangeFilter(BaseFilter):
             else:
                 aggs.update(stat_aggs)
 
-        return search_query.aggregations(**aggs)
+        return aggs
 
     def _process_result(self, result, params):
         if result.get_aggregation(self._filter_agg_name):
@@ -78,6 +78,14 @@ class Index(BaseIndex):
 
     mget = multi_get
 
+    def iter_multi_get(
+            self, docs, chunk_size=1000, concurrency=4, **kwargs
+    ):
+        return self._cluster.iter_multi_get(
+            docs, index=self._name, chunk_size=chunk_size,
+            concurrency=concurrency, **kwargs
+        )
+
     def search(
             self, q, doc_type=None, routing=None, preference=None,
             timeout=None, search_type=None, query_cache=None,
@@ -1,3 +1,9 @@
+import heapq
+from collections import OrderedDict
+from itertools import islice
+
+from .agg import get_doc_instance_mapper
+from .agg import populate_instances, populate_instances_async
 from .document import DynamicDocument
 from .document import get_doc_type_for_hit
 
@@ -26,6 +32,9 @@ class SearchResult(Result):
             self._instance_mappers = {
                 doc_cls: instance_mapper for doc_cls in doc_classes
             }
+        for mapper in OrderedDict.fromkeys(self._instance_mappers.values()):
+            if mapper:
+                self._mapper_registry.setdefault(mapper, []).append(self)
 
         self.error = raw_result.get('error')
         self.took = raw_result.get('took')
@@ -55,6 +64,9 @@ class SearchResult(Result):
 
         self.scroll_id = raw_result.get('_scroll_id')
 
+        raw_profile = raw_result.get('profile')
+        self.profile = SearchProfile(raw_profile) if raw_profile else None
+
     def __iter__(self):
         return iter(self.hits)
 
@@ -64,13 +76,331 @@ class SearchResult(Result):
     def get_aggregation(self, name):
         return self.aggregations.get(name)
 
+    def resolve_instances(self):
+        """Populates instances of all hits, buckets and top hits
+        of the result.
+
+        Every instance mapper is called only once with ids collected
+        across the whole result.
+        """
+        populate_instances(self._mapper_registry)
+
+    async def load_instances(self):
+        """Asynchronous version of :meth:`resolve_instances`.
+
+        Instance mappers can be coroutine functions, different mappers
+        are called concurrently.
+        """
+        await populate_instances_async(self._mapper_registry)
+
+    def _iter_instance_targets(self, instance_mapper):
+        for doc in self.hits:
+            if get_doc_instance_mapper(
+                    self._instance_mappers, doc.__class__
+            ) is instance_mapper:
+                yield doc, doc._id
+
     def _populate_instances(self, doc_cls):
-        docs = [doc for doc in self.hits if isinstance(doc, doc_cls)]
-        instances = self._instance_mappers.get(doc_cls)(
-            [doc._id for doc in docs]
+        self.resolve_instances()
+        for doc in self.hits:
+            doc.__dict__.setdefault('instance', None)
+
+
+class _HitSortKey(object):
+    __slots__ = ('values', 'reverse')
+
+    def __init__(self, values, reverse):
+        self.values = values
+        self.reverse = reverse
+
+    def __lt__(self, other):
+        for value, other_value, reverse in zip(
+                self.values, other.values, self.reverse
+        ):
+            if value == other_value:
+                continue
+            # missing values are always sorted last
+            if value is None:
+                return False
+            if other_value is None:
+                return True
+            if reverse:
+                return value > other_value
+            return value < other_value
+        return False
+
+
+def _get_sort_reverse(sort):
+    if isinstance(sort, (str, dict)):
+        sort = [sort]
+    reverse = []
+    for sort_item in sort:
+        if isinstance(sort_item, dict):
+            (name, order), = sort_item.items()
+            if isinstance(order, dict):
+                order = order.get('order')
+        else:
+            name, order = sort_item, None
+        if order is None:
+            order = 'desc' if name == '_score' else 'asc'
+        reverse.append(order == 'desc')
+    return reverse
+
+
+def _merge_totals(totals):
+    value = 0
+    relation = None
+    for total in totals:
+        if isinstance(total, dict):
+            value += total['value']
+            if relation != 'gte':
+                relation = total.get('relation', 'eq')
+        elif total is not None:
+            value += total
+    if relation is not None:
+        return {'value': value, 'relation': relation}
+    return value
+
+
+def merge_raw_search_results(
+        raw_results, aggregations=None, sort=None, offset=0, limit=None,
+):
+    """Merges raw results of the same search query executed on different
+    indices or clusters.
+
+    Hits are merged by sort values when ``sort`` (a compiled sort clause)
+    is passed or by score otherwise. Every raw result must be sorted and
+    contain at least ``offset + limit`` hits. Totals are summed, only
+    aggregations that support merging can be passed.
+    """
+    if sort:
+        reverse = _get_sort_reverse(sort)
+
+        def sort_key(hit):
+            return _HitSortKey(hit.get('sort') or (), reverse)
+    else:
+        def sort_key(hit):
+            return _HitSortKey((hit.get('_score'),), (True,))
+
+    raw_hits = [raw.get('hits') or {} for raw in raw_results]
+    hits = heapq.merge(
+        *[h.get('hits', []) for h in raw_hits], key=sort_key
+    )
+    stop = offset + limit if limit is not None else None
+    max_scores = [
+        h['max_score'] for h in raw_hits if h.get('max_score') is not None
+    ]
+    merged = {
+        'took': max([raw.get('took') or 0 for raw in raw_results] or [0]),
+        'timed_out': any(raw.get('timed_out') for raw in raw_results),
+        'hits': {
+            'total': _merge_totals(h.get('total') for h in raw_hits),
+            'max_score': max(max_scores) if max_scores else None,
+            'hits': list(islice(hits, offset, stop)),
+        },
+    }
+
+    shards = {}
+    for raw in raw_results:
+        for key, value in (raw.get('_shards') or {}).items():
+            if isinstance(value, int):
+                shards[key] = shards.get(key, 0) + value
+    if shards:
+        merged['_shards'] = shards
+
+    if aggregations:
+        merged['aggregations'] = {
+            agg_name: agg_expr.merge_raw_results([
+                raw.get('aggregations', {}).get(agg_name, {})
+                for raw in raw_results
+            ])
+            for agg_name, agg_expr in aggregations.items()
+        }
+    return merged
+
+
+class ProfileTiming(object):
+    """Timing node of a profiled query, collector or aggregation tree."""
+
+    def __init__(self, raw, shard=None):
+        self.raw = raw
+        self.shard = shard
+        self.type = raw.get('type')
+        self.name = raw.get('name')
+        self.description = raw.get('description')
+        self.reason = raw.get('reason')
+        self.time_in_nanos = raw.get('time_in_nanos') or 0
+        self.breakdown = raw.get('breakdown') or {}
+        self.children = [
+            self.__class__(child, shard=shard)
+            for child in raw.get('children') or []
+        ]
+
+    def __repr__(self):
+        return '<{} {} {}ns>'.format(
+            self.__class__.__name__,
+            self.type or self.name,
+            self.time_in_nanos,
+        )
+
+    @property
+    def time_in_millis(self):
+        return self.time_in_nanos / 1000000.0
+
+    @property
+    def self_time_in_nanos(self):
+        """Time spent in this node excluding its children."""
+        return max(
+            self.time_in_nanos - sum(c.time_in_nanos for c in self.children),
+            0
         )
-        for doc in docs:
-            doc.__dict__['instance'] = instances.get(doc._id)
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+
+class QueryProfile(ProfileTiming):
+    pass
+
+
+class CollectorProfile(ProfileTiming):
+    pass
+
+
+class AggregationProfile(ProfileTiming):
+    pass
+
+
+class ShardProfile(object):
+    def __init__(self, raw):
+        self.raw = raw
+        self.id = raw.get('id')
+        self.node_id, self.index, self.shard_id = self._parse_id(self.id)
+
+        self.queries = []
+        self.collectors = []
+        self.rewrite_time = 0
+        for search in raw.get('searches') or []:
+            self.queries.extend(
+                QueryProfile(q, shard=self) for q in search.get('query') or []
+            )
+            self.collectors.extend(
+                CollectorProfile(c, shard=self)
+                for c in search.get('collector') or []
+            )
+            self.rewrite_time += search.get('rewrite_time') or 0
+        self.aggregations = [
+            AggregationProfile(a, shard=self)
+            for a in raw.get('aggregations') or []
+        ]
+
+    @staticmethod
+    def _parse_id(shard_id):
+        # shard id looks like: [node_id][index][shard]
+        if not shard_id or not shard_id.startswith('['):
+            return None, None, None
+        parts = shard_id[1:-1].split('][')
+        if len(parts) != 3:
+            return None, None, None
+        node_id, index, shard = parts
+        try:
+            shard = int(shard)
+        except ValueError:
+            pass
+        return node_id, index, shard
+
+    @property
+    def query_time_in_nanos(self):
+        return sum(q.time_in_nanos for q in self.queries)
+
+    @property
+    def collector_time_in_nanos(self):
+        return sum(c.time_in_nanos for c in self.collectors)
+
+    @property
+    def aggregation_time_in_nanos(self):
+        return sum(a.time_in_nanos for a in self.aggregations)
+
+
+class SearchProfile(object):
+    """Parsed ``profile`` section of a search response.
+
+    Enable it with :meth:`elasticmagic.search.SearchQuery.with_profile`.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.shards = [ShardProfile(s) for s in raw.get('shards') or []]
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    @property
+    def query_time_in_nanos(self):
+        return sum(s.query_time_in_nanos for s in self.shards)
+
+    @property
+    def collector_time_in_nanos(self):
+        return sum(s.collector_time_in_nanos for s in self.shards)
+
+    @property
+    def aggregation_time_in_nanos(self):
+        return sum(s.aggregation_time_in_nanos for s in self.shards)
+
+    def iter_queries(self):
+        """Iterates over all query clauses of all shards."""
+        for shard in self.shards:
+            for query in shard.queries:
+                for node in query.walk():
+                    yield node
+
+    def iter_aggregations(self):
+        for shard in self.shards:
+            for agg in shard.aggregations:
+                for node in agg.walk():
+                    yield node
+
+    def get_slowest_queries(self, n=10):
+        """Returns ``n`` query clauses with the largest self time."""
+        return sorted(
+            self.iter_queries(),
+            key=lambda q: q.self_time_in_nanos,
+            reverse=True,
+        )[:n]
+
+    def get_slowest_aggregations(self, n=10):
+        return sorted(
+            self.iter_aggregations(),
+            key=lambda a: a.self_time_in_nanos,
+            reverse=True,
+        )[:n]
+
+    @property
+    def slowest_query(self):
+        slowest = self.get_slowest_queries(1)
+        return slowest[0] if slowest else None
+
+    def summary(self):
+        """Returns a dict with timings per shard suitable for logging."""
+        return {
+            'shards': [
+                {
+                    'id': shard.id,
+                    'query_time_in_nanos': shard.query_time_in_nanos,
+                    'rewrite_time': shard.rewrite_time,
+                    'collector_time_in_nanos': shard.collector_time_in_nanos,
+                    'aggregation_time_in_nanos':
+                        shard.aggregation_time_in_nanos,
+                }
+                for shard in self.shards
+            ],
+            'query_time_in_nanos': self.query_time_in_nanos,
+            'collector_time_in_nanos': self.collector_time_in_nanos,
+            'aggregation_time_in_nanos': self.aggregation_time_in_nanos,
+        }
 
 
 class CountResult(Result):
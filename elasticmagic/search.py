@@ -8,10 +8,17 @@ import warnings
 from abc import ABCMeta
 from collections import namedtuple, OrderedDict
 from collections.abc import Iterable
-
-from .util import _with_clone
+from concurrent.futures import ThreadPoolExecutor
+
+from .agg import Composite, Terms as TermsAgg
+from .attribute import AttributedField
+from .document import DocumentMeta
+from .index import BaseIndex
+from .result import merge_raw_search_results
+from .util import _with_clone, cached_property
 from .util import merge_params, collect_doc_classes
-from .expression import Params, Source, Highlight, Rescore, Script
+from .expression import Field, Params, Source, Highlight, Rescore, Script
+from .expression import Terms
 
 __all__ = [
     'BaseSearchQuery', 'SearchQuery', 'SearchQueryContext',
@@ -21,6 +28,18 @@ __all__ = [
 
 _FunctionScore = namedtuple('_FunctionScore', ['functions', 'params'])
 
+_NOT_SET = object()
+
+
+def _get_docvalue_field_name(field):
+    if isinstance(field, AttributedField):
+        return field.get_field_name()
+    if isinstance(field, Field):
+        return field.get_name()
+    if isinstance(field, dict):
+        return field.get('field')
+    return field
+
 
 class FunctionScoreSettings(object):
     def __init__(
@@ -76,11 +95,14 @@ class BaseSearchQuery(metaclass=ABCMeta):
     _script_fields = Params()
     _track_total_hits = None
     _search_after = None
+    _profile = False
 
     _cluster = None
     _index = None
     _doc_cls = None
     _doc_type = None
+    # attributes set by only() with their previous values
+    _projection = None
 
     _search_params = Params()
 
@@ -177,6 +199,122 @@ class BaseSearchQuery(metaclass=ABCMeta):
         else:
             self._source = Source(fields, **kwargs)
 
+    @_with_clone
+    def only(self, *fields, docvalues=False):
+        """Retrieves only specified fields of the document's ``_source`` and
+        hydrates hits into lightweight projections of document classes, see
+        :meth:`elasticmagic.document.Document.get_projection`.
+
+        :param \\*fields: field expressions or document classes, a document
+           class means all its fields. ``None`` cancels the projection.
+
+        :param docvalues: disables ``_source`` and retrieves the fields as
+           ``docvalue_fields`` instead, they are added to the docvalue
+           fields that are already requested. Documents are populated
+           straight from hit fields, multi-valued fields are populated only
+           for fields of the :class:`elasticmagic.types.List` type. Fields
+           of sub-documents are not supported.
+
+        Projections replace document classes set by :meth:`with_document`,
+        they are restored when the projection is cancelled.
+
+        Example:
+
+        .. testcode:: only
+
+           from elasticmagic import Document, Field
+           from elasticmagic.types import Float, String
+
+           class ProductDocument(Document):
+               __doc_type__ = 'product'
+
+               name = Field(String)
+               price = Field(Float)
+               description = Field(String)
+
+           search_query = SearchQuery().only(
+               ProductDocument.name, ProductDocument.price
+           )
+
+        .. testcode:: only
+
+           assert search_query.to_dict(Compiler_7_0) == {'_source': ['name', 'price']}
+
+        .. testcode:: only
+
+           search_query = SearchQuery().only(
+               ProductDocument.name, ProductDocument.price, docvalues=True
+           )
+
+        .. testcode:: only
+
+           assert search_query.to_dict(Compiler_7_0) == {
+               '_source': False, 'docvalue_fields': ['name', 'price']
+           }
+        """  # noqa:E501
+        self._reset_projection()
+        if len(fields) == 1 and fields[0] is None:
+            return
+
+        projected_fields = OrderedDict()
+        source_fields = []
+        for field in fields:
+            if isinstance(field, DocumentMeta):
+                projected_fields[field] = \
+                    list(field.user_fields.values()) if docvalues else None
+                source_fields.extend(field.user_fields.values())
+                source_fields.extend(field.dynamic_fields.values())
+            elif isinstance(field, AttributedField):
+                doc_cls, = field._collect_doc_classes()
+                doc_fields = projected_fields.setdefault(doc_cls, [])
+                if doc_fields is not None:
+                    doc_fields.append(field)
+                source_fields.append(field)
+            else:
+                raise TypeError(
+                    'Expected document field or document class, '
+                    'got: {!r}'.format(field)
+                )
+
+        doc_classes = tuple(
+            doc_cls if doc_fields is None
+            else doc_cls.get_projection(*doc_fields, docvalues=docvalues)
+            for doc_cls, doc_fields in projected_fields.items()
+        )
+        projection = {
+            '_doc_cls': doc_classes[0] if len(doc_classes) == 1
+            else doc_classes,
+        }
+        if docvalues:
+            requested_names = set(
+                map(_get_docvalue_field_name, self._docvalue_fields)
+            )
+            projection['_source'] = Source(False)
+            projection['_docvalue_fields'] = self._docvalue_fields + tuple(
+                field for field in source_fields
+                if _get_docvalue_field_name(field) not in requested_names
+            )
+        else:
+            projection['_source'] = Source(source_fields)
+        self._projection = {
+            attr_name: (self.__dict__.get(attr_name, _NOT_SET), value)
+            for attr_name, value in projection.items()
+        }
+        self.__dict__.update(projection)
+
+    def _reset_projection(self):
+        # attributes changed after the projection was applied are kept
+        for attr_name, (prev_value, value) in (
+                self._projection or {}
+        ).items():
+            if self.__dict__.get(attr_name) is not value:
+                continue
+            if prev_value is _NOT_SET:
+                del self.__dict__[attr_name]
+            else:
+                self.__dict__[attr_name] = prev_value
+        self.__dict__.pop('_projection', None)
+
     @_with_clone
     def stored_fields(self, *fields):
         """Allows to load fields that marked as ``store: true``.
@@ -378,6 +516,18 @@ class BaseSearchQuery(metaclass=ABCMeta):
             self._post_filters_meta = \
                 self._post_filters_meta + (meta,) * len(filters)
 
+    @_with_clone
+    def _add_filters(self, filters, post_filters):
+        # adds ``(filter, meta)`` pairs with different meta at once
+        if filters:
+            exprs, metas = zip(*filters)
+            self._filters = self._filters + exprs
+            self._filters_meta = self._filters_meta + metas
+        if post_filters:
+            exprs, metas = zip(*post_filters)
+            self._post_filters = self._post_filters + exprs
+            self._post_filters_meta = self._post_filters_meta + metas
+
     @_with_clone
     def order_by(self, *orders):
         """Apply sorting criterion to the search query.
@@ -698,6 +848,25 @@ class BaseSearchQuery(metaclass=ABCMeta):
     def with_track_total_hits(self, track_total_hits):
         self._track_total_hits = track_total_hits
 
+    @_with_clone
+    def with_profile(self, profile=True):
+        """Enables profiling of the search request. Parsed profile will be
+        available as :attr:`elasticmagic.result.SearchResult.profile`.
+
+        .. testcode:: with_profile
+
+           search_query = SearchQuery().with_profile()
+
+        .. testcode:: with_profile
+
+           assert search_query.to_dict(Compiler_7_0) == {'profile': True}
+        """
+        if not profile:
+            if '_profile' in self.__dict__:
+                del self._profile
+        else:
+            self._profile = True
+
     def with_routing(self, routing):
         return self.with_search_params(routing=routing)
 
@@ -734,26 +903,24 @@ class BaseSearchQuery(metaclass=ABCMeta):
             else:
                 self._search_params = search_params
 
+    def _get_doc_classes_sources(self):
+        return [
+            self._q,
+            self._source,
+            self._fields,
+            self._filters,
+            self._post_filters,
+            tuple(fs.functions for fs in self._function_scores.values()),
+            tuple(self._aggregations.values()),
+            self._order_by,
+            self._rescores,
+            self._highlight,
+            self._ext,
+        ]
+
     def _collect_doc_classes(self):
         return set().union(
-            *map(
-                collect_doc_classes,
-                [
-                    self._q,
-                    self._source,
-                    self._fields,
-                    self._filters,
-                    self._post_filters,
-                    tuple(
-                        fs.functions for fs in self._function_scores.values()
-                    ),
-                    tuple(self._aggregations.values()),
-                    self._order_by,
-                    self._rescores,
-                    self._highlight,
-                    self._ext,
-                ]
-            )
+            *map(collect_doc_classes, self._get_doc_classes_sources())
         )
 
     @property
@@ -807,6 +974,96 @@ class BaseSearchQuery(metaclass=ABCMeta):
             clone._limit = 1
             return clone, False
 
+    def _composite_page_query(self, name, after=None):
+        composite_agg = self._aggregations.get(name)
+        if not isinstance(composite_agg, Composite):
+            raise ValueError(
+                'Aggregation {!r} is not a composite aggregation'.format(name)
+            )
+        if after is not None:
+            composite_agg = composite_agg.after(after)
+        # hits and other aggregations are not needed when paginating
+        return self.limit(0).aggs(None).aggs({name: composite_agg})
+
+    def _partition_queries(self, name, num_partitions):
+        terms_agg = self._aggregations.get(name)
+        if not isinstance(terms_agg, TermsAgg):
+            raise ValueError(
+                'Aggregation {!r} is not a terms aggregation'.format(name)
+            )
+        # fails before any request is sent
+        terms_agg.sort_raw_buckets([])
+        sq = self.limit(0).aggs(None)
+        return [
+            sq.aggs({name: terms_agg.partition(partition, num_partitions)})
+            for partition in range(num_partitions)
+        ]
+
+    def _merge_partitions(self, name, results):
+        agg_expr = self._aggregations[name]
+        raw_buckets = []
+        doc_count_error_upper_bound = 0
+        sum_other_doc_count = 0
+        doc_cls_map = None
+        for result in results:
+            raw_agg = result.raw.get('aggregations', {}).get(name, {})
+            raw_buckets.extend(raw_agg.get('buckets', []))
+            doc_count_error_upper_bound += raw_agg.get(
+                'doc_count_error_upper_bound', 0
+            )
+            sum_other_doc_count += raw_agg.get('sum_other_doc_count', 0)
+            doc_cls_map = result._doc_cls_map
+        # partitions are disjoint so the ordering can be restored
+        agg_expr.sort_raw_buckets(raw_buckets)
+        return agg_expr.build_agg_result(
+            {
+                'buckets': raw_buckets,
+                'doc_count_error_upper_bound': doc_count_error_upper_bound,
+                'sum_other_doc_count': sum_other_doc_count,
+            },
+            doc_cls_map=doc_cls_map,
+            mapper_registry={},
+        )
+
+    def _merged_page_query(self):
+        # fails before any request is sent
+        for agg_expr in self._aggregations.values():
+            agg_expr.check_mergeable()
+        limit = self._limit if self._limit is not None else 10
+        # every query must return enough hits to cut the merged page
+        return self.limit((self._offset or 0) + limit).offset(None)
+
+    def _fan_out_queries(self, targets):
+        sq = self._merged_page_query()
+        queries = []
+        for target in targets:
+            if isinstance(target, BaseIndex):
+                queries.append(
+                    sq.with_cluster(target.get_cluster()).with_index(target)
+                )
+            else:
+                queries.append(sq.with_index(None).with_cluster(target))
+        return queries
+
+    def _terms_chunk_queries(self, field, terms, chunk_size):
+        terms = list(terms)
+        sq = self._merged_page_query()
+        return [
+            sq.filter(Terms(field, terms[i:i + chunk_size]))
+            for i in range(0, len(terms) or 1, chunk_size)
+        ]
+
+    def _merge_fan_out_results(self, compiler, results):
+        compiled_query = compiler.compiled_query(self)
+        raw_result = merge_raw_search_results(
+            [result.raw for result in results],
+            aggregations=self._aggregations,
+            sort=(compiled_query.body or {}).get('sort'),
+            offset=self._offset or 0,
+            limit=self._limit if self._limit is not None else 10,
+        )
+        return compiled_query.process_result(raw_result)
+
     def _iter_result(self, res):
         if self._iter_instances:
             return iter(
@@ -874,6 +1131,195 @@ class SearchQuery(BaseSearchQuery):
         )
         return self.get_result()
 
+    def iter_composite(self, name):
+        """Iterates over all buckets of the composite aggregation with
+        the ``name``. Pages are requested one by one using ``after_key``
+        so only one page of buckets is held in memory.
+
+        .. testcode:: iter_composite
+
+           from unittest.mock import Mock
+           from elasticmagic import Cluster, agg
+           from elasticmagic.compiler import Compiler_7_0
+
+           client = Mock(search=Mock(side_effect=[
+               {
+                   'hits': {'hits': [], 'total': 3},
+                   'aggregations': {'tags': {
+                       'after_key': {'tag': 'b'},
+                       'buckets': [
+                           {'key': {'tag': 'a'}, 'doc_count': 1},
+                           {'key': {'tag': 'b'}, 'doc_count': 1},
+                       ],
+                   }},
+               },
+               {
+                   'hits': {'hits': [], 'total': 3},
+                   'aggregations': {'tags': {
+                       'after_key': {'tag': 'c'},
+                       'buckets': [{'key': {'tag': 'c'}, 'doc_count': 1}],
+                   }},
+               },
+               {
+                   'hits': {'hits': [], 'total': 3},
+                   'aggregations': {'tags': {'buckets': []}},
+               },
+           ]))
+           search_query = (
+               Cluster(client, compiler=Compiler_7_0).search_query()
+               .aggs(tags=agg.Composite(
+                   [{'tag': agg.Terms(PostDocument.tag)}], size=2
+               ))
+           )
+           for bucket in search_query.iter_composite('tags'):
+               print(bucket.key['tag'], bucket.doc_count)
+
+        .. testoutput:: iter_composite
+
+           a 1
+           b 1
+           c 1
+        """
+        after = None
+        while True:
+            agg_result = (
+                self._composite_page_query(name, after)
+                .get_result()
+                .get_aggregation(name)
+            )
+            for bucket in agg_result:
+                yield bucket
+            after = agg_result.after_key
+            if not after or not agg_result.buckets:
+                break
+
+    def get_partitioned_aggregation(
+            self, name, num_partitions, partitions_per_request=10
+    ):
+        """Calculates the terms aggregation with the ``name`` splitting it
+        into ``num_partitions`` partitions. Every partition is a separate
+        search request, ``partitions_per_request`` of them are sent
+        in a single multi search request. Buckets of all the partitions
+        are merged into a single aggregation result.
+
+        Partitioning reduces memory pressure on the cluster when
+        calculating aggregations over high cardinality fields.
+        Note that ``size`` of the aggregation is applied for every
+        partition.
+
+        .. testcode:: get_partitioned_aggregation
+
+           from unittest.mock import Mock
+           from elasticmagic import Cluster, agg
+           from elasticmagic.compiler import Compiler_7_0
+
+           def response(*keys):
+               return {
+                   'hits': {'hits': [], 'total': 3},
+                   'aggregations': {'tags': {'buckets': [
+                       {'key': key, 'doc_count': doc_count}
+                       for key, doc_count in keys
+                   ]}},
+               }
+
+           client = Mock(msearch=Mock(return_value={'responses': [
+               response(('a', 1), ('c', 5)), response(('b', 3)),
+           ]}))
+           search_query = (
+               Cluster(client, compiler=Compiler_7_0).search_query()
+               .aggs(tags=agg.Terms(PostDocument.tag, size=1000))
+           )
+           tags = search_query.get_partitioned_aggregation('tags', 2)
+           for bucket in tags.buckets:
+               print(bucket.key, bucket.doc_count)
+
+        .. testoutput:: get_partitioned_aggregation
+
+           c 5
+           b 3
+           a 1
+        """
+        queries = self._partition_queries(name, num_partitions)
+        return self._merge_partitions(
+            name,
+            self._multi_search_by_batches(queries, partitions_per_request)
+        )
+
+    def get_result_by_terms(self, field, terms, chunk_size=10000,
+                            chunks_per_request=10):
+        """Filters the query by a huge list of ``terms`` of the ``field``.
+        Terms are split into chunks of ``chunk_size``, so requests do not
+        exceed ``index.max_terms_count`` limit. Every chunk is a separate
+        search request, ``chunks_per_request`` of them are sent in a single
+        multi search request. Results are merged the same way as in
+        :meth:`fan_out`.
+
+        Every document must match only a single chunk, so the field should
+        have a single value, for instance document id:
+
+        .. code-block:: python
+
+           result = (
+               SearchQuery(Product.status == 0)
+               .order_by(Product.rank.desc())
+               .limit(100)
+               .get_result_by_terms(Product._id, product_ids)
+           )
+
+        When terms are stored in a document, use
+        :meth:`elasticmagic.expression.Field.in_lookup` instead.
+        """
+        queries = self._terms_chunk_queries(field, terms, chunk_size)
+        return self._merge_fan_out_results(
+            self.get_compiler(),
+            self._multi_search_by_batches(queries, chunks_per_request)
+        )
+
+    def _multi_search_by_batches(self, queries, batch_size):
+        results = []
+        for i in range(0, len(queries), batch_size):
+            results.extend(
+                self._index_or_cluster.multi_search(
+                    queries[i:i + batch_size], raise_on_error=True
+                )
+            )
+        return results
+
+    def fan_out(self, targets, max_workers=None):
+        """Executes the query on every index or cluster from ``targets``
+        concurrently and merges results into a single :class:`SearchResult`.
+
+        Hits are merged by sort values or by score, totals are summed up.
+        Aggregations are merged when it is possible: terms, histograms,
+        range, filters, single bucket aggregations and ``sum``, ``min``,
+        ``max``, ``value_count`` and ``stats`` metrics. Other aggregations
+        raise :exc:`ValueError` before any request is sent.
+
+        .. code-block:: python
+
+           result = (
+               SearchQuery(Product.status == 0)
+               .order_by(Product.rank.desc())
+               .aggs(categories=agg.Terms(Product.category, size=20))
+               .limit(20)
+               .fan_out([products_ru_index, products_ua_index])
+           )
+
+        :param targets: list of :class:`elasticmagic.index.Index` or
+           :class:`elasticmagic.cluster.Cluster` objects
+        :param max_workers: maximum number of threads, one thread per target
+           by default
+        """
+        queries = self._fan_out_queries(targets)
+        with ThreadPoolExecutor(
+                max_workers=max_workers or len(queries) or 1
+        ) as executor:
+            results = list(executor.map(lambda sq: sq.get_result(), queries))
+        return self._merge_fan_out_results(
+            queries[0].get_compiler() if queries else self.get_compiler(),
+            results
+        )
+
     def count(self):
         """Executes current query and returns number of documents matched the
         query. Uses `count api <https://www.elastic.co/guide/en/elasticsearch/reference/current/search-count.html>`_.
@@ -959,29 +1405,17 @@ class SearchQueryContext(object):
         self.highlight = search_query._highlight
         self.track_total_hits = search_query._track_total_hits
         self.search_after = search_query._search_after
+        self.profile = search_query._profile
 
         self.cluster = search_query._cluster
         self.index = search_query._index
-        doc_cls = search_query._doc_cls
-        if not doc_cls:
-            doc_classes = search_query._collect_doc_classes()
-        elif not isinstance(doc_cls, Iterable):
-            doc_classes = [doc_cls]
-        else:
-            doc_classes = doc_cls
-        self.doc_classes = tuple(doc_classes)
-
-        if not search_query._doc_type:
-            doc_types = []
-        elif isinstance(search_query._doc_type, str):
-            doc_types = [
-                t.strip() for t in search_query._doc_type.split(',')
-            ]
-        else:
-            doc_types = list(search_query._doc_type)
-        self.doc_types = self._get_unique_doc_types(
-            doc_types, self.doc_classes
-        )
+        # collecting document classes walks through the whole query
+        # so it is postponed until document classes are really needed
+        self._doc_cls = search_query._doc_cls
+        if not self._doc_cls:
+            self._doc_classes_sources = \
+                search_query._get_doc_classes_sources()
+        self._doc_type = search_query._doc_type
 
         self.docvalue_fields = search_query._docvalue_fields
         self.script_fields = search_query._script_fields
@@ -991,6 +1425,29 @@ class SearchQueryContext(object):
         self.instance_mapper = search_query._instance_mapper
         self.iter_instances = search_query._iter_instances
 
+    @cached_property
+    def doc_classes(self):
+        doc_cls = self._doc_cls
+        if not doc_cls:
+            doc_classes = set().union(
+                *map(collect_doc_classes, self._doc_classes_sources)
+            )
+        elif not isinstance(doc_cls, Iterable):
+            doc_classes = [doc_cls]
+        else:
+            doc_classes = doc_cls
+        return tuple(doc_classes)
+
+    @cached_property
+    def doc_types(self):
+        if not self._doc_type:
+            doc_types = []
+        elif isinstance(self._doc_type, str):
+            doc_types = [t.strip() for t in self._doc_type.split(',')]
+        else:
+            doc_types = list(self._doc_type)
+        return self._get_unique_doc_types(doc_types, self.doc_classes)
+
     @staticmethod
     def _get_unique_doc_types(doc_types=None, doc_classes=None):
         doc_types = list(doc_types) if doc_types else []
@@ -1,6 +1,6 @@
 from collections.abc import Iterable, Mapping
 from functools import wraps
-from itertools import chain
+from itertools import chain, islice
 
 
 def _with_clone(fn):
@@ -67,3 +67,13 @@ def merge_params(params, args, kwargs):
         new.update(a)
     new.update(kwargs)
     return type(params)(params, **new)
+
+
+def iter_chunks(iterable, size):
+    """Splits any iterable into lists of ``size`` items."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
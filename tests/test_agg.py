@@ -1,11 +1,12 @@
+import datetime
 import math
 from unittest.mock import Mock, patch
 
 from elasticmagic import agg, Params, Term, Document, DynamicDocument
 from elasticmagic.compiler import Compiler_6_0
 from elasticmagic.compiler import Compiler_7_0
-from elasticmagic.expression import Field, Script
-from elasticmagic.types import Integer, Boolean, List
+from elasticmagic.expression import Field, Script, Sort
+from elasticmagic.types import Integer, Boolean, Date, List
 
 import pytest
 
@@ -1315,3 +1316,502 @@ def test_bucket_selector(compiler):
     assert len(r.buckets) == 2
     assert r.buckets[0].get_aggregation('sales_bucket_filter') is None
     assert r.buckets[1].get_aggregation('sales_bucket_filter') is None
+
+
+def test_columnar_terms():
+    f = DynamicDocument.fields
+    type_mapper = Mock(return_value={1: 'One', 2: 'Two'})
+    a = agg.Terms(
+        f.type, type=Integer, columnar=True, instance_mapper=type_mapper,
+        aggs={
+            'avg_price': agg.Avg(f.price),
+            'top': agg.TopHits(size=1),
+        }
+    )
+    assert a.to_dict(compiler=Compiler_7_0) == {
+        'terms': {'field': 'type'},
+        'aggregations': {
+            'avg_price': {'avg': {'field': 'price'}},
+            'top': {'top_hits': {'size': 1}},
+        }
+    }
+    assert a.clone()._columnar is True
+
+    r = a.build_agg_result({
+        'buckets': [
+            {
+                'key': 1,
+                'doc_count': 7,
+                'avg_price': {'value': 10.5},
+                'top': {'hits': {'total': 7, 'hits': []}},
+            },
+            {
+                'key': 2,
+                'doc_count': 3,
+                'avg_price': {'value': None},
+                'top': {'hits': {'total': 3, 'hits': []}},
+            },
+        ]
+    })
+    assert isinstance(r, agg.ColumnarMultiBucketAggResult)
+    assert len(r) == 2
+    assert '_buckets' not in r.__dict__
+
+    arrays = r.to_arrays()
+    assert set(arrays) == {'key', 'doc_count', 'avg_price'}
+    assert arrays['key'].typecode == 'q'
+    assert list(arrays['key']) == [1, 2]
+    assert list(arrays['doc_count']) == [7, 3]
+    assert arrays['avg_price'][0] == 10.5
+    assert math.isnan(arrays['avg_price'][1])
+    assert r.keys == [1, 2]
+    assert '_buckets' not in r.__dict__
+
+    bucket = r.get_bucket(2)
+    assert bucket.doc_count == 3
+    assert bucket.get_aggregation('top').total == 3
+    assert [b.key for b in r] == [1, 2]
+    assert r.buckets[0].instance == 'One'
+    assert r.buckets[1].instance == 'Two'
+    assert type_mapper.call_count == 1
+
+
+def test_columnar_builds_buckets_on_demand():
+    f = DynamicDocument.fields
+    a = agg.Terms(f.type, type=Integer, columnar=True)
+    r = a.build_agg_result({
+        'buckets': [
+            {'key': 1, 'doc_count': 7},
+            {'key': 2, 'doc_count': 3},
+            {'key': 3, 'doc_count': 1},
+        ]
+    })
+    assert r.expr is a
+    bucket = r.get_bucket(2)
+    assert bucket.key == 2
+    assert bucket.doc_count == 3
+    assert r.get_bucket(2) is bucket
+    assert r.get_bucket(4) is None
+    assert '_buckets' not in r.__dict__
+    assert list(r._built_buckets) == [1]
+    assert r.buckets[1] is bucket
+
+
+def test_columnar_nested_instance_mappers():
+    f = DynamicDocument.fields
+    type_mapper = Mock(return_value={1: 'One', 2: 'Two'})
+    a = agg.Terms(
+        f.category, columnar=True,
+        aggs={
+            'types': agg.Terms(
+                f.type, type=Integer, instance_mapper=type_mapper
+            ),
+        }
+    )
+    mapper_registry = {}
+    r = a.build_agg_result(
+        {
+            'buckets': [
+                {
+                    'key': 'a', 'doc_count': 2,
+                    'types': {'buckets': [{'key': 1, 'doc_count': 2}]},
+                },
+                {
+                    'key': 'b', 'doc_count': 1,
+                    'types': {'buckets': [{'key': 2, 'doc_count': 1}]},
+                },
+            ]
+        },
+        mapper_registry=mapper_registry,
+    )
+    assert '_buckets' not in r.__dict__
+
+    types = r.get_bucket('a').get_aggregation('types')
+    assert types.buckets[0].instance == 'One'
+    assert r.get_bucket('b').get_aggregation('types') \
+        .buckets[0].instance == 'Two'
+    assert type_mapper.call_count == 1
+
+
+def test_columnar_string_keys():
+    f = DynamicDocument.fields
+    a = agg.Terms(f.tag, columnar=True)
+    r = a.build_agg_result({
+        'buckets': [
+            {'key': 'a', 'doc_count': 2},
+            {'key': 'b', 'doc_count': 1},
+        ]
+    })
+    assert r.to_arrays() == {
+        'key': ['a', 'b'],
+        'doc_count': r.doc_counts,
+    }
+
+    numpy = pytest.importorskip('numpy')
+    arrays = r.to_numpy()
+    assert isinstance(arrays['doc_count'], numpy.ndarray)
+    assert arrays['doc_count'].tolist() == [2, 1]
+
+
+def test_lazy_sub_aggregations():
+    f = DynamicDocument.fields
+    a = agg.Terms(
+        f.category, type=Integer,
+        aggs={
+            'vendors': agg.Terms(
+                f.vendor, aggs={'top': agg.TopHits(size=1)}
+            ),
+            'nested': agg.Nested(
+                f.offers, aggs={'min_price': agg.Min(f.offers.price)}
+            ),
+        }
+    )
+    r = a.build_agg_result({
+        'buckets': [
+            {
+                'key': 1,
+                'doc_count': 2,
+                'vendors': {
+                    'buckets': [
+                        {
+                            'key': 'acme',
+                            'doc_count': 2,
+                            'top': {'hits': {'total': 2, 'hits': []}},
+                        },
+                    ]
+                },
+                'nested': {'doc_count': 5, 'min_price': {'value': 9.5}},
+            },
+        ]
+    })
+    bucket = r.get_bucket(1)
+    assert bucket._agg_results is None
+
+    vendors = bucket.get_aggregation('vendors')
+    assert list(bucket._agg_results) == ['vendors']
+    assert vendors.get_bucket('acme').get_aggregation('top').total == 2
+    assert bucket.get_aggregation('vendors') is vendors
+    assert bucket.get_aggregation('unknown') is None
+
+    nested = bucket.get_aggregation('nested')
+    assert nested._agg_results is None
+    assert nested.get_aggregation('min_price').value == 9.5
+    assert set(bucket.aggregations) == {'vendors', 'nested'}
+    assert bucket.aggregations['vendors'] is vendors
+
+
+def test_composite(compiler):
+    f = DynamicDocument.fields
+    a = agg.Composite(
+        [
+            {'category': agg.Terms(f.category, type=Integer)},
+            {'day': agg.DateHistogram(f.date, interval='1d')},
+        ],
+        size=2,
+        aggs={'avg_price': agg.Avg(f.price)},
+    )
+    expected = {
+        'composite': {
+            'sources': [
+                {'category': {'terms': {'field': 'category'}}},
+                {'day': {'date_histogram': {
+                    'field': 'date', 'interval': '1d'
+                }}},
+            ],
+            'size': 2,
+        },
+        'aggregations': {
+            'avg_price': {'avg': {'field': 'price'}}
+        }
+    }
+    assert a.to_dict(compiler=compiler) == expected
+
+    a2 = a.after({'category': 1, 'day': 1420070400000})
+    assert a.to_dict(compiler=compiler) == expected
+    assert a2.to_dict(compiler=compiler)['composite']['after'] == {
+        'category': 1, 'day': 1420070400000
+    }
+
+    r = a.build_agg_result({
+        'after_key': {'category': 2, 'day': 1420070400000},
+        'buckets': [
+            {
+                'key': {'category': '1', 'day': 1420070400000},
+                'doc_count': 3,
+                'avg_price': {'value': 7.5},
+            },
+            {
+                'key': {'category': '2', 'day': 1420070400000},
+                'doc_count': 1,
+                'avg_price': {'value': 1.0},
+            },
+        ]
+    })
+    assert isinstance(r, agg.CompositeAggResult)
+    assert r.after_key == {'category': 2, 'day': 1420070400000}
+    assert len(r.buckets) == 2
+    assert r.buckets[0].key == {'category': 1, 'day': 1420070400000}
+    assert r.buckets[0].get_aggregation('avg_price').value == 7.5
+    assert r.get_bucket((2, 1420070400000)).doc_count == 1
+    assert r.get_bucket({'category': 1, 'day': 1420070400000}) is \
+        r.buckets[0]
+
+    a = agg.Composite(
+        {'category': {'terms': {'field': 'category'}}},
+        aggs={'avg_price': agg.Avg(f.price)},
+    )
+    assert a.to_dict(compiler=compiler)['composite'] == {
+        'sources': [{'category': {'terms': {'field': 'category'}}}],
+    }
+    r = a.build_agg_result({
+        'buckets': [
+            {
+                'key': {'category': '1'},
+                'doc_count': 3,
+                'avg_price': {'value': 7.5},
+            },
+        ]
+    })
+    assert r.buckets[0].key == {'category': '1'}
+    assert r.buckets[0].get_aggregation('avg_price').value == 7.5
+    assert r.get_bucket(('1',)) is r.buckets[0]
+
+
+def test_bucket_key_converter():
+    f = DynamicDocument.fields
+    utc = datetime.timezone.utc
+
+    a = agg.DateHistogram(f.created_at, interval='1d', type=Date)
+    res = a.build_agg_result({
+        'buckets': [
+            {
+                'key': 1420070400000,
+                'key_as_string': '2015-01-01T00:00:00.000Z',
+                'doc_count': 2,
+            },
+            {
+                'key': 1420156800000,
+                'key_as_string': '2015-01-02T00:00:00.000Z',
+                'doc_count': 1,
+            },
+        ]
+    })
+    assert [b.key for b in res.buckets] == [
+        datetime.datetime(2015, 1, 1, tzinfo=utc),
+        datetime.datetime(2015, 1, 2, tzinfo=utc),
+    ]
+    assert res.get_bucket(datetime.datetime(2015, 1, 2, tzinfo=utc)) \
+        .doc_count == 1
+
+    a = agg.Terms(f.tags, type=List(Integer))
+    res = a.build_agg_result({
+        'buckets': [
+            {'key': '1', 'doc_count': 3},
+            {'key': 2, 'doc_count': 1},
+        ]
+    })
+    assert [b.key for b in res.buckets] == [1, 2]
+
+    a = agg.Terms(f.is_active, type=Boolean)
+    res = a.build_agg_result({
+        'buckets': [
+            {'key': 1, 'key_as_string': 'true', 'doc_count': 3},
+            {'key': 0, 'key_as_string': 'false', 'doc_count': 1},
+        ]
+    })
+    assert [b.key for b in res.buckets] == [True, False]
+
+    a = agg.Range(
+        f.created_at, type=Date,
+        ranges=[{'to': '2015-01-01'}, {'from': '2015-01-01'}],
+    )
+    res = a.build_agg_result({
+        'buckets': [
+            {'to': 1420070400000.0, 'doc_count': 1},
+            {'from': 1420070400000.0, 'doc_count': 4},
+        ]
+    })
+    assert res.buckets[0].from_ is None
+    assert res.buckets[0].to == datetime.datetime(2015, 1, 1, tzinfo=utc)
+    assert res.buckets[1].key == (
+        datetime.datetime(2015, 1, 1, tzinfo=utc), None
+    )
+
+    a = agg.Composite([
+        {'day': agg.DateHistogram(f.created_at, interval='1d', type=Date)},
+        {'tag': agg.Terms(f.tag, type=Integer)},
+    ])
+    res = a.build_agg_result({
+        'buckets': [
+            {'key': {'day': 1420070400000, 'tag': '7'}, 'doc_count': 1},
+        ]
+    })
+    assert res.buckets[0].key == {
+        'day': datetime.datetime(2015, 1, 1, tzinfo=utc),
+        'tag': 7,
+    }
+
+
+def test_formatted_date_bucket_keys():
+    f = DynamicDocument.fields
+    tz = datetime.timezone(datetime.timedelta(hours=3))
+    raw_data = {
+        'buckets': [
+            {
+                'key': 1420059600000,
+                'key_as_string': '2015-01-01T00:00:00.000+03:00',
+                'doc_count': 2,
+            },
+            {
+                'key': 1420146000000,
+                'key_as_string': '2015-01-02T00:00:00.000+03:00',
+                'doc_count': 1,
+            },
+        ]
+    }
+
+    for columnar in (False, True):
+        a = agg.DateHistogram(
+            f.created_at, interval='1d', time_zone='+03:00', type=Date,
+            columnar=columnar,
+        )
+        res = a.build_agg_result(raw_data)
+        assert [b.key for b in res.buckets] == [
+            datetime.datetime(2015, 1, 1, tzinfo=tz),
+            datetime.datetime(2015, 1, 2, tzinfo=tz),
+        ]
+        assert res.buckets[0].key.utcoffset() == datetime.timedelta(hours=3)
+        assert res.get_bucket(datetime.datetime(2015, 1, 2, tzinfo=tz)) \
+            .doc_count == 1
+    assert res.keys == [
+        datetime.datetime(2015, 1, 1, tzinfo=tz),
+        datetime.datetime(2015, 1, 2, tzinfo=tz),
+    ]
+    assert list(res.to_arrays()['key']) == [1420059600000, 1420146000000]
+
+    a = agg.DateHistogram(
+        f.created_at, interval='1d', format='yyyy-MM-dd', type=Date,
+    )
+    res = a.build_agg_result({
+        'buckets': [
+            {
+                'key': 1420070400000,
+                'key_as_string': '2015-01-01',
+                'doc_count': 2,
+            },
+        ]
+    })
+    assert res.buckets[0].key == datetime.datetime(2015, 1, 1)
+
+    a = agg.Range(
+        f.created_at, type=Date, format='yyyy-MM-dd',
+        ranges=[{'to': '2015-01-01'}],
+    )
+    res = a.build_agg_result({
+        'buckets': [
+            {
+                'to': 1420070400000.0,
+                'to_as_string': '2015-01-01',
+                'doc_count': 1,
+            },
+        ]
+    })
+    assert res.buckets[0].to == datetime.datetime(2015, 1, 1)
+
+
+def test_merge_raw_results():
+    f = DynamicDocument.fields
+
+    stats = agg.Stats(f.price)
+    assert stats.merge_raw_results([
+        {'count': 2, 'min': 1.0, 'max': 5.0, 'avg': 3.0, 'sum': 6.0},
+        {'count': 0, 'min': None, 'max': None, 'avg': None, 'sum': 0.0},
+        {'count': 1, 'min': 0.0, 'max': 3.0, 'avg': 3.0, 'sum': 3.0},
+    ]) == {'count': 3, 'min': 0.0, 'max': 5.0, 'avg': 3.0, 'sum': 9.0}
+
+    histogram = agg.Histogram(
+        f.price, interval=10, aggs={'n': agg.ValueCount(f.id)}
+    )
+    assert histogram.merge_raw_results([
+        {'buckets': [
+            {'key': 10, 'doc_count': 1, 'n': {'value': 1}},
+            {'key': 20, 'doc_count': 2, 'n': {'value': 2}},
+        ]},
+        {'buckets': [
+            {'key': 0, 'doc_count': 3, 'n': {'value': 3}},
+            {'key': 20, 'doc_count': 4, 'n': {'value': 4}},
+        ]},
+    ]) == {'buckets': [
+        {'key': 0, 'doc_count': 3, 'n': {'value': 3}},
+        {'key': 10, 'doc_count': 1, 'n': {'value': 1}},
+        {'key': 20, 'doc_count': 6, 'n': {'value': 6}},
+    ]}
+
+    filters = agg.Filters(Params(a=f.a == 1, b=f.b == 1))
+    assert filters.merge_raw_results([
+        {'buckets': {'a': {'doc_count': 1}, 'b': {'doc_count': 2}}},
+        {'buckets': {'a': {'doc_count': 3}, 'b': {'doc_count': 4}}},
+    ]) == {'buckets': [
+        {'key': 'a', 'doc_count': 4},
+        {'key': 'b', 'doc_count': 6},
+    ]}
+
+    nested = agg.Nested(f.offers, aggs={'max_price': agg.Max(f.price)})
+    assert nested.merge_raw_results([
+        {'doc_count': 4, 'max_price': {'value': 10.0}},
+        {'doc_count': 5, 'max_price': {'value': 20.0}},
+    ]) == {'doc_count': 9, 'max_price': {'value': 20.0}}
+
+    raw_results = [
+        {'buckets': [
+            {'key': 'a', 'doc_count': 5, 'max_price': {'value': 10.0}},
+            {'key': 'b', 'doc_count': 3, 'max_price': {'value': 30.0}},
+        ]},
+        {'buckets': [
+            {'key': 'c', 'doc_count': 4, 'max_price': {'value': 20.0}},
+            {'key': 'd', 'doc_count': 1, 'max_price': {'value': None}},
+        ]},
+    ]
+    for order, keys in [
+            ({'max_price': 'desc'}, ['b', 'c']),
+            (Sort('max_price', 'asc'), ['a', 'c']),
+            ([{'_count': 'asc'}], ['d', 'b']),
+            ([{'_key': 'desc'}, {'_count': 'desc'}], ['d', 'c']),
+    ]:
+        terms = agg.Terms(
+            f.tag, size=2, order=order,
+            aggs={'max_price': agg.Max(f.price)},
+        )
+        terms.check_mergeable()
+        merged = terms.merge_raw_results(raw_results)
+        assert [b['key'] for b in merged['buckets']] == keys
+        assert merged['sum_other_doc_count'] == sum(
+            b['doc_count']
+            for r in raw_results for b in r['buckets']
+            if b['key'] not in keys
+        )
+
+    for agg_expr in [
+            agg.Terms(f.tag, order={'max_price': 'desc'}),
+            agg.Terms(
+                f.tag, order={'price_stats.variance': 'desc'},
+                aggs={'price_stats': agg.Max(f.price)},
+            ),
+            agg.Terms(
+                f.tag, order={'sold>_count': 'desc'},
+                aggs={'sold': agg.Filter(f.is_sold == True)},  # noqa:E712
+            ),
+            agg.Terms(f.tag, order=Sort(f.price, 'desc')),
+            agg.Avg(f.price),
+            agg.Cardinality(f.price),
+            agg.ExtendedStats(f.price),
+            agg.SignificantTerms(f.tag),
+            agg.Composite([{'tag': agg.Terms(f.tag)}]),
+            agg.Terms(f.tag, aggs={'avg_price': agg.Avg(f.price)}),
+    ]:
+        with pytest.raises(ValueError):
+            agg_expr.check_mergeable()
+        with pytest.raises(ValueError):
+            agg_expr.merge_raw_results([
+                {'buckets': [{'key': 'a', 'doc_count': 1}]}
+            ])
@@ -0,0 +1,108 @@
+from unittest.mock import Mock
+
+import pytest
+
+from elasticmagic import agg, DynamicDocument
+from elasticmagic.cache import CachedInstanceMapper, LRUCache
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('b', 0) == 0
+    assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 3
+    assert cache.stats.evictions == 1
+    assert cache.stats.hit_rate == 0.5
+
+    cache.delete('a')
+    assert 'a' not in cache
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_lru_cache_ttl():
+    timer = FakeTimer()
+    cache = LRUCache(ttl=10, timer=timer)
+    cache.set('a', 1)
+    timer.now = 9
+    assert cache.get('a') == 1
+    timer.now = 10
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cached_instance_mapper():
+    mapper = Mock(
+        side_effect=lambda ids: {
+            id: 'instance:{}'.format(id) for id in ids if id != 3
+        }
+    )
+    cached_mapper = CachedInstanceMapper(mapper, max_size=10)
+
+    assert cached_mapper([1, 2, 3]) == {1: 'instance:1', 2: 'instance:2'}
+    mapper.assert_called_once_with([1, 2, 3])
+
+    assert cached_mapper([2, 1, 4]) == {
+        1: 'instance:1', 2: 'instance:2', 4: 'instance:4'
+    }
+    mapper.assert_called_with([4])
+    assert cached_mapper([3]) == {}
+    mapper.assert_called_with([3])
+    assert cached_mapper.stats.hits == 2
+    assert cached_mapper.stats.misses == 5
+
+    cached_mapper.invalidate(1)
+    cached_mapper([1, 2])
+    mapper.assert_called_with([1])
+
+    cached_mapper = CachedInstanceMapper(mapper, cache_missing=True)
+    assert cached_mapper([3]) == {}
+    assert cached_mapper([3]) == {}
+    assert mapper.call_count == 5
+
+
+def test_cached_instance_mapper_in_aggregation():
+    mapper = Mock(side_effect=lambda ids: {id: id.upper() for id in ids})
+    cached_mapper = CachedInstanceMapper(mapper)
+    a = agg.Terms(DynamicDocument.fields.tag, instance_mapper=cached_mapper)
+    raw_data = {
+        'buckets': [
+            {'key': 'a', 'doc_count': 2},
+            {'key': 'b', 'doc_count': 1},
+        ]
+    }
+
+    for _ in range(2):
+        r = a.build_agg_result(raw_data)
+        assert [b.instance for b in r.buckets] == ['A', 'B']
+    assert mapper.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_async_instance_mapper():
+    calls = []
+
+    async def mapper(ids):
+        calls.append(ids)
+        return {id: str(id) for id in ids}
+
+    cached_mapper = CachedInstanceMapper(mapper)
+    assert await cached_mapper([1, 2]) == {1: '1', 2: '2'}
+    assert await cached_mapper([2, 3]) == {2: '2', 3: '3'}
+    assert calls == [[1, 2], [3]]
@@ -1,11 +1,17 @@
 import warnings
-from unittest.mock import Mock
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, Mock
+
+from elasticsearch import ConnectionTimeout
 
 from elasticmagic import (
     actions, agg, Cluster, DynamicDocument, Index, SearchQuery
 )
 from elasticmagic import MultiSearchError
+from elasticmagic.cache import DocumentCache
+from elasticmagic.cluster import SlowQueryLog
 from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.ext.asyncio import AsyncCluster
 
 from .base import BaseTestCase
 
@@ -478,6 +484,46 @@ class ClusterTest(BaseTestCase):
         self.assertEqual(docs[1].post_date, '2014-12-29T16:45:58')
         self.assertEqual(docs[1].message, 'Elasticsearch the best')
 
+    def test_iter_multi_get(self):
+        def mget(body, **kwargs):
+            return {
+                'docs': [
+                    {
+                        '_index': kwargs['index'], '_type': 'tweet',
+                        '_id': str(doc['_id']), 'found': doc['_id'] % 3 != 0,
+                        '_source': {'n': doc['_id']},
+                    }
+                    for doc in body['docs']
+                ]
+            }
+
+        consumed_ids = []
+
+        def gen_ids():
+            for id in range(1, 11):
+                consumed_ids.append(id)
+                yield id
+
+        self.client.mget = Mock(side_effect=mget)
+        docs = self.index.iter_multi_get(
+            gen_ids(), chunk_size=3, concurrency=2, realtime=False
+        )
+        first_docs = [next(docs) for _ in range(2)]
+        self.assertEqual([doc.n for doc in first_docs], [1, 2])
+        # only a window of chunks is read
+        self.assertEqual(len(consumed_ids), 9)
+
+        docs = first_docs + list(docs)
+        self.assertEqual(
+            [doc and doc.n for doc in docs],
+            [1, 2, None, 4, 5, None, 7, 8, None, 10]
+        )
+        self.assertEqual(docs[0]._index, 'test')
+        self.assertEqual(self.client.mget.call_count, 4)
+        self.client.mget.assert_called_with(
+            body={'docs': [{'_id': 10}]}, index='test', realtime=False
+        )
+
     def test_bulk(self):
         self.client.bulk = Mock(
             return_value={
@@ -650,3 +696,294 @@ class ClusterTest(BaseTestCase):
             cluster['test'].search_query().source(None),
             {}
         )
+
+    def test_slow_query_log(self):
+        logger = Mock()
+        logger.isEnabledFor.return_value = True
+        self.client.search = Mock(
+            return_value={
+                'hits': {'hits': [], 'max_score': None, 'total': 0},
+                'took': 1500,
+            }
+        )
+        self.client.search.__name__ = 'search'
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0,
+            slow_query_log=SlowQueryLog(
+                threshold=1000, max_body_length=20, logger=logger
+            ),
+        )
+        sq = cluster['test'].search_query(
+            self.index['product'].name.match('very long query text'),
+            routing=123,
+        )
+        sq.get_result()
+
+        self.assertEqual(logger.log.call_count, 1)
+        slow_query = logger.log.call_args[1]['extra']['slow_query']
+        self.assertEqual(slow_query['method'], 'search')
+        self.assertEqual(slow_query['index'], 'test')
+        self.assertEqual(slow_query['params'], {'routing': 123})
+        self.assertEqual(slow_query['took'], 1500)
+        self.assertEqual(slow_query['body'], '{"query": {"match": ...')
+
+        logger.reset_mock()
+        self.client.search.return_value = {
+            'hits': {'hits': [], 'max_score': None, 'total': 0},
+            'took': 5,
+        }
+        sq.get_result()
+        self.assertEqual(logger.log.call_count, 0)
+
+    def test_slow_query_log_failed_request(self):
+        logger = Mock()
+        logger.isEnabledFor.return_value = True
+        error = ConnectionTimeout('TIMEOUT', 'Read timed out', None)
+        self.client.search = Mock(side_effect=error)
+        self.client.search.__name__ = 'search'
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0,
+            slow_query_log=SlowQueryLog(threshold=0, logger=logger),
+        )
+        with self.assertRaises(ConnectionTimeout):
+            cluster['test'].search_query().get_result()
+
+        self.assertEqual(logger.log.call_count, 1)
+        slow_query = logger.log.call_args[1]['extra']['slow_query']
+        self.assertEqual(slow_query['method'], 'search')
+        self.assertIs(slow_query['error'], error)
+        self.assertIsNone(slow_query['took'])
+
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0, slow_query_log=True
+        )
+        self.assertEqual(cluster._slow_query_log.threshold, 1000)
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0, slow_query_log=False
+        )
+        self.assertIsNone(cluster._slow_query_log)
+
+    def test_slow_query_log_sampling(self):
+        logger = Mock()
+        logger.isEnabledFor.return_value = True
+        slow_query_log = SlowQueryLog(
+            threshold=0, sample_rate=0.0, logger=logger
+        )
+        self.client.count = Mock(return_value={'count': 1, 'took': 1})
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0, slow_query_log=slow_query_log
+        )
+        cluster.search_query().count()
+        self.assertEqual(logger.log.call_count, 0)
+
+    def test_document_cache(self):
+        def mget(body, **kwargs):
+            return {
+                'docs': [
+                    {
+                        '_index': kwargs['index'], '_id': str(doc['_id']),
+                        '_version': 1, 'found': doc['_id'] != 4,
+                        '_source': {'n': doc['_id']},
+                    }
+                    for doc in body['docs']
+                ]
+            }
+
+        self.client.mget = Mock(side_effect=mget)
+        self.client.get = Mock(
+            return_value={
+                '_index': 'test', '_id': '1', '_version': 2, 'found': True,
+                '_source': {'n': 1},
+            }
+        )
+        self.client.bulk = Mock(
+            return_value={'took': 1, 'errors': False, 'items': []}
+        )
+        self.client.delete = Mock(
+            return_value={
+                '_index': 'test', '_id': '3', '_version': 2,
+                'result': 'deleted',
+            }
+        )
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0,
+            document_cache=DocumentCache(max_size=100),
+        )
+        index = cluster['test']
+
+        docs = index.multi_get([1, 2, 4])
+        self.assertEqual([doc and doc.n for doc in docs], [1, 2, None])
+        docs = index.multi_get([3, 2, 1, 4])
+        self.assertEqual([doc and doc.n for doc in docs], [3, 2, 1, None])
+        self.client.mget.assert_called_with(
+            body={'docs': [{'_id': 3}, {'_id': 4}]}, index='test'
+        )
+        docs = index.multi_get([2, 1])
+        self.assertEqual([doc.n for doc in docs], [2, 1])
+        self.assertEqual(self.client.mget.call_count, 2)
+
+        doc = index.get(1)
+        self.assertEqual(doc.n, 1)
+        self.assertEqual(self.client.get.call_count, 0)
+        doc = index.get(1, version=2)
+        self.assertEqual(doc._version, 2)
+        self.assertEqual(self.client.get.call_count, 1)
+        index.get(1, realtime=False)
+        self.assertEqual(self.client.get.call_count, 2)
+
+        index.add([DynamicDocument(_id=2, n=22)])
+        index.delete(3)
+        index.multi_get([1, 2, 3])
+        self.client.mget.assert_called_with(
+            body={'docs': [{'_id': 2}, {'_id': 3}]}, index='test'
+        )
+        index.get(1, version=2)
+        self.assertEqual(self.client.get.call_count, 2)
+
+        cluster['other'].multi_get([1])
+        self.client.mget.assert_called_with(
+            body={'docs': [{'_id': 1}]}, index='other'
+        )
+
+    def test_document_cache_routing_and_concurrent_writes(self):
+        def get(id, **kwargs):
+            raw_doc = {
+                '_index': kwargs['index'], '_id': str(id), '_version': 1,
+                'found': True, '_source': {'n': id},
+            }
+            if kwargs.get('routing') is not None:
+                raw_doc['_routing'] = kwargs['routing']
+            return raw_doc
+
+        self.client.get = Mock(side_effect=get)
+        self.client.delete = Mock(
+            return_value={
+                '_index': 'test', '_id': '5', '_version': 2,
+                'result': 'deleted',
+            }
+        )
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0,
+            document_cache=DocumentCache(max_size=100),
+        )
+        index = cluster['test']
+
+        index.get(5, routing='u1')
+        index.get(5, routing='u1')
+        self.assertEqual(self.client.get.call_count, 1)
+        # the document can be located in another shard without routing
+        index.get(5)
+        self.assertEqual(self.client.get.call_count, 2)
+        index.get(5)
+        self.assertEqual(self.client.get.call_count, 2)
+        index.get(5, routing='u1')
+        self.assertEqual(self.client.get.call_count, 3)
+
+        # deleting without routing invalidates the document with routing
+        index.delete(5)
+        index.get(5, routing='u1')
+        self.assertEqual(self.client.get.call_count, 4)
+
+        def get_during_write(id, **kwargs):
+            # the document is overwritten while the request is in flight
+            index.delete(id)
+            return get(id, **kwargs)
+
+        self.client.get = Mock(side_effect=get_during_write)
+        index.get(6)
+        self.client.get = Mock(side_effect=get)
+        index.get(6)
+        self.assertEqual(self.client.get.call_count, 1)
+        index.get(6)
+        self.assertEqual(self.client.get.call_count, 1)
+
+
+    def test_document_cache_stats_and_copies(self):
+        self.client.get = Mock(
+            return_value={
+                '_index': 'test', '_id': '1', '_version': 1, 'found': True,
+                '_source': {'tags': ['red']},
+            }
+        )
+        document_cache = DocumentCache(max_size=100)
+        cluster = Cluster(
+            self.client, compiler=Compiler_7_0,
+            document_cache=document_cache,
+        )
+        index = cluster['test']
+
+        doc = index.get(1)
+        doc.tags.append('blue')
+        self.assertEqual(document_cache.stats.misses, 1)
+        doc = index.get(1)
+        self.assertEqual(doc.tags, ['red'])
+        doc.tags.append('green')
+        self.assertEqual(index.get(1).tags, ['red'])
+        self.assertEqual(self.client.get.call_count, 1)
+        self.assertEqual(document_cache.stats.hits, 2)
+
+        # cached documents with another version are not hits
+        index.get(1, version=2)
+        self.assertEqual(self.client.get.call_count, 2)
+        self.assertEqual(document_cache.stats.hits, 2)
+        self.assertEqual(document_cache.stats.misses, 2)
+
+
+class AsyncClusterTest(IsolatedAsyncioTestCase):
+    async def test_iter_multi_get(self):
+        async def mget(body, **kwargs):
+            return {
+                'docs': [
+                    {'_id': str(doc['_id']), 'found': doc['_id'] != 2}
+                    for doc in body['docs']
+                ]
+            }
+
+        client = Mock(mget=AsyncMock(side_effect=mget))
+        index = AsyncCluster(client, compiler=Compiler_7_0)['test']
+        docs = [
+            doc async for doc in index.iter_multi_get(
+                range(1, 6), chunk_size=2, concurrency=2
+            )
+        ]
+        self.assertEqual(
+            [doc and doc._id for doc in docs], ['1', None, '3', '4', '5']
+        )
+        self.assertEqual(client.mget.call_count, 3)
+        self.assertEqual(
+            client.mget.call_args_list[2][1],
+            {'body': {'docs': [{'_id': 5}]}, 'index': 'test'}
+        )
+
+    async def test_document_cache(self):
+        async def mget(body, **kwargs):
+            return {
+                'docs': [
+                    {'_id': str(doc['_id']), 'found': True, '_source': {}}
+                    for doc in body['docs']
+                ]
+            }
+
+        client = Mock(
+            mget=AsyncMock(side_effect=mget),
+            get=AsyncMock(return_value={'_id': '1', 'found': True}),
+            delete=AsyncMock(
+                return_value={'_index': 'test', '_id': '1', '_version': 2}
+            ),
+        )
+        index = AsyncCluster(
+            client, compiler=Compiler_7_0, document_cache=DocumentCache()
+        )['test']
+        await index.multi_get([1, 2])
+        docs = await index.multi_get([2, 3, 1])
+        self.assertEqual([doc._id for doc in docs], ['2', '3', '1'])
+        self.assertEqual(
+            client.mget.call_args[1],
+            {'body': {'docs': [{'_id': 3}]}, 'index': 'test'}
+        )
+        self.assertEqual((await index.get(1))._id, '1')
+        self.assertEqual(client.get.call_count, 0)
+
+        await index.delete(1)
+        await index.get(1)
+        self.assertEqual(client.get.call_count, 1)
@@ -161,6 +161,45 @@ def test_simple_coded_decode_custom_type():
         }
 
 
+def test_simple_codec_decode_reuses_decoders():
+    codec = SimpleCodec()
+    types = {'company_id': Integer(), 'price': List(Float)}
+    params = {'company_id': ['1', '2', 'x'], 'price__gte': ['9.5']}
+    assert codec.decode(params, types) == {
+        'company_id': {'exact': [1, 2]},
+        'price': {'gte': [9.5]},
+    }
+    decoders = codec._compile_types(types)
+    assert codec._compile_types(types) is decoders
+    assert codec._compile_types(dict(types)) is decoders
+
+    # types changed in place are compiled again
+    types['price'] = Integer()
+    assert codec.decode({'price': ['9.5', '9']}, types) == {
+        'price': {'exact': [9]},
+    }
+    assert codec._compile_types(types) is not decoders
+    types['price'] = List(Float)
+    assert codec.decode(params, types) == codec.decode(params, dict(types))
+    assert codec.decode_value('3', Integer) == 3
+    assert codec._get_value_decoder(Integer) is \
+        codec._get_value_decoder(Integer)
+
+    class UpperCodec(SimpleCodec):
+        def decode_value(self, value, es_type=None):
+            value = super(UpperCodec, self).decode_value(value, es_type)
+            if isinstance(value, str):
+                return value.upper()
+            return value
+
+    assert UpperCodec().decode(
+        {'country': ['ru'], 'company_id': ['1']}, types
+    ) == {
+        'country': {'exact': ['RU']},
+        'company_id': {'exact': [1]},
+    }
+
+
 def test_simple_codec_encode():
     codec = SimpleCodec()
 
@@ -887,3 +887,46 @@ def test_document_instance__to_source_with_validation(compiler):
     with pytest.raises(ValidationError):
         doc = ProductDocument(name=123, status=1 << 31)
         doc.to_source(compiler, validate=True)
+
+
+def test_document_projection():
+    Projection = ProductDocument.get_projection(
+        ProductDocument.name, ProductDocument.tags.group.name,
+        ProductDocument.i_attr_1,
+    )
+    assert issubclass(Projection, ProductDocument)
+    assert list(Projection.user_fields.keys()) == ['name', 'tags']
+    assert Projection._field_name_map['tags'].get_parent() is Projection
+    assert 'price' not in Projection._field_name_map
+    assert len(Projection.mapping_fields) == len(
+        ProductDocument.mapping_fields
+    )
+    assert Projection.get_doc_type() is None
+    assert Projection is ProductDocument.get_projection(
+        ProductDocument.tags, 'test_name'
+    )
+    assert Projection is Projection.get_projection(
+        ProductDocument.name, ProductDocument.tags
+    )
+    assert ProductDocument.get_projection(
+        *ProductDocument.user_fields
+    ) is ProductDocument
+
+    doc = Projection(
+        _hit={
+            '_id': '1',
+            '_source': {
+                'test_name': 'Test',
+                'tags': [{'group': {'test_name': 'Group'}}],
+            }
+        }
+    )
+    assert doc._id == '1'
+    assert doc.name == 'Test'
+    assert doc.tags[0].group.name == 'Group'
+    assert doc.price is None
+
+    with pytest.raises(ValueError):
+        ProductDocument.get_projection(InheritedDocument.description)
+    with pytest.raises(ValueError):
+        ProductDocument.get_projection(ProductDocument._id)
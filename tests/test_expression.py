@@ -1,7 +1,7 @@
-from elasticmagic import Document
+from elasticmagic import Cluster, Document, Index
 from elasticmagic import DynamicDocument
 from elasticmagic import (
-    Params, Term, Terms, Exists, Missing, Match, MatchPhrase,
+    Params, Term, Terms, TermsLookup, Exists, Missing, Match, MatchPhrase,
     MatchPhrasePrefix, MatchAll, MultiMatch, Range,
     Bool, Query, Sort, Field, Limit,
     Boosting, Common, ConstantScore, FunctionScore, DisMax, Ids, Prefix,
@@ -49,6 +49,12 @@ class ExpressionTestCase(BaseTestCase):
         self.assertEqual(e['foo'], 'bar')
         self.assertTrue('foo' in e)
 
+        e = Params(
+            Params({'foo': 'bar', 'from_': 1, 'size': 10}),
+            {'foo': None, 'to_': 2}, size=20
+        )
+        self.assertEqual(dict(e), {'from': 1, 'to': 2, 'size': 20})
+
         self.assert_expression(
             Match(f.message, 'this is a test'),
             {
@@ -112,6 +118,39 @@ class ExpressionTestCase(BaseTestCase):
                 }
             }
         )
+        self.assert_expression(
+            Terms(f.tags, ['blue', Field('color')]),
+            {
+                "terms": {"tags": ["blue", "color"]}
+            }
+        )
+        self.assert_expression(
+            f.user_id.in_lookup(
+                Index(Cluster(None), 'users'), '2', 'followers',
+                routing='u2', boost=2
+            ),
+            {
+                "terms": {
+                    "user_id": {
+                        "index": "users",
+                        "id": "2",
+                        "path": "followers",
+                        "routing": "u2",
+                    },
+                    "boost": 2
+                }
+            }
+        )
+        self.assert_expression(
+            TermsLookup(f.user_id, 'users', '2', Field('followers')),
+            {
+                "terms": {
+                    "user_id": {
+                        "index": "users", "id": "2", "path": "followers"
+                    }
+                }
+            }
+        )
 
         self.assert_expression(
             Exists(f.tags),
@@ -1,8 +1,14 @@
 import datetime
-from unittest.mock import Mock
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, Mock, patch
 
-from elasticmagic import agg, Document, Field, Match
+import pytest
+from elasticsearch import Elasticsearch
+
+from elasticmagic import agg, Cluster, Document, Field, Match, SearchQuery
+from elasticmagic.cache import LRUCache
 from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.ext.asyncio import AsyncCluster
 from elasticmagic.types import Integer, Float, List, Nested, String, Date
 from elasticmagic.ext.queryfilter import FacetFilter
 from elasticmagic.ext.queryfilter import FacetQueryFilter
@@ -2106,3 +2112,578 @@ def test_nested_range_filter_func(index, client):
     assert weight.enabled is None
     assert weight.min_value == 2.5
     assert weight.max_value == 38.0
+
+
+def test_apply_does_not_modify_search_query(index):
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        vendor = FacetFilter(index['car'].vendor)
+        is_new = SimpleQueryFilter(
+            SimpleQueryValue('true', index['car'].state == 'new'),
+        )
+        page = PageFilter()
+
+    qf = CarQueryFilter()
+    sq = index.search_query(index['car'].name.match('test'))
+    orig_expected = sq.to_dict(Compiler_7_0)
+
+    filtered_sq = qf.apply(sq, {'type': ['1'], 'is_new': ['true']})
+    assert type(filtered_sq) is type(sq)
+    assert sq.to_dict(Compiler_7_0) == orig_expected
+    assert filtered_sq.to_dict(Compiler_7_0)['post_filter'] == {
+        'term': {'type': 1}
+    }
+    assert set(filtered_sq.to_dict(Compiler_7_0)['aggregations']) == {
+        'qf.type', 'qf.vendor.filter'
+    }
+
+
+def test_apply_with_filter_replacing_search_query(index):
+    class ReplaceFilter(SimpleFilter):
+        def _apply_filter(self, search_query, params):
+            # search_query.with_stats does not pass through _with_clone
+            return search_query.with_stats(['catalog'])
+
+    class CarQueryFilter(QueryFilter):
+        stats = ReplaceFilter(index['car'].stats)
+        type = FacetFilter(index['car'].type, type=Integer)
+
+    qf = CarQueryFilter()
+    sq = qf.apply(index.search_query(), {'type': ['1']})
+    assert sq.to_dict(Compiler_7_0) == {
+        'post_filter': {'term': {'type': 1}},
+        'aggregations': {
+            'qf.type': {'terms': {'field': 'type'}},
+        },
+    }
+    assert sq._search_params == {'stats': ['catalog']}
+
+
+def test_apply_passes_search_query_to_filters(index):
+    received = []
+
+    class CheckedFacetFilter(FacetFilter):
+        def _apply_filter(self, search_query, params):
+            received.append(search_query)
+            return super(CheckedFacetFilter, self)._apply_filter(
+                search_query, params
+            )
+
+        def _apply_agg(self, search_query):
+            received.append(search_query)
+            return super(CheckedFacetFilter, self)._apply_agg(search_query)
+
+    class CarQueryFilter(QueryFilter):
+        type = CheckedFacetFilter(index['car'].type, type=Integer)
+        vendor = CheckedFacetFilter(index['car'].vendor)
+
+    qf = CarQueryFilter()
+    sq = qf.apply(index.search_query(), {'type': ['1'], 'vendor': ['Audi']})
+    assert len(received) == 4
+    assert all(isinstance(q, SearchQuery) for q in received)
+    assert sq.to_dict(Compiler_7_0)['post_filter'] == {
+        'bool': {'must': [
+            {'term': {'type': 1}},
+            {'term': {'vendor': 'Audi'}},
+        ]}
+    }
+    assert set(sq.to_dict(Compiler_7_0)['aggregations']) == {
+        'qf.type.filter', 'qf.vendor.filter'
+    }
+
+
+def test_apply_agg_sequential_contract(index):
+    seen_aggs = []
+
+    class RoutedFacetFilter(FacetFilter):
+        def _apply_agg(self, search_query):
+            seen_aggs.append(set(search_query._aggregations))
+            return super(RoutedFacetFilter, self)._apply_agg(
+                search_query.with_routing(123)
+            )
+
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        vendor = RoutedFacetFilter(index['car'].vendor)
+        model = FacetFilter(index['car'].model)
+
+    qf = CarQueryFilter()
+    sq = qf.apply(
+        index.search_query().aggs(total=agg.ValueCount(index['car'].id)),
+        {'type': ['1']}
+    )
+    # the overridden filter sees aggregations of the previous filters
+    assert seen_aggs == [{'total', 'qf.type'}]
+    assert sq._search_params == {'routing': 123}
+    assert set(qf._facet_aggs) == {
+        'qf.type', 'qf.vendor.filter', 'qf.model.filter'
+    }
+    assert set(sq.to_dict(Compiler_7_0)['aggregations']) == {
+        'total', 'qf.type', 'qf.vendor.filter', 'qf.model.filter'
+    }
+
+
+def test_apply_builds_post_filters_once(index):
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        vendor = FacetFilter(index['car'].vendor)
+        model = FacetFilter(index['car'].model)
+        price = RangeFilter(index['car'].price, compute_min_max=True)
+
+    qf = CarQueryFilter()
+    with patch.object(
+            SearchQuery, 'get_context', autospec=True,
+            side_effect=SearchQuery.get_context,
+    ) as get_context:
+        sq = qf.apply(
+            index.search_query(), {'type': ['1'], 'vendor': ['Audi']}
+        )
+    assert get_context.call_count == 1
+    assert sq.to_dict(Compiler_7_0)['post_filter'] == {
+        'bool': {'must': [
+            {'term': {'type': 1}},
+            {'term': {'vendor': 'Audi'}},
+        ]}
+    }
+
+
+def test_prepare(index, client):
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        is_new = FacetQueryFilter(
+            FacetQueryValue('true', index['car'].state == 'new'),
+            alias='new'
+        )
+        sort = OrderingFilter(
+            OrderingValue('-score', [index['car']._score]),
+            OrderingValue('price', [index['car'].price]),
+        )
+        page = PageFilter(per_page_values=[10, 25])
+
+    shared_qf = CarQueryFilter()
+
+    def apply(params):
+        qf = shared_qf.prepare()
+        return qf, qf.apply(index.search_query(), params)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        prepared = list(executor.map(apply, [
+            {'type': [str(i)], 'sort': ['price'], 'page': [str(i + 1)]}
+            for i in range(20)
+        ]))
+    for i, (qf, sq) in enumerate(prepared):
+        assert qf is not shared_qf
+        assert qf.type is not shared_qf.type
+        assert qf.type.qf is qf
+        assert qf.sort.selected_value.value == 'price'
+        assert qf.sort.selected_value.filter is qf.sort
+        assert qf.page.page == i + 1
+        assert sq.to_dict(Compiler_7_0)['post_filter'] == {
+            'term': {'type': i}
+        }
+    assert shared_qf.sort.selected_value is None
+    assert shared_qf.page.page is None
+    assert shared_qf._params == {}
+
+    client.search = Mock(
+        return_value={
+            'hits': {'hits': [], 'max_score': 1, 'total': 30},
+            'aggregations': {
+                'qf.type': {'buckets': [{'key': 1, 'doc_count': 30}]},
+                'qf.is_new.filter': {
+                    'doc_count': 30,
+                    'qf.is_new:true': {'doc_count': 12},
+                },
+            },
+        }
+    )
+    qf_1, sq_1 = apply({'type': ['1']})
+    qf_2, sq_2 = apply({'new': ['true']})
+    qf_1.process_result(sq_1.get_result())
+    assert qf_1.type.selected_values[0].value == 1
+    assert qf_1.is_new.get_value('true').count == 12
+    assert not qf_1.is_new.get_value('true').selected
+    assert qf_2.type.all_values == []
+    assert qf_2.is_new.get_value('true').count is None
+    assert shared_qf.type.all_values == []
+    assert shared_qf.is_new.get_value('true').count is None
+
+
+def test_prepared_copies_do_not_share_filter_state(index):
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        price = RangeFilter(index['car'].price, type=Integer)
+        is_new = FacetQueryFilter(
+            FacetQueryValue('true', index['car'].state == 'new'),
+            alias='new'
+        )
+        page = PageFilter(per_page_values=[10, 25])
+
+    shared_qf = CarQueryFilter()
+    qf_1 = shared_qf.prepare()
+    qf_2 = shared_qf.prepare()
+    for f_1, f_2 in zip(qf_1.filters, qf_2.filters):
+        assert f_1 is not f_2
+        assert f_1.qf is qf_1
+        assert f_2.qf is qf_2
+    assert qf_1.type.values is not qf_2.type.values
+    assert qf_1.is_new.get_value('true') is not \
+        qf_2.is_new.get_value('true')
+
+    qf_1.apply(
+        index.search_query(),
+        {
+            'type': ['1'], 'price__gte': ['100'], 'new': ['true'],
+            'page': ['2'],
+        }
+    )
+    qf_2.apply(index.search_query(), {'type': ['2']})
+    assert qf_1.price.from_value == 100
+    assert qf_2.price.from_value is None
+    assert qf_1.page.page == 2
+    assert qf_2.page.page == 1
+    assert qf_1._params['type'] == {'exact': [1]}
+    assert qf_2._params['type'] == {'exact': [2]}
+    assert shared_qf.price.from_value is None
+    assert shared_qf._params == {}
+
+
+def test_facet_cache(index, client):
+    now = [0]
+    facet_cache = LRUCache(ttl=60, timer=lambda: now[0])
+
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        is_new = FacetQueryFilter(
+            FacetQueryValue('true', index['car'].state == 'new'),
+            alias='new'
+        )
+        sort = OrderingFilter(
+            OrderingValue('-score', [index['car']._score]),
+            OrderingValue('price', [index['car'].price]),
+        )
+        page = PageFilter(per_page_values=[10, 25])
+
+    shared_qf = CarQueryFilter(facet_cache=facet_cache)
+    raw_aggs = {
+        'qf.type': {'buckets': [{'key': 1, 'doc_count': 30}]},
+        'qf.is_new.filter': {
+            'doc_count': 30,
+            'qf.is_new:true': {'doc_count': 12},
+        },
+        'qf.is_new:true': {'doc_count': 12},
+    }
+
+    def search(params, aggs=None):
+        client.search = Mock(
+            return_value={
+                'hits': {'hits': [], 'max_score': 1, 'total': 30},
+                'aggregations': aggs or {},
+            }
+        )
+        qf = shared_qf.prepare()
+        sq = qf.apply(
+            index.search_query(index['car'].vendor == 'Subaru').aggs(
+                vendors=agg.Terms(index['car'].vendor)
+            ),
+            params
+        )
+        qf.process_result(sq.get_result())
+        return qf, sq
+
+    qf, sq = search(
+        {'page': ['2']},
+        dict(raw_aggs, vendors={'buckets': [{'key': 'x', 'doc_count': 1}]})
+    )
+    assert set(sq.to_dict(Compiler_7_0)['aggregations']) == {
+        'vendors', 'qf.type', 'qf.is_new:true'
+    }
+    assert qf.type.all_values[0].count == 30
+    assert len(facet_cache) == 1
+
+    # ordering and pages do not change facets
+    qf, sq = search({'page': ['3'], 'sort': ['price']})
+    assert set(sq.to_dict(Compiler_7_0)['aggregations']) == {'vendors'}
+    assert qf.page.page == 3
+    assert qf.page.total == 30
+    assert qf.type.all_values[0].value == 1
+    assert qf.type.all_values[0].count == 30
+    assert qf.is_new.get_value('true').count == 12
+    assert facet_cache.stats.hits == 1
+
+    qf, sq = search({'type': ['1']}, raw_aggs)
+    assert 'qf.type' in sq.to_dict(Compiler_7_0)['aggregations']
+    assert qf.type.selected_values[0].value == 1
+    assert len(facet_cache) == 2
+
+    now[0] = 61
+    qf, sq = search({}, raw_aggs)
+    assert 'qf.type' in sq.to_dict(Compiler_7_0)['aggregations']
+
+    # clusters with the same hosts share cached facets
+    same_index = Cluster(client, compiler=Compiler_7_0)['test']
+    other_index = Cluster(
+        Elasticsearch(['other:9200']), compiler=Compiler_7_0
+    )['test']
+    for search_index, is_cached in [
+            (other_index, False), (same_index, True), (index, True)
+    ]:
+        qf = shared_qf.prepare()
+        qf.apply(
+            search_index.search_query(index['car'].vendor == 'Subaru').aggs(
+                vendors=agg.Terms(index['car'].vendor)
+            ),
+            {}
+        )
+        assert (qf._cached_facets is not None) is is_cached
+
+
+def test_facet_cache_key(index):
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+
+    class OtherCarQueryFilter(CarQueryFilter):
+        pass
+
+    def get_key(qf, search_index=index):
+        qf = qf.prepare()
+        qf.apply(search_index.search_query(), {})
+        return qf._facet_cache_key
+
+    facet_cache = LRUCache()
+    key = get_key(CarQueryFilter(facet_cache=facet_cache))
+    assert key is not None
+    assert get_key(CarQueryFilter(facet_cache=facet_cache)) == key
+    assert get_key(
+        CarQueryFilter(name='cars', facet_cache=facet_cache)
+    ) != key
+    assert get_key(OtherCarQueryFilter(facet_cache=facet_cache)) != key
+
+    # without hosts facets are cached only with a namespace
+    hostless_index = Cluster(
+        Mock(spec=['search']), compiler=Compiler_7_0
+    )['test']
+    assert get_key(
+        CarQueryFilter(facet_cache=facet_cache), hostless_index
+    ) is None
+    qf = CarQueryFilter(
+        facet_cache=facet_cache, facet_cache_namespace='catalog'
+    )
+    assert get_key(qf, hostless_index) == get_key(qf, index)
+    assert get_key(qf) != key
+
+
+@pytest.mark.asyncio
+async def test_facet_cache_async():
+    facet_cache = LRUCache()
+    f = Field('type')
+
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(f, type=Integer)
+
+    shared_qf = CarQueryFilter(facet_cache=facet_cache)
+    client = Mock(
+        info=AsyncMock(return_value={'version': {'number': '7.10.0'}}),
+        search=AsyncMock(
+            return_value={
+                'hits': {'hits': [], 'max_score': 1, 'total': 30},
+                'aggregations': {
+                    'qf.type': {'buckets': [{'key': 1, 'doc_count': 30}]}
+                },
+            }
+        ),
+    )
+    index = AsyncCluster(client, compiler=Compiler_7_0)['test']
+
+    async def search(sq):
+        qf = shared_qf.prepare()
+        sq = qf.apply(sq, {})
+        qf.process_result(await sq.get_result())
+        return qf, sq
+
+    qf, sq = await search(index.search_query(Field('vendor') == 'Subaru'))
+    assert 'qf.type' in (await sq.to_dict())['aggregations']
+    assert len(facet_cache) == 1
+
+    qf, sq = await search(index.search_query(Field('vendor') == 'Audi'))
+    assert 'qf.type' in (await sq.to_dict())['aggregations']
+    assert len(facet_cache) == 2
+
+    qf, sq = await search(index.search_query(Field('vendor') == 'Audi'))
+    assert 'aggregations' not in await sq.to_dict()
+    assert qf.type.all_values[0].count == 30
+    assert facet_cache.stats.hits == 1
+
+    # version of the cluster is unknown until the first request
+    autodetect_index = AsyncCluster(client)['test']
+    qf, sq = await search(autodetect_index.search_query())
+    assert qf._facet_cache_key is None
+    assert len(facet_cache) == 2
+    qf, sq = await search(autodetect_index.search_query())
+    assert qf._facet_cache_key is not None
+    assert len(facet_cache) == 3
+
+
+def test_split_queries(index, client):
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        vendor = FacetFilter(index['car'].vendor)
+        is_new = FacetQueryFilter(
+            FacetQueryValue('true', index['car'].state == 'new'),
+            alias='new'
+        )
+        page = PageFilter(per_page_values=[10, 25])
+
+    qf = CarQueryFilter()
+    sq = qf.apply(
+        index.search_query().aggs(max_price=agg.Max(index['car'].price)),
+        {'type': ['1'], 'page': ['2']}
+    )
+    queries = qf.split_queries(sq, aggs_per_query=2)
+    assert len(queries) == 3
+    hits_body = queries[0].to_dict(Compiler_7_0)
+    assert hits_body['post_filter'] == {'term': {'type': 1}}
+    assert hits_body['size'] == 10
+    assert hits_body['from'] == 10
+    assert set(hits_body['aggregations']) == {'max_price'}
+    facet_bodies = [q.to_dict(Compiler_7_0) for q in queries[1:]]
+    assert [set(body['aggregations']) for body in facet_bodies] == [
+        {'qf.type', 'qf.vendor.filter'},
+        {'qf.is_new.filter'},
+    ]
+    for body in facet_bodies:
+        assert body['size'] == 0
+        assert 'from' not in body
+
+    client.msearch = Mock(
+        return_value={
+            'responses': [
+                {
+                    'hits': {'hits': [], 'max_score': 1, 'total': 30},
+                    'aggregations': {'max_price': {'value': 10000}},
+                },
+                {
+                    'hits': {'hits': [], 'max_score': 0, 'total': 45},
+                    'aggregations': {
+                        'qf.type': {
+                            'buckets': [
+                                {'key': 1, 'doc_count': 30},
+                                {'key': 2, 'doc_count': 15},
+                            ]
+                        },
+                        'qf.vendor.filter': {
+                            'doc_count': 30,
+                            'qf.vendor': {
+                                'buckets': [{'key': 'Subaru', 'doc_count': 30}]
+                            }
+                        },
+                    },
+                },
+                {
+                    'error': {'type': 'timeout_exception'},
+                    'status': 504,
+                },
+            ]
+        }
+    )
+    results = index.get_cluster().multi_search(queries, raise_on_error=False)
+    qf_result = qf.process_result(results)
+    assert qf.page.total == 30
+    assert [fv.count for fv in qf.type.all_values] == [30, 15]
+    assert qf.type.selected_values[0].value == 1
+    assert qf.vendor.all_values[0].count == 30
+    assert qf.is_new.get_value('true').count is None
+    assert qf_result.type is not None
+
+
+def test_group_filter_aggs(index, client):
+    class CarQueryFilter(QueryFilter):
+        type = FacetFilter(index['car'].type, type=Integer)
+        vendor = FacetFilter(index['car'].vendor)
+        model = FacetFilter(index['car'].model, alias='m')
+        is_new = FacetQueryFilter(
+            FacetQueryValue('true', index['car'].state == 'new'),
+            alias='new'
+        )
+
+    qf = CarQueryFilter(group_filter_aggs=True)
+    sq = qf.apply(index.search_query(), {'type': ['1']})
+    assert sq.to_dict(Compiler_7_0)['aggregations'] == {
+        'qf.type': {'terms': {'field': 'type'}},
+        'qf.vendor.filter': {
+            'filter': {'term': {'type': 1}},
+            'aggregations': {
+                'qf.vendor': {'terms': {'field': 'vendor'}},
+                'qf.model': {'terms': {'field': 'model'}},
+                'qf.is_new:true': {'filter': {'term': {'state': 'new'}}},
+            }
+        }
+    }
+
+    client.search = Mock(
+        return_value={
+            'hits': {'hits': [], 'max_score': 1, 'total': 30},
+            'aggregations': {
+                'qf.type': {
+                    'buckets': [
+                        {'key': 1, 'doc_count': 30},
+                        {'key': 2, 'doc_count': 15},
+                    ]
+                },
+                'qf.vendor.filter': {
+                    'doc_count': 30,
+                    'qf.vendor': {
+                        'buckets': [{'key': 'Subaru', 'doc_count': 30}]
+                    },
+                    'qf.model': {
+                        'buckets': [{'key': 'Impreza', 'doc_count': 20}]
+                    },
+                    'qf.is_new:true': {'doc_count': 12},
+                },
+            },
+        }
+    )
+    qf.process_result(sq.get_result())
+    assert [fv.count for fv in qf.type.all_values] == [30, 15]
+    assert qf.vendor.get_value('Subaru').count == 30
+    assert qf.model.get_value('Impreza').count == 20
+    assert qf.is_new.get_value('true').count == 12
+
+    qf = CarQueryFilter(group_filter_aggs=True)
+    sq = qf.apply(index.search_query(), {})
+    assert set(sq.to_dict(Compiler_7_0)['aggregations']) == {
+        'qf.type', 'qf.vendor', 'qf.model', 'qf.is_new:true'
+    }
+
+
+def test_group_equal_filter_aggs(index):
+    class CarQueryFilter(QueryFilter):
+        vendor = FacetFilter(
+            index['car'].vendor, filters=[index['car'].state == 'new']
+        )
+        model = FacetFilter(
+            index['car'].model, filters=[index['car'].state == 'new']
+        )
+        type = FacetFilter(
+            index['car'].type, type=Integer,
+            filters=[index['car'].state == 'used'],
+        )
+
+    qf = CarQueryFilter(group_filter_aggs=True)
+    sq = qf.apply(index.search_query(), {})
+    assert sq.to_dict(Compiler_7_0)['aggregations'] == {
+        'qf.vendor.filter': {
+            'filter': {'term': {'state': 'new'}},
+            'aggregations': {
+                'qf.vendor': {'terms': {'field': 'vendor'}},
+                'qf.model': {'terms': {'field': 'model'}},
+            }
+        },
+        'qf.type.filter': {
+            'filter': {'term': {'state': 'used'}},
+            'aggregations': {
+                'qf.type': {'terms': {'field': 'type'}},
+            }
+        },
+    }
+    assert qf._facet_agg_aliases == {'qf.model.filter': 'qf.vendor.filter'}
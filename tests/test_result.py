@@ -1,5 +1,9 @@
-from elasticmagic import agg, types
-from elasticmagic.result import SearchResult
+from unittest.mock import Mock
+
+import pytest
+
+from elasticmagic import agg, types, Document, Field
+from elasticmagic.result import SearchResult, merge_raw_search_results
 
 
 def test_search_result_with_error_and_aggregations():
@@ -9,3 +13,299 @@ def test_search_result_with_error_and_aggregations():
         aggregations={'types': agg.Terms(field='type', type=types.Integer)}
     )
     assert res.aggregations['types'].buckets == []
+
+
+def test_search_result_profile():
+    raw_result = {
+        'hits': {'total': 0, 'max_score': None, 'hits': []},
+        'profile': {
+            'shards': [
+                {
+                    'id': '[2aE02wS1R8q_QFnYu6vDVQ][test][0]',
+                    'searches': [
+                        {
+                            'query': [
+                                {
+                                    'type': 'BooleanQuery',
+                                    'description': 'name:foo status:0',
+                                    'time_in_nanos': 1000,
+                                    'breakdown': {'score': 10},
+                                    'children': [
+                                        {
+                                            'type': 'TermQuery',
+                                            'description': 'name:foo',
+                                            'time_in_nanos': 300,
+                                        },
+                                        {
+                                            'type': 'TermQuery',
+                                            'description': 'status:0',
+                                            'time_in_nanos': 500,
+                                        },
+                                    ]
+                                }
+                            ],
+                            'rewrite_time': 50,
+                            'collector': [
+                                {
+                                    'name': 'SimpleTopScoreDocCollector',
+                                    'reason': 'search_top_hits',
+                                    'time_in_nanos': 200,
+                                }
+                            ]
+                        }
+                    ],
+                    'aggregations': [
+                        {
+                            'type': 'LongTermsAggregator',
+                            'description': 'types',
+                            'time_in_nanos': 700,
+                        }
+                    ]
+                }
+            ]
+        }
+    }
+    res = SearchResult(raw_result)
+    profile = res.profile
+    assert len(profile.shards) == 1
+    shard = profile.shards[0]
+    assert shard.node_id == '2aE02wS1R8q_QFnYu6vDVQ'
+    assert shard.index == 'test'
+    assert shard.shard_id == 0
+    assert shard.rewrite_time == 50
+    assert profile.query_time_in_nanos == 1000
+    assert profile.collector_time_in_nanos == 200
+    assert profile.aggregation_time_in_nanos == 700
+
+    slowest = profile.slowest_query
+    assert slowest.description == 'status:0'
+    assert slowest.self_time_in_nanos == 500
+    assert [q.description for q in profile.get_slowest_queries(2)] == [
+        'status:0', 'name:foo'
+    ]
+    assert shard.queries[0].self_time_in_nanos == 200
+    assert profile.get_slowest_aggregations(1)[0].type == \
+        'LongTermsAggregator'
+    assert profile.summary()['query_time_in_nanos'] == 1000
+
+    assert SearchResult({'hits': {'hits': []}}).profile is None
+
+
+def test_search_result_resolve_instances():
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        category = Field(types.Integer)
+
+    def hit(id):
+        return {'_id': id, '_type': 'product', '_index': 'test'}
+
+    product_mapper = Mock(
+        side_effect=lambda ids: {id: 'product:{}'.format(id) for id in ids}
+    )
+    category_mapper = Mock(
+        side_effect=lambda ids: {id: 'category:{}'.format(id) for id in ids}
+    )
+    res = SearchResult(
+        {
+            'hits': {'total': 2, 'hits': [hit('1'), hit('2')]},
+            'aggregations': {
+                'categories': {
+                    'buckets': [
+                        {
+                            'key': 10,
+                            'doc_count': 2,
+                            'top': {'hits': {'hits': [hit('2'), hit('3')]}},
+                        },
+                        {
+                            'key': 20,
+                            'doc_count': 1,
+                            'top': {'hits': {'hits': [hit('4')]}},
+                        },
+                    ]
+                },
+            },
+        },
+        aggregations={
+            'categories': agg.Terms(
+                ProductDocument.category,
+                instance_mapper=category_mapper,
+                aggs={'top': agg.TopHits(instance_mapper=product_mapper)},
+            ),
+        },
+        doc_cls_map={'product': ProductDocument},
+        instance_mapper=product_mapper,
+    )
+
+    categories = res.get_aggregation('categories')
+    top_hit = categories.get_bucket(20).get_aggregation('top').hits[0]
+    assert top_hit.instance == 'product:4'
+    assert product_mapper.call_count == 1
+    assert sorted(product_mapper.call_args[0][0]) == ['1', '2', '3', '4']
+    assert category_mapper.call_count == 1
+    category_mapper.assert_called_with([10, 20])
+
+    assert [doc.instance for doc in res.hits] == ['product:1', 'product:2']
+    assert categories.get_bucket(10).instance == 'category:10'
+    res.resolve_instances()
+    assert product_mapper.call_count == 1
+    assert category_mapper.call_count == 1
+
+
+def test_search_result_without_instance_mapper():
+    res = SearchResult(
+        {'hits': {'total': 1, 'hits': [{'_id': '1', '_type': 'product'}]}}
+    )
+    assert res.hits[0].instance is None
+
+
+@pytest.mark.asyncio
+async def test_search_result_load_instances():
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        category = Field(types.Integer)
+
+    async def product_mapper(ids):
+        return {id: 'product:{}'.format(id) for id in ids}
+
+    category_mapper = Mock(
+        side_effect=lambda ids: {id: 'category:{}'.format(id) for id in ids}
+    )
+    raw_result = {
+        'hits': {
+            'total': 2,
+            'hits': [
+                {'_id': '1', '_type': 'product'},
+                {'_id': '2', '_type': 'product'},
+            ]
+        },
+        'aggregations': {
+            'categories': {
+                'buckets': [{'key': 10, 'doc_count': 2}]
+            }
+        }
+    }
+    aggs = {
+        'categories': agg.Terms(
+            ProductDocument.category, instance_mapper=category_mapper
+        )
+    }
+
+    res = SearchResult(
+        raw_result, aggregations=aggs,
+        doc_cls_map={'product': ProductDocument},
+        instance_mapper=product_mapper,
+    )
+    with pytest.raises(TypeError):
+        res.hits[0].instance
+
+    res = SearchResult(
+        raw_result, aggregations=aggs,
+        doc_cls_map={'product': ProductDocument},
+        instance_mapper=product_mapper,
+    )
+    await res.load_instances()
+    assert [doc.instance for doc in res.hits] == ['product:1', 'product:2']
+    assert res.get_aggregation('categories').buckets[0].instance == \
+        'category:10'
+
+
+def test_merge_raw_search_results():
+    def hit(id, score, *sort):
+        raw_hit = {'_id': id, '_type': 'product', '_score': score}
+        if sort:
+            raw_hit['sort'] = list(sort)
+        return raw_hit
+
+    raw_results = [
+        {
+            'took': 5,
+            'timed_out': False,
+            '_shards': {'total': 2, 'successful': 2, 'failed': 0},
+            'hits': {
+                'total': {'value': 10, 'relation': 'eq'},
+                'max_score': 3.0,
+                'hits': [
+                    hit('1', 3.0, 10, 'a'),
+                    hit('2', 2.0, 10, 'c'),
+                    hit('3', 1.0, None, 'a'),
+                ],
+            },
+            'aggregations': {
+                'prices': {'value': 12.5},
+                'min_price': {'value': None},
+                'types': {
+                    'doc_count_error_upper_bound': 0,
+                    'sum_other_doc_count': 0,
+                    'buckets': [
+                        {'key': 1, 'doc_count': 6, 'p': {'value': 7}},
+                        {'key': 2, 'doc_count': 4, 'p': {'value': 1}},
+                    ],
+                },
+            },
+        },
+        {
+            'took': 8,
+            'timed_out': True,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {
+                'total': {'value': 1000, 'relation': 'gte'},
+                'max_score': 4.0,
+                'hits': [
+                    hit('4', 4.0, 12, 'z'),
+                    hit('5', 0.5, 10, 'b'),
+                ],
+            },
+            'aggregations': {
+                'prices': {'value': 0.5},
+                'min_price': {'value': 3.0},
+                'types': {
+                    'doc_count_error_upper_bound': 1,
+                    'sum_other_doc_count': 5,
+                    'buckets': [
+                        {'key': 3, 'doc_count': 7, 'p': {'value': 2}},
+                        {'key': 2, 'doc_count': 3, 'p': {'value': 3}},
+                    ],
+                },
+            },
+        },
+    ]
+    aggs = {
+        'prices': agg.Sum(Field('price')),
+        'min_price': agg.Min(Field('price')),
+        'types': agg.Terms(
+            Field('type'), size=2, aggs={'p': agg.Max(Field('price'))}
+        ),
+    }
+    merged = merge_raw_search_results(
+        raw_results, aggregations=aggs,
+        sort=[{'rank': 'desc'}, 'name'], offset=1, limit=3,
+    )
+    assert merged['took'] == 8
+    assert merged['timed_out'] is True
+    assert merged['_shards'] == {'total': 3, 'successful': 3, 'failed': 0}
+    assert merged['hits']['total'] == {'value': 1010, 'relation': 'gte'}
+    assert merged['hits']['max_score'] == 4.0
+    assert [h['_id'] for h in merged['hits']['hits']] == ['1', '5', '2']
+    assert merged['aggregations']['prices'] == {'value': 13.0}
+    assert merged['aggregations']['min_price'] == {'value': 3.0}
+    assert merged['aggregations']['types'] == {
+        'doc_count_error_upper_bound': 1,
+        'sum_other_doc_count': 11,
+        'buckets': [
+            {'key': 2, 'doc_count': 7, 'p': {'value': 3}},
+            {'key': 3, 'doc_count': 7, 'p': {'value': 2}},
+        ],
+    }
+
+    merged = merge_raw_search_results(raw_results)
+    assert [h['_id'] for h in merged['hits']['hits']] == [
+        '4', '1', '2', '3', '5'
+    ]
+    assert 'aggregations' not in merged
+
+    with pytest.raises(ValueError):
+        merge_raw_search_results(
+            raw_results, aggregations={'avg': agg.Avg(Field('price'))}
+        )
@@ -1,17 +1,21 @@
 import datetime
 import warnings
-from unittest.mock import Mock
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+import dateutil
 
 from elasticmagic import (
-    Document, DynamicDocument,
+    Cluster, Document, DynamicDocument, Index,
     SearchQuery, Params, Term, MultiMatch,
     FunctionScore, Sort, QueryRescorer, agg
 )
-from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.compiler import Compiler_6_0, Compiler_7_0
+from elasticmagic.ext.asyncio import AsyncCluster
 from elasticmagic.search import FunctionScoreSettings
 from elasticmagic.function import FieldValueFactor, Weight
 from elasticmagic.util import collect_doc_classes
-from elasticmagic.types import String, Integer, Float, Object
+from elasticmagic.types import String, Integer, Float, Object, Date, List
 from elasticmagic.expression import Field, Script, SortScript
 
 from .base import BaseTestCase, OrderTolerantString
@@ -1623,3 +1627,691 @@ class SearchQueryTest(BaseTestCase):
             {},
             compiler=Compiler_7_0,
         )
+
+    def test_profile(self):
+        sq = SearchQuery().with_profile()
+        self.assert_expression(
+            sq,
+            {
+                "profile": True,
+            },
+            compiler=Compiler_7_0,
+        )
+        self.assert_expression(
+            sq.with_profile(False),
+            {},
+            compiler=Compiler_7_0,
+        )
+
+    def test_iter_composite(self):
+        f = self.index['product']
+
+        def page(after_key, *keys):
+            raw_agg = {
+                'buckets': [
+                    {'key': {'tag': k}, 'doc_count': 1} for k in keys
+                ]
+            }
+            if after_key:
+                raw_agg['after_key'] = {'tag': after_key}
+            return {
+                'hits': {'hits': [], 'max_score': 0, 'total': 3},
+                'aggregations': {'tags': raw_agg},
+            }
+
+        self.client.search = Mock(
+            side_effect=[page('b', 'a', 'b'), page('c', 'c'), page(None)]
+        )
+        sq = (
+            self.index.search_query(f.status == 0)
+            .aggs(
+                tags=agg.Composite([{'tag': agg.Terms(f.tag)}], size=2),
+                other=agg.Terms(f.other),
+            )
+            .limit(10)
+        )
+        buckets = list(sq.iter_composite('tags'))
+        self.assertEqual([b.key for b in buckets],
+                         [{'tag': 'a'}, {'tag': 'b'}, {'tag': 'c'}])
+        self.assertEqual(self.client.search.call_count, 3)
+        self.client.search.assert_called_with(
+            index='test',
+            body={
+                'query': {'term': {'status': 0}},
+                'size': 0,
+                'aggregations': {
+                    'tags': {
+                        'composite': {
+                            'sources': [{'tag': {'terms': {'field': 'tag'}}}],
+                            'size': 2,
+                            'after': {'tag': 'c'},
+                        }
+                    }
+                }
+            }
+        )
+
+        with self.assertRaises(ValueError):
+            list(sq.iter_composite('other'))
+
+    def test_get_partitioned_aggregation(self):
+        f = self.index['product']
+
+        def response(*buckets):
+            return {
+                'hits': {'hits': [], 'max_score': 0, 'total': 10},
+                'aggregations': {
+                    'types': {
+                        'doc_count_error_upper_bound': 0,
+                        'sum_other_doc_count': 1,
+                        'buckets': [
+                            {'key': key, 'doc_count': doc_count}
+                            for key, doc_count in buckets
+                        ]
+                    }
+                }
+            }
+
+        self.client.msearch = Mock(
+            side_effect=[
+                {'responses': [response((1, 2)), response((2, 5))]},
+                {'responses': [response((3, 3))]},
+            ]
+        )
+        type_mapper = Mock(
+            side_effect=lambda ids: {id: 'type-{}'.format(id) for id in ids}
+        )
+        sq = (
+            self.index.search_query()
+            .aggs(
+                types=agg.Terms(
+                    f.type, type=Integer, size=100,
+                    instance_mapper=type_mapper
+                ),
+                other=agg.Terms(f.other),
+            )
+            .limit(10)
+        )
+        types = sq.get_partitioned_aggregation(
+            'types', 3, partitions_per_request=2
+        )
+        self.assertEqual(
+            [(b.key, b.doc_count) for b in types.buckets],
+            [(2, 5), (3, 3), (1, 2)]
+        )
+        self.assertEqual(types.get_bucket(3).instance, 'type-3')
+        self.assertEqual(types.get_bucket(1).instance, 'type-1')
+        type_mapper.assert_called_once_with([2, 3, 1])
+        self.assertEqual(self.client.msearch.call_count, 2)
+        self.assertEqual(
+            self.client.msearch.call_args_list[1][1]['body'],
+            [
+                {'index': 'test'},
+                {
+                    'size': 0,
+                    'aggregations': {
+                        'types': {
+                            'terms': {
+                                'field': 'type',
+                                'size': 100,
+                                'include': {
+                                    'partition': 2,
+                                    'num_partitions': 3,
+                                },
+                            }
+                        }
+                    }
+                }
+            ]
+        )
+
+        with self.assertRaises(ValueError):
+            sq.get_partitioned_aggregation('other1', 2)
+
+        self.client.msearch = Mock(
+            return_value={'responses': [
+                {
+                    'hits': {'hits': [], 'max_score': 0, 'total': 10},
+                    'aggregations': {'types': {'buckets': [
+                        {'key': key, 'doc_count': 1, 'n': {'value': n}}
+                        for key, n in buckets
+                    ]}},
+                }
+                for buckets in [[(1, 4), (2, 1)], [(3, 2)]]
+            ]}
+        )
+        sq = self.index.search_query().aggs(
+            types=agg.Terms(
+                f.type, type=Integer, order={'n': 'desc'},
+                aggs={'n': agg.Cardinality(f.name)},
+            )
+        )
+        types = sq.get_partitioned_aggregation('types', 2)
+        self.assertEqual([b.key for b in types.buckets], [1, 3, 2])
+        self.assertEqual(self.client.msearch.call_count, 1)
+
+        with self.assertRaises(ValueError):
+            sq.aggs(
+                types=agg.Terms(f.type, order={'n.avg': 'desc'})
+            ).get_partitioned_aggregation('types', 2)
+        with self.assertRaises(ValueError):
+            sq.aggs(
+                types=agg.Terms(f.type, include=['a', 'b'])
+            ).get_partitioned_aggregation('types', 2)
+        self.assertEqual(self.client.msearch.call_count, 1)
+
+    def test_fan_out(self):
+        f = self.index['product']
+        other_client = MagicMock()
+        other_index = Index(
+            Cluster(other_client, compiler=Compiler_6_0), 'other'
+        )
+
+        def response(hits, total, min_price):
+            return {
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': id, '_type': 'product', '_score': None,
+                            'sort': [rank],
+                        }
+                        for id, rank in hits
+                    ],
+                    'max_score': None,
+                    'total': total,
+                },
+                'aggregations': {
+                    'min_price': {'value': min_price},
+                    'active': {'doc_count': total - 1},
+                },
+            }
+
+        self.client.search = Mock(
+            return_value=response([('1', 9), ('2', 5), ('3', 1)], 7, 10.0)
+        )
+        other_client.search = Mock(
+            return_value=response([('4', 8), ('5', 7), ('6', 6)], 3, 5.0)
+        )
+        instance_mapper = Mock(
+            side_effect=lambda ids: {id: 'product-' + id for id in ids}
+        )
+        sq = (
+            self.index.search_query(f.name.match('phone'))
+            .order_by(f.rank.desc())
+            .aggs(
+                min_price=agg.Min(f.price),
+                active=agg.Filter(f.is_active == True),  # noqa:E712
+            )
+            .with_instance_mapper(instance_mapper)
+            .instances()
+            .limit(2)
+            .offset(1)
+        )
+        result = sq.fan_out([self.index, other_index])
+        expected_body = {
+            'query': {'match': {'name': 'phone'}},
+            'sort': [{'rank': 'desc'}],
+            'aggregations': {
+                'min_price': {'min': {'field': 'price'}},
+                'active': {'filter': {'term': {'is_active': True}}},
+            },
+            'size': 3,
+        }
+        self.client.search.assert_called_once_with(
+            index='test', body=expected_body
+        )
+        other_client.search.assert_called_once_with(
+            index='other', body=expected_body
+        )
+        self.assertEqual(result.total, 10)
+        self.assertEqual([doc._id for doc in result.hits], ['4', '5'])
+        self.assertEqual(
+            [doc.instance for doc in result.hits],
+            ['product-4', 'product-5']
+        )
+        instance_mapper.assert_called_once_with(['4', '5'])
+        self.assertEqual(result.get_aggregation('min_price').value, 5.0)
+        self.assertEqual(result.get_aggregation('active').doc_count, 8)
+
+        with self.assertRaises(ValueError):
+            sq.aggs(avg_price=agg.Avg(f.price)).fan_out(
+                [self.index, other_index]
+            )
+        self.assertEqual(self.client.search.call_count, 1)
+        self.assertEqual(other_client.search.call_count, 1)
+
+    def test_get_result_by_terms(self):
+        f = self.index['product']
+
+        def response(hits, total):
+            return {
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': id, '_type': 'product', '_score': None,
+                            'sort': [rank],
+                        }
+                        for id, rank in hits
+                    ],
+                    'max_score': None,
+                    'total': total,
+                },
+                'aggregations': {'min_price': {'value': total * 1.5}},
+            }
+
+        self.client.msearch = Mock(
+            side_effect=[
+                {'responses': [
+                    response([('1', 3), ('2', 2)], 2),
+                    response([('4', 5), ('3', 1)], 2),
+                ]},
+                {'responses': [response([('5', 4)], 1)]},
+            ]
+        )
+        sq = (
+            self.index.search_query()
+            .order_by(f.rank.desc())
+            .aggs(min_price=agg.Min(f.price))
+            .limit(2)
+        )
+        result = sq.get_result_by_terms(
+            f.id, iter(['1', '2', '3', '4', '5']), chunk_size=2,
+            chunks_per_request=2
+        )
+        self.assertEqual(self.client.msearch.call_count, 2)
+        self.assertEqual(
+            self.client.msearch.call_args_list[1][1]['body'],
+            [
+                {'index': 'test'},
+                {
+                    'query': {'bool': {'filter': {'terms': {'id': ['5']}}}},
+                    'sort': [{'rank': 'desc'}],
+                    'aggregations': {'min_price': {'min': {'field': 'price'}}},
+                    'size': 2,
+                },
+            ]
+        )
+        self.assertEqual(result.total, 5)
+        self.assertEqual([doc._id for doc in result.hits], ['4', '5'])
+        self.assertEqual(result.get_aggregation('min_price').value, 1.5)
+
+    def test_only(self):
+        class CategoryDocument(Document):
+            __doc_type__ = 'category'
+
+            name = Field(String)
+
+        class ProductDocument(Document):
+            __doc_type__ = 'product'
+
+            name = Field(String)
+            price = Field(Float)
+            description = Field(String)
+
+        def product_mapper(ids):
+            return {id: 'product-{}'.format(id) for id in ids}
+
+        sq = (
+            self.index.search_query()
+            .only(
+                ProductDocument.name, ProductDocument.price, CategoryDocument
+            )
+            .with_instance_mapper({ProductDocument: product_mapper})
+        )
+        self.assert_expression(
+            sq,
+            {
+                '_source': ['name', 'price', 'name']
+            }
+        )
+        ProductProjection, category_cls = sq.get_context().doc_classes
+        self.assertIs(
+            ProductProjection,
+            ProductDocument.get_projection(
+                ProductDocument.name, ProductDocument.price
+            )
+        )
+        self.assertIs(category_cls, CategoryDocument)
+
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': '1', '_type': 'product', '_index': 'test',
+                            '_source': {'name': 'Phone', 'price': 9.99},
+                        },
+                        {
+                            '_id': '2', '_type': 'category', '_index': 'test',
+                            '_source': {'name': 'Phones'},
+                        },
+                    ],
+                    'max_score': 1,
+                    'total': 2,
+                },
+            }
+        )
+        product, category = sq.get_result().hits
+        self.assertIsInstance(product, ProductProjection)
+        self.assertEqual(product.name, 'Phone')
+        self.assertEqual(product.price, 9.99)
+        self.assertIsNone(product.description)
+        self.assertEqual(product.instance, 'product-1')
+        self.assertIsInstance(category, CategoryDocument)
+        self.assertIsNone(category.instance)
+
+        self.assertEqual(
+            ProductProjection.__name__, 'ProductDocumentProjection_name_price'
+        )
+
+        sq = sq.only(None)
+        self.assert_expression(sq, {})
+        self.assertEqual(sq.get_context().doc_classes, ())
+
+        sq = (
+            self.index.search_query()
+            .with_document(CategoryDocument)
+            .source(CategoryDocument.name)
+            .docvalue_fields(ProductDocument.price)
+        )
+        expected = {'_source': ['name'], 'docvalue_fields': ['price']}
+        for projected_sq in [
+                sq.only(ProductDocument.name),
+                sq.only(ProductDocument.name, docvalues=True),
+                sq.only(ProductDocument.name).only(ProductDocument.price),
+        ]:
+            self.assert_expression(projected_sq.only(None), expected)
+            self.assertEqual(
+                projected_sq.only(None).get_context().doc_classes,
+                (CategoryDocument,)
+            )
+        # changes made after the projection are kept
+        sq = (
+            sq.only(ProductDocument.name)
+            .source(ProductDocument.description)
+            .only(None)
+        )
+        self.assert_expression(
+            sq, {'_source': ['description'], 'docvalue_fields': ['price']}
+        )
+        self.assertEqual(sq.get_context().doc_classes, (CategoryDocument,))
+
+        with self.assertRaises(TypeError):
+            self.index.search_query().only('name')
+
+    def test_only_docvalues(self):
+        class ProductDocument(Document):
+            __doc_type__ = 'product'
+
+            name = Field(String, fields={'raw': Field(String)})
+            status = Field(Integer)
+            tags = Field(List(Integer))
+            created_at = Field(Date)
+            description = Field(String)
+
+        sq = self.index.search_query().only(
+            ProductDocument.name.raw, ProductDocument.status,
+            ProductDocument.tags, ProductDocument.created_at,
+            docvalues=True,
+        )
+        self.assert_expression(
+            sq,
+            {
+                '_source': False,
+                'docvalue_fields': ['name.raw', 'status', 'tags', 'created_at']
+            }
+        )
+        doc_cls = sq.get_context().doc_classes[0]
+        self.assertIs(
+            doc_cls,
+            ProductDocument.get_projection(
+                ProductDocument.name, ProductDocument.status,
+                ProductDocument.tags, ProductDocument.created_at,
+                docvalues=True
+            )
+        )
+
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': '1', '_type': 'product', '_index': 'test',
+                            'fields': {
+                                'name.raw': ['Phone'],
+                                'status': ['0'],
+                                'tags': ['1', '2'],
+                                'created_at': ['2019-02-03T04:05:06.000Z'],
+                            },
+                        },
+                        {
+                            '_id': '2', '_type': 'product', '_index': 'test',
+                            'fields': {'status': [1]},
+                        },
+                    ],
+                    'max_score': 1,
+                    'total': 2,
+                },
+            }
+        )
+        doc1, doc2 = sq.get_result().hits
+        self.assertIsInstance(doc1, doc_cls)
+        self.assertEqual(doc1._id, '1')
+        self.assertIsNone(doc1.name)
+        self.assertEqual(doc1.status, 0)
+        self.assertEqual(doc1.tags, [1, 2])
+        self.assertEqual(
+            doc1.created_at,
+            datetime.datetime(2019, 2, 3, 4, 5, 6, tzinfo=dateutil.tz.tzutc())
+        )
+        self.assertIsNone(doc1.description)
+        self.assertEqual(doc1.get_fields()['name.raw'], ['Phone'])
+        self.assertEqual(doc1.get_fields()['status'], [0])
+        self.assertEqual(doc2.status, 1)
+        self.assertIsNone(doc2.tags)
+
+        sq = sq.only(None)
+        self.assert_expression(sq, {})
+
+        sq = self.index.search_query().only(ProductDocument, docvalues=True)
+        self.assertEqual(
+            list(sq.get_context().doc_classes[0].user_fields.keys()),
+            ['name', 'status', 'tags', 'created_at', 'description']
+        )
+
+        sq = (
+            self.index.search_query()
+            .docvalue_fields('status', {'field': 'created_at'})
+            .only(
+                ProductDocument.status, ProductDocument.tags,
+                ProductDocument.created_at,
+                docvalues=True,
+            )
+        )
+        self.assert_expression(
+            sq,
+            {
+                '_source': False,
+                'docvalue_fields': ['status', {'field': 'created_at'}, 'tags']
+            }
+        )
+        self.assert_expression(
+            sq.only(None),
+            {'docvalue_fields': ['status', {'field': 'created_at'}]}
+        )
+
+        class SellerDocument(Document):
+            rating = Field(Float)
+
+        class OfferDocument(Document):
+            __doc_type__ = 'offer'
+
+            price = Field(Float)
+            seller = Field(Object(SellerDocument))
+
+        with self.assertRaises(ValueError):
+            self.index.search_query().only(
+                OfferDocument.seller.rating, docvalues=True
+            )
+        with self.assertRaises(ValueError):
+            self.index.search_query().only(OfferDocument, docvalues=True)
+        self.assert_expression(
+            self.index.search_query().only(OfferDocument.seller.rating),
+            {'_source': ['seller.rating']}
+        )
+
+
+class AsyncSearchQueryTest(IsolatedAsyncioTestCase):
+    async def test_instances_with_async_instance_mapper(self):
+        class ProductDocument(Document):
+            __doc_type__ = 'product'
+
+        async def product_mapper(ids):
+            return {id: 'product:{}'.format(id) for id in ids}
+
+        client = Mock(
+            search=AsyncMock(
+                return_value={
+                    'hits': {
+                        'total': 2,
+                        'hits': [
+                            {'_id': '1', '_type': 'product'},
+                            {'_id': '2', '_type': 'product'},
+                        ]
+                    },
+                }
+            )
+        )
+        cluster = AsyncCluster(client, compiler=Compiler_7_0)
+        sq = (
+            cluster.search_query(doc_cls=ProductDocument)
+            .with_instance_mapper(product_mapper)
+            .instances()
+        )
+        self.assertEqual(list(await sq), ['product:1', 'product:2'])
+
+    async def test_iter_composite(self):
+        pages = [
+            {
+                'hits': {'hits': [], 'total': 2},
+                'aggregations': {'tags': {
+                    'after_key': {'tag': 'b'},
+                    'buckets': [
+                        {'key': {'tag': 'a'}, 'doc_count': 1},
+                        {'key': {'tag': 'b'}, 'doc_count': 1},
+                    ],
+                }},
+            },
+            {
+                'hits': {'hits': [], 'total': 2},
+                'aggregations': {'tags': {'buckets': []}},
+            },
+        ]
+        client = Mock(search=AsyncMock(side_effect=pages))
+        cluster = AsyncCluster(client, compiler=Compiler_7_0)
+        sq = cluster.search_query().aggs(
+            tags=agg.Composite([{'tag': agg.Terms(Field('tag'))}])
+        )
+        keys = [
+            bucket.key['tag'] async for bucket in sq.iter_composite('tags')
+        ]
+        self.assertEqual(keys, ['a', 'b'])
+        self.assertEqual(client.search.call_count, 2)
+
+    async def test_fan_out(self):
+        def response(*ids):
+            return {
+                'hits': {
+                    'total': len(ids),
+                    'max_score': 1.0,
+                    'hits': [
+                        {'_id': id, '_type': 'product', '_score': score}
+                        for id, score in ids
+                    ],
+                },
+            }
+
+        client_1 = Mock(search=AsyncMock(
+            return_value=response(('1', 2.0), ('2', 0.5))
+        ))
+        client_2 = Mock(search=AsyncMock(return_value=response(('3', 1.0))))
+        cluster_1 = AsyncCluster(client_1, compiler=Compiler_7_0)
+        cluster_2 = AsyncCluster(client_2, compiler=Compiler_7_0)
+        sq = cluster_1.search_query(Field('name').match('phone')).limit(2)
+        result = await sq.fan_out([cluster_1['products'], cluster_2])
+        self.assertEqual(result.total, 3)
+        self.assertEqual([doc._id for doc in result], ['1', '3'])
+        client_1.search.assert_called_once_with(
+            index='products',
+            body={'query': {'match': {'name': 'phone'}}, 'size': 2},
+        )
+        client_2.search.assert_called_once_with(
+            body={'query': {'match': {'name': 'phone'}}, 'size': 2},
+        )
+
+        with self.assertRaises(ValueError):
+            await sq.aggs(n=agg.Cardinality(Field('name'))).fan_out(
+                [cluster_1, cluster_2]
+            )
+        self.assertEqual(client_1.search.call_count, 1)
+        self.assertEqual(client_2.search.call_count, 1)
+
+    async def test_get_partitioned_aggregation(self):
+        def response(*keys):
+            return {
+                'hits': {'hits': [], 'total': 2},
+                'aggregations': {'tags': {'buckets': [
+                    {'key': key, 'doc_count': 1} for key in keys
+                ]}},
+            }
+
+        client = Mock(search=AsyncMock(
+            side_effect=[response('a', 'b'), response('c')]
+        ))
+        cluster = AsyncCluster(client, compiler=Compiler_7_0)
+        sq = cluster.search_query().aggs(tags=agg.Terms(Field('tag')))
+        tags = await sq.get_partitioned_aggregation(
+            'tags', 2, concurrency=1
+        )
+        self.assertEqual([bucket.key for bucket in tags], ['a', 'b', 'c'])
+        self.assertEqual(client.search.call_count, 2)
+        self.assertEqual(
+            client.search.call_args_list[0][1]['body'],
+            {
+                'size': 0,
+                'aggregations': {
+                    'tags': {
+                        'terms': {
+                            'field': 'tag',
+                            'include': {'partition': 0, 'num_partitions': 2},
+                        }
+                    }
+                }
+            }
+        )
+
+    async def test_get_result_by_terms(self):
+        def response(*ids):
+            return {
+                'hits': {
+                    'hits': [{'_id': id, '_score': float(id)} for id in ids],
+                    'total': len(ids),
+                },
+            }
+
+        client = Mock(search=AsyncMock(
+            side_effect=[response('2', '1'), response('3')]
+        ))
+        cluster = AsyncCluster(client, compiler=Compiler_7_0)
+        result = await cluster.search_query().get_result_by_terms(
+            Field('_id'), ['1', '2', '3'], chunk_size=2, concurrency=1
+        )
+        self.assertEqual(result.total, 3)
+        self.assertEqual([doc._id for doc in result.hits], ['3', '2', '1'])
+        self.assertEqual(
+            client.search.call_args_list[1][1]['body'],
+            {
+                'query': {'bool': {'filter': {'terms': {'_id': ['3']}}}},
+                'size': 10,
+            }
+        )
@@ -1,6 +1,6 @@
 from .base import BaseTestCase
 
-from elasticmagic.util import merge_params
+from elasticmagic.util import iter_chunks, merge_params
 from elasticmagic.expression import Params
 
 
@@ -36,3 +36,9 @@ class UtilsTest(BaseTestCase):
                           lambda: merge_params(original, (), None))
         self.assertRaises(AssertionError,
                           lambda: merge_params(original, (), []))
+
+    def test_iter_chunks(self):
+        self.assertEqual(
+            list(iter_chunks(iter(range(5)), 2)), [[0, 1], [2, 3], [4]]
+        )
+        self.assertEqual(list(iter_chunks([], 2)), [])